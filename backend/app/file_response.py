@@ -0,0 +1,127 @@
+import os
+import re
+from email.utils import formatdate
+from typing import Dict, Iterator, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+"""
+ファイル配信レスポンスモジュール
+保存済みのPDF・ファイルをETagによる再検証（304）とRangeリクエスト（206）に対応して返し、
+大きなPDFを先頭ページから段階的に読み込めるようにする
+"""
+
+RANGE_CHUNK_SIZE = 64 * 1024
+# 同じ名前のファイルは再インポートで置き換わるため、キャッシュは毎回ETagで再検証させる
+CACHE_CONTROL = "no-cache"
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def build_file_response(
+    request: Request,
+    file_path: str,
+    media_type: str,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    ファイルを返すレスポンスを作成
+    If-None-MatchがETagと一致する場合は304、単一のRangeを指定された場合は206で該当範囲のみ返す
+
+    Args:
+        request: リクエスト
+        file_path: 返すファイルのパス
+        media_type: Content-Type
+        headers: 追加のレスポンスヘッダー（Content-Dispositionなど）
+    """
+    stat_result = os.stat(file_path)
+    etag = get_file_etag(stat_result)
+    response_headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        **(headers or {})
+    }
+
+    if _matches_etag(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=response_headers)
+
+    file_size = stat_result.st_size
+    byte_range = _parse_range(request.headers.get("range"), file_size)
+    # If-Rangeが現在のETagと異なる場合（ファイルが置き換わった場合）は全体を返す
+    if_range = request.headers.get("if-range")
+    if byte_range is not None and if_range is not None and if_range != etag:
+        byte_range = None
+
+    if byte_range is None:
+        return FileResponse(file_path, media_type=media_type, headers=response_headers, stat_result=stat_result)
+    if byte_range == (-1, -1):
+        return Response(status_code=416, headers={**response_headers, "Content-Range": f"bytes */{file_size}"})
+
+    start, end = byte_range
+    response_headers.update({
+        "Content-Range": f"bytes {start}-{end}/{file_size}",
+        "Content-Length": str(end - start + 1)
+    })
+    return StreamingResponse(
+        _iter_file_range(file_path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=response_headers
+    )
+
+def get_file_etag(stat_result: os.stat_result) -> str:
+    """
+    ファイルの強いETag（inode・更新日時・サイズから生成）
+    保存済みのファイルは置き換え（os.replace）で更新されるため、内容が変わればいずれかが変わる
+    """
+    return f'"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+def _matches_etag(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # 弱いETagとして送り返された場合も同じ内容とみなす
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+def _parse_range(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Rangeヘッダーを解析して(開始位置, 終了位置)を返す
+    指定がない・解釈できない・複数範囲の場合はNone（全体を返す）、満たせない範囲の場合は(-1, -1)
+    """
+    if not range_header:
+        return None
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # 末尾からのバイト数（bytes=-500）
+        suffix_length = int(last)
+        if suffix_length == 0 or file_size == 0:
+            return (-1, -1)
+        return (max(file_size - suffix_length, 0), file_size - 1)
+
+    start = int(first)
+    if last and int(last) < start:
+        return None  # 不正な指定は無視する
+    if start >= file_size:
+        return (-1, -1)
+    end = int(last) if last else file_size - 1
+    return (start, min(end, file_size - 1))
+
+def _iter_file_range(file_path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
@@ -1,22 +1,58 @@
+import asyncio
 import pprint
-from fastapi import FastAPI, Depends, HTTPException, Body, UploadFile, File, Form
+import subprocess
+from fastapi import FastAPI, Depends, HTTPException, Body, UploadFile, File, Form, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import os
 import uuid
 from typing import List
 
 from .logging_config import setup_logging
+from .file_response import build_file_response
 from .services.elasticsearch_service import ESService
 from .services.svn_service import (
     import_resource as svn_import
 )
-from .services.queue_service import get_queue_stats, get_job_list, enqueue_local_file_upload_task
+from .services.queue_service import (
+    get_queue_stats,
+    get_job_list,
+    get_job_timing_stats,
+    enqueue_local_file_upload_task
+)
+from .services.file_upload_service import create_staging_path
+from .services.progress_service import (
+    get_progress,
+    iter_progress_events,
+    record_enqueued,
+    record_result
+)
+from .services.failure_service import (
+    get_failure_counts,
+    list_dead_letters,
+    replay_dead_letters,
+    delete_dead_letters
+)
+from .services.maintenance_service import get_import_job_summary
+from .services.admission_service import get_pressure, defer_svn_import
+from .services.sync_service import list_sync_roots, remove_sync_root, sync_root, sync_all_roots
+from .services.file_filter_service import build_file_filter, is_file_included
+from .services.host_limit_service import get_host_limit_stats
+from .services.conversion_cache_service import get_cache_stats, get_cache_usage
+from .services.unoserver_client import get_unoserver_status
+from .services.pdf_conversion_service import (
+    PdfConversionSettings,
+    request_pdf_conversion,
+    prefetch_pdf_conversions
+)
 from .models.svn_models import SVNExploreRequest, SVNImportRequest
 
 app = FastAPI()
 logger = setup_logging()
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # アップロードファイル書き込み時のチャンクサイズ（1MB）
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
     logger.error(
@@ -25,7 +61,8 @@ async def http_exception_handler(request, exc):
     )
     return JSONResponse(
         status_code=exc.status_code,
-        content={"error": exc.detail, "status_code": exc.status_code}
+        content={"error": exc.detail, "status_code": exc.status_code},
+        headers=getattr(exc, "headers", None)
     )
 
 @app.exception_handler(Exception)
@@ -47,6 +84,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Retry-After: 429応答の再送待ち時間をフロントエンドから参照するため
+    # Accept-Ranges, Content-Range, Content-Length, ETag: PDFビューアがRangeリクエストで部分的に読み込むため
+    expose_headers=["Retry-After", "Accept-Ranges", "Content-Range", "Content-Length", "ETag"],
 )
 
 @app.get("/")
@@ -56,19 +96,80 @@ async def root():
     return {"message": "Welcome to FastAPI + Elasticsearch"}
 
 @app.get("/search")
-def search(query: str, search_type: str = "exact", url_query: str = None):
-    """ドキュメント検索"""
+def search(background_tasks: BackgroundTasks, query: str, search_type: str = "exact", url_query: str = None):
+    """ドキュメント検索（遅延変換モードでは上位の結果のPDF変換を先行して開始）"""
     logger.info(f"Search request received - query: {query}, search_type: {search_type}, url_query: {url_query}")
     es_service = ESService()
     result = es_service.search_documents(query, search_type, url_query)
+    background_tasks.add_task(prefetch_pdf_conversions, result["hits"]["hits"])
     return {"results": result["hits"]["hits"]}
 
 @app.post("/svn/import")
 async def import_svn_resource(request: SVNImportRequest = Body(...)):
     """
     SVNリポジトリからドキュメントをElasticSearchにインポート
+    キューが過負荷の場合は保留し、負荷が下がってからワーカーが投入する（202を返す）
+    SVNサーバーが応答しない場合はSVN_REQUEST_TIMEOUT秒で打ち切る（504を返す）
+    """
+    # Redisへのアクセスでイベントループを止めないよう、スレッドプールで実行する
+    pressure = await run_in_threadpool(get_pressure)
+    if pressure["overloaded"]:
+        parent_job_id = str(uuid.uuid4())
+        position = await run_in_threadpool(defer_svn_import, request, parent_job_id)
+        if position is None:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many deferred imports, please retry later",
+                headers={"Retry-After": str(pressure["retry_after"])}
+            )
+        return JSONResponse(
+            status_code=202,
+            content={
+                "status": "deferred",
+                "message": f"Queues are busy, import of {request.url} is deferred (position: {position})",
+                "parent_job_id": parent_job_id
+            }
+        )
+    try:
+        return await svn_import(request)
+    except (asyncio.TimeoutError, subprocess.TimeoutExpired):
+        # SVNサーバーの応答が無い場合も、他のリクエストを待たせないよう打ち切る
+        raise HTTPException(status_code=504, detail=f"SVN server did not respond in time: {request.url}")
+
+@app.get("/svn/sync/roots")
+async def get_sync_roots():
+    """
+    差分同期の対象（インポートしたURL）と同期済みリビジョンの一覧を取得
     """
-    return await svn_import(request)
+    return {"roots": list_sync_roots()}
+
+@app.post("/svn/sync")
+def sync_svn_resources(url: str = Body(None, embed=True)):
+    """
+    差分同期を実行（通常はワーカーが定期実行する）
+    
+    Args:
+        url: 同期するルートURL（未指定の場合はすべて）
+    """
+    logger.info(f"SVN sync requested - url: {url}")
+    if url is None:
+        return {"results": sync_all_roots()}
+    try:
+        return {"results": [sync_root(url)]}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.delete("/svn/sync/roots")
+def delete_sync_root(url: str = Body(..., embed=True)):
+    """
+    差分同期の対象から外す（取り込み済みのドキュメントは削除しない）
+    
+    Args:
+        url: 同期ルートURL
+    """
+    if not remove_sync_root(url):
+        raise HTTPException(status_code=404, detail="Sync root not found")
+    return {"message": f"Removed {url} from sync"}
 
 @app.get("/files")
 async def get_files():
@@ -118,16 +219,28 @@ def get_document(id: str, include_content: bool = False):
     return result["_source"]
 
 @app.get("/pdf/{filename}")
-async def get_pdf(filename: str):
-    """PDFファイルを取得"""
+async def get_pdf(filename: str, request: Request):
+    """
+    PDFファイルを取得（Rangeリクエスト・ETagによる再検証に対応）
+    遅延変換モードで未変換の場合は変換を開始し、変換中は202で進捗を返す
+    """
     file_path = f"/var/lib/pdf_storage/{filename}.pdf"
     if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path, media_type="application/pdf")
+        conversion = await asyncio.to_thread(request_pdf_conversion, filename)
+        if conversion is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        if conversion["status"] == "failed":
+            raise HTTPException(status_code=500, detail="PDF conversion failed")
+        return JSONResponse(
+            status_code=202,
+            content=conversion,
+            headers={"Retry-After": str(PdfConversionSettings().pdf_conversion_retry_after)}
+        )
+    return build_file_response(request, file_path, "application/pdf")
 
 @app.get("/file/{filename}")
-async def get_file(filename: str):
-    """保存されたファイルを取得"""
+async def get_file(filename: str, request: Request):
+    """保存されたファイルを取得（Rangeリクエスト・ETagによる再検証に対応）"""
     file_path = f"/var/lib/file_storage/{filename}"
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found")
@@ -166,15 +279,11 @@ async def get_file(filename: str):
             "Content-Disposition": f"attachment; filename=\"{encoded_filename}\""
         }
         
-        return FileResponse(
-            path=file_path,
-            media_type=mime_type,
-            headers=headers
-        )
+        return build_file_response(request, file_path, mime_type, headers)
     except Exception as e:
         logger.error(f"Failed to get original filename for {filename}: {str(e)}")
-        # エラー時はFileResponseで返す
-        return FileResponse(file_path, media_type=mime_type)
+        # エラー時は元のファイル名なしで返す
+        return build_file_response(request, file_path, mime_type)
 
 @app.get("/jobs/queue/stats")
 async def get_queue_stats_endpoint():
@@ -185,37 +294,206 @@ async def get_queue_stats_endpoint():
         dict: キュー統計情報
     """
     logger.info("Queue stats request received")
-    return get_queue_stats()
+    return {**get_queue_stats(), "pressure": get_pressure()}
 
 @app.get("/jobs")
-async def get_jobs_list_endpoint(queue_name: str = None, status: str = None):
+async def get_jobs_list_endpoint(queue_name: str = None, status: str = None, limit: int = 200):
     """
     RQジョブの一覧を取得
     
     Args:
         queue_name: キュー名（オプション）
         status: ジョブステータス（オプション、'queued', 'started', 'finished', 'failed', 'deferred', 'scheduled'）
+        limit: キュー・ステータスごとの最大取得件数（新しい順）
     
     Returns:
         list: ジョブ情報のリスト
     """
     logger.info(f"Job list request received - queue_name: {queue_name}, status: {status}")
-    jobs = get_job_list(queue_name, status)
+    jobs = get_job_list(queue_name, status, limit)
     return jobs
 
+@app.get("/jobs/timing")
+async def get_job_timing_endpoint():
+    """
+    ワーカーの実行方式・キューごとのジョブ処理時間を取得
+    ジョブ関数の実行時間と、それ以外（fork・モジュール読み込み・接続確立など）のオーバーヘッドを比較できる
+    
+    Returns:
+        dict: {実行方式: {キュー名: {jobs, avg_work_ms, avg_overhead_ms, overhead_ratio}}}
+    """
+    return get_job_timing_stats()
+
+@app.get("/jobs/svn-hosts")
+async def get_svn_host_stats_endpoint():
+    """
+    SVNホストごとのアクセス枠の使用状況と、枠の確保にかかった待ち時間を取得
+    待ちやタイムアウトが多い場合は枠（SVN_HOST_MAX_CONCURRENCY）が小さすぎる
+    
+    Returns:
+        dict: hosts(host, in_use, max_concurrency, acquired, waited, timeouts, avg_wait_ms のリスト)
+    """
+    return {"hosts": get_host_limit_stats()}
+
+@app.get("/jobs/unoserver")
+async def get_unoserver_status_endpoint():
+    """
+    変換サーバー(unoserver)のインスタンスごとの処理中リクエスト数と切り離し状態を取得
+    
+    Returns:
+        dict: instances(url, outstanding, state, failures のリスト)
+    """
+    return {"instances": get_unoserver_status()}
+
+@app.get("/jobs/conversion-cache")
+async def get_conversion_cache_endpoint():
+    """
+    変換結果キャッシュのヒット率と使用量を取得
+    
+    Returns:
+        dict: stats(markdown/pdfごとのhits, misses, hit_rate), usage(entries, size_bytes)
+    """
+    return {"stats": get_cache_stats(), "usage": get_cache_usage()}
+
+@app.get("/jobs/failures")
+async def get_failure_counts_endpoint():
+    """
+    原因別の失敗回数を取得
+    
+    Returns:
+        dict: 失敗原因ごとの回数
+    """
+    return get_failure_counts()
+
+@app.get("/jobs/dead-letter")
+async def get_dead_letters_endpoint(limit: int = 100, offset: int = 0):
+    """
+    デッドレターキュー（再試行しても成功しなかったタスク）の一覧を取得
+    
+    Args:
+        limit: 取得件数
+        offset: 取得開始位置
+    
+    Returns:
+        dict: 総件数とエントリ一覧（新しい順）
+    """
+    return list_dead_letters(limit, offset)
+
+@app.post("/jobs/dead-letter/replay")
+def replay_dead_letters_endpoint(
+    entry_ids: List[str] = Body(None, embed=True),
+    replay_all: bool = Body(False, embed=True)
+):
+    """
+    デッドレターキューのタスクを再実行
+    
+    Args:
+        entry_ids: 再実行するエントリIDのリスト
+        replay_all: Trueの場合は全件を再実行
+    """
+    if not entry_ids and not replay_all:
+        raise HTTPException(status_code=400, detail="entry_ids or replay_all is required")
+    logger.info(f"Dead letter replay requested - entry_ids: {entry_ids}, replay_all: {replay_all}")
+    return replay_dead_letters(None if replay_all else entry_ids)
+
+@app.delete("/jobs/dead-letter")
+def delete_dead_letters_endpoint(
+    entry_ids: List[str] = Body(None, embed=True),
+    delete_all: bool = Body(False, embed=True)
+):
+    """
+    デッドレターキューのエントリを削除
+    
+    Args:
+        entry_ids: 削除するエントリIDのリスト
+        delete_all: Trueの場合は全件を削除
+    """
+    if not entry_ids and not delete_all:
+        raise HTTPException(status_code=400, detail="entry_ids or delete_all is required")
+    deleted = delete_dead_letters(None if delete_all else entry_ids)
+    return {"deleted": deleted}
+
+@app.get("/jobs/{parent_job_id}/progress")
+async def get_import_progress_endpoint(parent_job_id: str):
+    """
+    インポート（親ジョブ）単位の進捗を取得
+    
+    Args:
+        parent_job_id: 親ジョブID
+    
+    Returns:
+        dict: 進捗カウンタ
+    """
+    return get_progress(parent_job_id)
+
+@app.get("/jobs/{parent_job_id}/summary")
+async def get_import_job_summary_endpoint(parent_job_id: str):
+    """
+    インポート（親ジョブ）単位の圧縮済みジョブ集計を取得
+    定期圧縮でRedisから削除されたジョブの件数をキュー・ステータスごとに返す
+    
+    Args:
+        parent_job_id: 親ジョブID
+    
+    Returns:
+        dict: '{キュー名}:{finished|failed}' ごとのジョブ数
+    """
+    return get_import_job_summary(parent_job_id)
+
+@app.get("/jobs/{parent_job_id}/conversion-cache")
+async def get_import_conversion_cache_endpoint(parent_job_id: str):
+    """
+    インポート（親ジョブ）単位の変換結果キャッシュのヒット率を取得
+    
+    Args:
+        parent_job_id: 親ジョブID
+    
+    Returns:
+        dict: markdown/pdfごとのhits, misses, hit_rate
+    """
+    return get_cache_stats(parent_job_id)
+
+@app.get("/jobs/{parent_job_id}/events")
+async def stream_import_progress_endpoint(parent_job_id: str):
+    """
+    インポート（親ジョブ）単位の進捗をServer-Sent Eventsで配信
+    接続時に現在値(snapshot)を送り、以降は差分(progress)のみを送る
+    
+    Args:
+        parent_job_id: 親ジョブID
+    """
+    logger.info(f"Progress stream requested - parent_job_id: {parent_job_id}")
+    return StreamingResponse(
+        iter_progress_events(parent_job_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # nginx経由でもバッファリングさせない
+        }
+    )
+
 @app.post("/upload/local-folder")
-async def upload_local_folder(
+def upload_local_folder(
     files: List[UploadFile] = File(...),
     absolute_paths: List[str] = Form(...),
-    parent_job_id: str = Form(None)
+    parent_job_id: str = Form(None),
+    file_types: str = Form(None),
+    include_patterns: List[str] = Form(None),
+    exclude_patterns: List[str] = Form(None),
+    max_file_size: int = Form(None)
 ):
     """
     ローカルフォルダからファイルをアップロード
+    一時ファイルの書き込みやRedisへのアクセスでイベントループを止めないよう、同期関数としてスレッドプールで実行する
     
     Args:
         files: アップロードするファイルリスト
         absolute_paths: 各ファイルの絶対パスリスト
         parent_job_id: 親ジョブID（進捗追跡用）
+        file_types: 取り込む拡張子（カンマ区切り）
+        include_patterns: 取り込むパスのglob（絶対パスと照合）
+        exclude_patterns: 除外するパスのglob（絶対パスと照合）
+        max_file_size: 取り込む最大ファイルサイズ（バイト）
     
     Returns:
         dict: アップロード結果
@@ -229,23 +507,55 @@ async def upload_local_folder(
             detail="Number of files and absolute paths must match"
         )
     
+    # 過負荷の場合は受け付けず、時間をおいた再送を求める
+    pressure = get_pressure()
+    if pressure["overloaded"]:
+        raise HTTPException(
+            status_code=429,
+            detail="Queues are busy, please retry later",
+            headers={"Retry-After": str(pressure["retry_after"])}
+        )
+    
     # 親ジョブIDが指定されていない場合は生成
     if not parent_job_id:
         parent_job_id = str(uuid.uuid4())
     
+    file_filter = build_file_filter(file_types, include_patterns, exclude_patterns, max_file_size)
+    
     results = []
     total_files = len(files)
     
     for i, (file, absolute_path) in enumerate(zip(files, absolute_paths)):
+        if not is_file_included(absolute_path, file.size, file_filter):
+            # 除外したファイルは一時保存・変換・登録のいずれも行わない
+            results.append({
+                "success": True,
+                "file_name": file.filename,
+                "absolute_path": absolute_path,
+                "status": "excluded"
+            })
+            continue
+        
         try:
-            file_data = await file.read()
-            # ファイルをキューに追加
-            job = enqueue_local_file_upload_task(
-                absolute_path=absolute_path,
-                file_data=file_data,
-                file_name=file.filename,
-                job_id=parent_job_id
-            )
+            # ファイルデータはRedisに載せず、共有ボリュームに一時保存してパスを渡す
+            staged_file_path = create_staging_path(file.filename)
+            with open(staged_file_path, "wb") as f:
+                while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+            
+            # ファイルをキューに追加（ワーカーが結果を記録する前に計上しておく）
+            record_enqueued(parent_job_id)
+            try:
+                job = enqueue_local_file_upload_task(
+                    absolute_path=absolute_path,
+                    staged_file_path=staged_file_path,
+                    file_name=file.filename,
+                    job_id=parent_job_id
+                )
+            except Exception:
+                record_result(parent_job_id, "failed")
+                os.remove(staged_file_path)
+                raise
             
             results.append({
                 "success": True,
@@ -269,7 +579,8 @@ async def upload_local_folder(
     return {
         "parent_job_id": parent_job_id,
         "total_files": total_files,
-        "successful_uploads": sum(1 for r in results if r["success"]),
+        "successful_uploads": sum(1 for r in results if r["success"] and r["status"] != "excluded"),
+        "excluded_uploads": sum(1 for r in results if r.get("status") == "excluded"),
         "failed_uploads": sum(1 for r in results if not r["success"]),
         "results": results
     }
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional, List
 from pydantic import BaseModel
 
 class SVNExploreRequest(BaseModel):
@@ -15,3 +15,8 @@ class SVNImportRequest(BaseModel):
     username: Optional[str] = None
     password: Optional[str] = None
     ip_address: Optional[str] = None
+    # 取り込むファイルの絞り込み（一覧の情報で判定するため、除外したファイルはダウンロードしない）
+    file_types: Optional[str] = None  # 取り込む拡張子（カンマ区切り、例: "txt,pdf,docx"）。未指定の場合はすべて
+    include_patterns: List[str] = []  # 取り込むパスのglob（いずれかに一致するもののみ取り込む）
+    exclude_patterns: List[str] = []  # 除外するパスのglob
+    max_file_size: Optional[int] = None  # 取り込む最大ファイルサイズ（バイト）
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+マークダウンのクリーンアップ処理のベンチマークスクリプト
+複数シートのExcelを変換した場合を想定した表の多いマークダウンを生成し、
+以前の実装（正規表現で表を抽出し、表ごとにコンテンツを組み立て直す）と出力が一致することを確認したうえで処理時間を比較する
+
+    cd /app
+    python -m app.scripts.benchmark_markdown_cleaner --sheets 2000 --rows 20
+"""
+
+import argparse
+import random
+import re
+import time
+from typing import Callable, List
+
+from app.services.file_converter import FileConverter
+
+# 出力の一致を確認する境界ケース（表の前後・間の空白行、行途中から始まる表、表として扱わない行など）
+EDGE_CASES = [
+    "",
+    "本文のみ\n\n\n本文",
+    "| a | b |\n|---|---|\n| 1 | 2 |",
+    "| a | b |\n|---|---|\n| 1 | 2 |\n",
+    "| a | b |\n|---|---|\n",
+    "| a | b |\n|---|---|",
+    "| a | b |\n\n  \n|---|---|\n| 1 | 2 |\n\n\n本文",
+    "前置き | a | b |\n| --- | :-: |\n| NaN | Unnamed: 3 |\n| x |  |\n",
+    "| Unnamed: 0 | b |\n|---|---|\n| NaN | 1 |\n|  | 2 |\n  | 3 |\n| 4 |",
+    "| a |\n|---|\n| 1 |\n\n  \n| 2 |\n| 3 | 後ろに文字\n| 4 |",
+    "| --- |\n|---|\n| 1 |",
+    "| a | b |\n|-x-|---|\n| 1 | 2 |",
+    "| a | b |\n  |---|---|\n| 1 | 2 |",
+    "| a |\t\r\n|---|  \r\n| 1 |\r\n",
+    "| a | b |\n|---|---|\n| 1 | 2 |\n| a | b |\n|---|---|\n| 3 | 4 |\n  \n",
+    "|\n|---|\n||\n| |\n",
+    "| a |　\n|---|\n| 1 |　\n　\n本文",
+]
+
+def legacy_clean_markdown_content(content: str) -> str:
+    """以前の実装（出力の比較用）"""
+    table_pattern = r'(\|.*\|\s*\n\|[-:| ]+\|\s*\n(?:\|.*\|\s*(?:\n|$))*)'
+    tables = []
+    for match in re.finditer(table_pattern, content, re.MULTILINE):
+        table_data = FileConverter._parse_markdown_table(match.group(0).strip())
+        if table_data:
+            tables.append((match.start(), match.end(), table_data))
+    for start, end, table_data in reversed(tables):
+        content = content[:start] + FileConverter._clean_table_data(table_data) + content[end:]
+    content = re.sub(r'\n\s*\n', '\n\n', content)
+    return content.strip()
+
+def generate_workbook_markdown(sheets: int, rows: int, columns: int, seed: int = 0) -> str:
+    """複数シートのExcelを変換した場合に近いマークダウン（シートごとに見出しと表）を生成"""
+    rng = random.Random(seed)
+    lines: List[str] = []
+    for sheet in range(sheets):
+        lines.append(f"## Sheet{sheet + 1}")
+        headers = [f"Unnamed: {col}" if rng.random() < 0.3 else f"列{col}" for col in range(columns)]
+        lines.append("| " + " | ".join(headers) + " |")
+        lines.append("| " + " | ".join(["---"] * columns) + " |")
+        for _ in range(rows):
+            cells = []
+            for col in range(columns):
+                value = rng.random()
+                if headers[col].startswith("Unnamed") and value < 0.8:
+                    cells.append("NaN")
+                elif value < 0.2:
+                    cells.append("NaN")
+                else:
+                    cells.append(f"値{rng.randint(0, 9999)}")
+            lines.append("| " + " | ".join(cells) + " |")
+        if rng.random() < 0.3:
+            lines.append("| " + " | ".join(["NaN"] * columns) + " |")
+        lines.append("")
+    return "\n".join(lines)
+
+def measure(func: Callable[[str], str], content: str, repeat: int) -> float:
+    """最短の処理時間（秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(content)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="マークダウンのクリーンアップ処理のベンチマーク")
+    parser.add_argument("--sheets", type=int, nargs="+", default=[100, 1000, 4000], help="表（シート）の数")
+    parser.add_argument("--rows", type=int, default=20, help="表ごとのデータ行数")
+    parser.add_argument("--columns", type=int, default=8, help="表の列数")
+    parser.add_argument("--repeat", type=int, default=3, help="計測の繰り返し回数")
+    parser.add_argument("--skip-legacy", action="store_true", help="以前の実装の計測を省略（出力の比較は境界ケースのみ）")
+    args = parser.parse_args()
+
+    for index, content in enumerate(EDGE_CASES):
+        expected = legacy_clean_markdown_content(content)
+        actual = FileConverter._clean_markdown_content(content)
+        if actual != expected:
+            raise SystemExit(f"Output mismatch in edge case {index}:\n{expected!r}\n{actual!r}")
+    print(f"Edge cases: {len(EDGE_CASES)} matched")
+
+    for sheets in args.sheets:
+        content = generate_workbook_markdown(sheets, args.rows, args.columns, seed=sheets)
+        current = measure(FileConverter._clean_markdown_content, content, args.repeat)
+        result = f"sheets={sheets} size={len(content) / 1024 / 1024:.1f}MB current={current:.3f}s"
+        if not args.skip_legacy:
+            if FileConverter._clean_markdown_content(content) != legacy_clean_markdown_content(content):
+                raise SystemExit(f"Output mismatch with {sheets} sheets")
+            legacy = measure(legacy_clean_markdown_content, content, args.repeat)
+            result += f" legacy={legacy:.3f}s speedup={legacy / current:.1f}x"
+        print(result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import json
+import time
+from typing import Dict, Any, Optional
+
+from pydantic_settings import BaseSettings
+
+from ..logging_config import setup_logging
+from ..models.svn_models import SVNImportRequest
+from .queue_service import ALL_QUEUES, get_redis_connection, get_queue
+from .failure_service import record_failure_cause
+
+logger = setup_logging()
+"""
+取り込み流量制御サービスモジュール
+キューの滞留数とRedisのメモリ使用量を監視し、上限（ウォーターマーク）を超えた場合は
+取り込みを拒否(429)するか、保留して負荷が下がってから投入する
+"""
+
+DEFERRED_IMPORTS_KEY = 'deferred_imports'  # 保留中のSVNインポート（先頭から順に投入）
+
+class AdmissionSettings(BaseSettings):
+    """取り込み流量制御設定クラス"""
+    max_queue_depth: int = 10000  # 全キューの待ちジョブ数の上限（0で無制限）
+    max_redis_memory_mb: int = 512  # Redisの使用メモリの上限（MB、0で無制限）
+    # 上限を超えた後、この割合まで下がったら保留中のインポートを再開する
+    admission_resume_ratio: float = 0.8
+    admission_retry_after: int = 30  # 429応答のRetry-After（秒）
+    max_deferred_imports: int = 1000  # 保留できるSVNインポート数の上限
+    deferred_release_interval: int = 10  # 保留中のインポートを確認する間隔（秒）
+
+def get_pressure() -> Dict[str, Any]:
+    """
+    現在の取り込み負荷を取得
+
+    Returns:
+        dict: キュー滞留数・Redisメモリ使用量と各上限、保留中のインポート数、過負荷かどうか
+    """
+    settings = AdmissionSettings()
+    redis_conn = get_redis_connection()
+
+    pipe = redis_conn.pipeline(transaction=False)
+    for queue_name in ALL_QUEUES:
+        pipe.llen(get_queue(queue_name).key)
+    pipe.llen(DEFERRED_IMPORTS_KEY)
+    results = pipe.execute()
+    queue_depth = sum(results[:-1])
+    deferred_imports = results[-1]
+
+    redis_memory_mb = redis_conn.info('memory')['used_memory'] / (1024 * 1024)
+
+    return {
+        'queue_depth': queue_depth,
+        'max_queue_depth': settings.max_queue_depth,
+        'redis_memory_mb': round(redis_memory_mb, 1),
+        'max_redis_memory_mb': settings.max_redis_memory_mb,
+        'deferred_imports': deferred_imports,
+        'overloaded': _exceeds(queue_depth, redis_memory_mb, settings, 1.0),
+        'retry_after': settings.admission_retry_after
+    }
+
+def _exceeds(queue_depth: int, redis_memory_mb: float, settings: AdmissionSettings, ratio: float) -> bool:
+    """いずれかの上限にratioを掛けた値を超えているか"""
+    if settings.max_queue_depth and queue_depth >= settings.max_queue_depth * ratio:
+        return True
+    if settings.max_redis_memory_mb and redis_memory_mb >= settings.max_redis_memory_mb * ratio:
+        return True
+    return False
+
+def is_overloaded() -> bool:
+    """取り込みの上限を超えているか"""
+    return get_pressure()['overloaded']
+
+def defer_svn_import(request: SVNImportRequest, parent_job_id: str) -> Optional[int]:
+    """
+    SVNインポートを保留リストに追加（負荷が下がった時点でワーカーが投入する）
+
+    Args:
+        request: インポートリクエスト
+        parent_job_id: 親ジョブID（投入時にそのまま使用）
+
+    Returns:
+        Optional[int]: 保留リスト内の順番。保留数の上限に達している場合はNone
+    """
+    settings = AdmissionSettings()
+    redis_conn = get_redis_connection()
+    if redis_conn.llen(DEFERRED_IMPORTS_KEY) >= settings.max_deferred_imports:
+        return None
+
+    entry = {
+        'request': request.model_dump(),
+        'parent_job_id': parent_job_id,
+        'deferred_at': time.time()
+    }
+    position = redis_conn.rpush(DEFERRED_IMPORTS_KEY, json.dumps(entry))
+    logger.info(f"Deferred SVN import for {request.url} (position: {position})")
+    return position
+
+def release_deferred_imports() -> int:
+    """
+    負荷が再開の目安を下回っている間、保留中のSVNインポートを順に投入
+
+    Returns:
+        int: 投入したインポート数
+    """
+    # 循環インポートを避けるため関数内でインポート
+    from .svn_service import start_import
+
+    settings = AdmissionSettings()
+    redis_conn = get_redis_connection()
+    released = 0
+
+    while True:
+        pressure = get_pressure()
+        if pressure['deferred_imports'] == 0:
+            break
+        if _exceeds(pressure['queue_depth'], pressure['redis_memory_mb'], settings, settings.admission_resume_ratio):
+            break
+
+        raw = redis_conn.lpop(DEFERRED_IMPORTS_KEY)
+        if raw is None:
+            break
+
+        entry = json.loads(raw)
+        request = SVNImportRequest(**entry['request'])
+        try:
+            start_import(request, entry['parent_job_id'])
+            released += 1
+        except Exception as e:
+            record_failure_cause('deferred_import_failed')
+            logger.error(f"Failed to start deferred SVN import for {request.url}: {str(e)}", exc_info=True)
+
+    if released:
+        logger.info(f"Released {released} deferred SVN imports")
+    return released
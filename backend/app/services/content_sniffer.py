@@ -0,0 +1,157 @@
+import codecs
+from typing import Optional, Tuple
+
+"""
+ファイル内容の判定モジュール
+テキストとして読み込む前にファイル先頭のバイト列からバイナリかどうかと文字コードを判定し、
+画像・圧縮ファイル・実行ファイルなどが文字化けしたテキストとして索引されないようにする
+"""
+
+SNIFF_BYTES = 8192  # 判定に使うファイル先頭のバイト数
+
+# 代表的なバイナリ形式の先頭バイト（マジックナンバー）
+# テキストの書き出しと一致しうる短いASCIIのものは、後続の構造を確認するSTRUCTURED_SIGNATURESで判定する
+BINARY_SIGNATURES = [
+    b'\x89PNG\r\n\x1a\n',  # PNG
+    b'\xff\xd8\xff',  # JPEG
+    b'GIF87a', b'GIF89a',  # GIF
+    b'II*\x00', b'MM\x00*',  # TIFF
+    b'PK\x03\x04', b'PK\x05\x06', b'PK\x07\x08',  # ZIP（Office Open XML, JAR なども含む）
+    b'\x1f\x8b',  # gzip
+    b'\xfd7zXZ\x00',  # xz
+    b'7z\xbc\xaf\x27\x1c',  # 7-Zip
+    b'Rar!\x1a\x07',  # RAR
+    b'MSCF',  # CAB
+    b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',  # OLE2（古いOffice形式, msi など）
+    b'\x7fELF',  # ELF
+    b'\xca\xfe\xba\xbe',  # Javaクラスファイル
+    b'SQLite format 3\x00',  # SQLite
+    b'%PDF-',  # PDF
+    b'\x00\x00\x01\x00',  # ICO
+]
+
+def _is_pe_executable(sample: bytes) -> bool:
+    # MZヘッダーのe_lfanew（0x3C）が指す位置にPEシグネチャがある
+    if len(sample) < 0x40:
+        return False
+    pe_offset = int.from_bytes(sample[0x3c:0x40], 'little')
+    return sample[pe_offset:pe_offset + 4] == b'PE\x00\x00'
+
+# 先頭の短いASCII列と、それに続く構造の確認（一致しない場合はテキストの判定に回す）
+STRUCTURED_SIGNATURES = [
+    (b'MZ', _is_pe_executable),  # Windows実行ファイル
+    (b'BZh', lambda sample: b'1' <= sample[3:4] <= b'9' and sample[4:10] == b'1AY&SY'),  # bzip2（ブロックサイズと先頭ブロックの識別子）
+    (b'RIFF', lambda sample: sample[8:12] in (b'WAVE', b'AVI ', b'WEBP')),  # WAV, AVI, WebP
+    (b'ID3', lambda sample: sample[3:4] in (b'\x02', b'\x03', b'\x04')),  # MP3（ID3v2のメジャーバージョン）
+    (b'AC10', lambda sample: sample[4:6].isdigit() and b'\x00' in sample[6:16]),  # AutoCAD DWG
+    (b'8BPS', lambda sample: sample[4:6] in (b'\x00\x01', b'\x00\x02')),  # Photoshop（PSD/PSB）
+    (b'OggS', lambda sample: sample[4:5] == b'\x00'),  # Ogg（ストリーム構造のバージョン）
+    (b'fLaC', lambda sample: sample[5:8] == b'\x00\x00\x22'),  # FLAC（STREAMINFOブロックの長さ）
+]
+
+# 制御文字のうちテキストでも使われるもの（タブ、改行、改ページ、ESCなど）
+TEXT_CONTROL_BYTES = frozenset(b'\t\n\r\x0c\x08\x1b')
+MAX_CONTROL_RATIO = 0.1  # これを超える割合で制御文字を含む場合はバイナリと判定
+
+# テキストファイルの文字コードの候補（判定順）
+TEXT_ENCODINGS = ['utf-8', 'cp932', 'euc_jp']
+
+def sniff_file(file_path: str) -> Tuple[bool, Optional[str]]:
+    """
+    ファイル先頭のバイト列からバイナリかどうかと文字コードを判定
+
+    Args:
+        file_path: 判定するファイルのパス
+
+    Returns:
+        Tuple[bool, Optional[str]]: (バイナリかどうか, テキストの場合の文字コード)
+    """
+    with open(file_path, 'rb') as f:
+        sample = f.read(SNIFF_BYTES)
+    return sniff_bytes(sample)
+
+def sniff_bytes(sample: bytes) -> Tuple[bool, Optional[str]]:
+    """バイト列からバイナリかどうかと文字コードを判定（sniff_fileを参照）"""
+    if not sample:
+        return False, 'utf-8'
+
+    # BOM付きのテキスト（UTF-16はNULを含むため先に判定）
+    if sample.startswith(codecs.BOM_UTF8):
+        return False, 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return False, 'utf-16'
+
+    if sample.startswith(tuple(BINARY_SIGNATURES)):
+        return True, None
+    for prefix, is_confirmed in STRUCTURED_SIGNATURES:
+        if sample.startswith(prefix) and is_confirmed(sample):
+            return True, None
+    # MP4, MOV など（4バイト目からftyp）
+    if sample[4:8] == b'ftyp':
+        return True, None
+
+    # テキストファイルはNULを含まない（BOMのないUTF-16を除く）
+    if b'\x00' in sample:
+        encoding = _detect_utf16(sample)
+        return (False, encoding) if encoding else (True, None)
+    if _count_control_bytes(sample) / len(sample) > MAX_CONTROL_RATIO:
+        return True, None
+
+    encoding = _detect_encoding(sample)
+    if encoding is None:
+        # どの文字コードでも解釈できない場合は従来どおりUTF-8として読む（不正なバイトは置換）
+        return False, 'utf-8'
+    return False, encoding
+
+def decode_text(data: bytes, encoding: str) -> str:
+    """
+    判定した文字コードでテキストを復元
+    先頭以外に判定した文字コードで解釈できないバイトがある場合は他の候補を試し、
+    いずれも失敗した場合は不正なバイトを置換してUTF-8として復元する
+    """
+    for candidate in [encoding] + [enc for enc in TEXT_ENCODINGS if enc != encoding]:
+        try:
+            return data.decode(candidate)
+        except UnicodeDecodeError:
+            continue
+    return data.decode('utf-8', errors='replace')
+
+def _count_control_bytes(data: bytes) -> int:
+    return sum(1 for byte in data if byte < 0x20 and byte not in TEXT_CONTROL_BYTES)
+
+def _detect_utf16(sample: bytes) -> Optional[str]:
+    """
+    BOMのないUTF-16かを判定し、文字コード（utf-16-le / utf-16-be）を返す
+    ASCII文字（改行・空白を含む）の上位バイトがNULになるため、NULが奇数番目（LE）または偶数番目（BE）の一方にだけ現れる
+    （日本語の文章では改行程度しかASCII文字を含まないため、NULの割合は問わない）
+    """
+    sample = sample[:len(sample) - len(sample) % 2]
+    even_nuls = sample[0::2].count(0)
+    odd_nuls = sample[1::2].count(0)
+    if odd_nuls and not even_nuls:
+        encoding = 'utf-16-le'
+    elif even_nuls and not odd_nuls:
+        encoding = 'utf-16-be'
+    else:
+        return None
+
+    # 16ビットの数値の並びなどを除くため、文字として解釈でき、上位バイトがNULの文字（ASCII・Latin-1）に
+    # 制御文字（C0・C1）を含まないことを確認する
+    try:
+        text = codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return None
+    if any((ord(char) < 0x20 and ord(char) not in TEXT_CONTROL_BYTES) or 0x7f <= ord(char) < 0xa0 for char in text):
+        return None
+    return encoding
+
+def _detect_encoding(sample: bytes) -> Optional[str]:
+    """先頭のバイト列を解釈できる文字コード（末尾で途切れたマルチバイト文字は許容）"""
+    for encoding in TEXT_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            decoder.decode(sample, final=False)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    return None
@@ -0,0 +1,270 @@
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+from typing import Optional, Dict, Any, List
+
+from pydantic_settings import BaseSettings
+from rq import get_current_job
+
+from ..logging_config import setup_logging
+from .file_converter import PDF_STORAGE_DIR, get_converter_version
+from .queue_service import get_redis_connection
+from .progress_service import PROGRESS_TTL
+
+logger = setup_logging()
+"""
+変換結果キャッシュサービスモジュール
+ファイル内容のSHA-256と変換処理のバージョンをキーに、マークダウンとPDFの変換結果を保存し、
+trunk/branches/tagsやアップロードで重複する同一ファイルの再変換を省く
+"""
+
+CACHE_STATS_KEY = 'conversion_cache:stats'  # 全体のヒット・ミス回数
+CACHE_IMPORT_STATS_KEY_PREFIX = 'conversion_cache:import'  # インポート（親ジョブ）ごとのヒット・ミス回数
+DIGEST_CHUNK_SIZE = 1024 * 1024
+USED_MARKER_SUFFIX = '.used'  # キャッシュ済みPDFの最終使用日時を記録する印ファイルの接尾辞
+
+class ConversionCacheSettings(BaseSettings):
+    """変換結果キャッシュ設定クラス"""
+    conversion_cache_enabled: bool = True
+    # PDFをハードリンクで共有するため、PDF保存ディレクトリと同じボリュームに置く
+    conversion_cache_dir: str = os.path.join(PDF_STORAGE_DIR, ".cache")
+    conversion_cache_max_bytes: int = 5 * 1024 * 1024 * 1024  # キャッシュの合計サイズ上限（超えた分は古い順に削除）
+
+def get_cache_key(file_path: str) -> Optional[str]:
+    """
+    ファイルのキャッシュキー（内容のSHA-256と変換処理のバージョン）を生成
+
+    Returns:
+        Optional[str]: キャッシュキー。キャッシュが無効な場合はNone
+    """
+    if not ConversionCacheSettings().conversion_cache_enabled:
+        return None
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(DIGEST_CHUNK_SIZE):
+            digest.update(chunk)
+    return f"{digest.hexdigest()}-{get_converter_version()}"
+
+def get_cached_markdown(cache_key: Optional[str]) -> Optional[str]:
+    """キャッシュ済みのマークダウン（クリーンアップ済み）を取得"""
+    return _read_cache_text(cache_key, 'md')
+
+def store_markdown(cache_key: Optional[str], content: str) -> None:
+    """マークダウンをキャッシュに保存（保存の失敗で処理は止めない）"""
+    _write_cache_text(cache_key, 'md', content)
+
+def get_cached_sections(cache_key: Optional[str]) -> Optional[List[Dict[str, str]]]:
+    """キャッシュ済みのセクション（PDFのページ、Excelのシートごとに抽出したもの）を取得"""
+    content = _read_cache_text(cache_key, 'json')
+    return json.loads(content) if content is not None else None
+
+def store_sections(cache_key: Optional[str], sections: List[Dict[str, str]]) -> None:
+    """セクションをキャッシュに保存（保存の失敗で処理は止めない）"""
+    _write_cache_text(cache_key, 'json', json.dumps(sections, ensure_ascii=False))
+
+def _read_cache_text(cache_key: Optional[str], ext: str) -> Optional[str]:
+    if cache_key is None:
+        return None
+    cache_path = _get_cache_path(cache_key, ext)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except FileNotFoundError:
+        return None
+    _touch(cache_path)
+    return content
+
+def _write_cache_text(cache_key: Optional[str], ext: str, content: str) -> None:
+    if cache_key is None:
+        return
+    cache_path = _get_cache_path(cache_key, ext)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # 同時に書き込まれても不完全な内容を読まないよう、一時ファイルから置き換える
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Failed to store {ext} cache {cache_key}: {str(e)}")
+
+def link_cached_pdf(cache_key: Optional[str], output_path: str) -> bool:
+    """
+    キャッシュ済みのPDFをドキュメントのPDFとしてハードリンクする（ファイルの実体は共有）
+
+    Returns:
+        bool: キャッシュにPDFがあった場合True
+    """
+    if cache_key is None:
+        return False
+    cache_path = _get_cache_path(cache_key, 'pdf')
+    if not os.path.exists(cache_path):
+        return False
+    try:
+        _link_replace(cache_path, output_path)
+    except OSError as e:
+        logger.warning(f"Failed to link cached PDF {cache_key} to {output_path}: {str(e)}")
+        return False
+    _touch(cache_path)
+    return True
+
+def store_pdf(cache_key: Optional[str], pdf_path: str) -> None:
+    """変換したPDFをキャッシュに登録（ハードリンクのためディスクは追加で消費しない）"""
+    if cache_key is None:
+        return
+    cache_path = _get_cache_path(cache_key, 'pdf')
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        _link_replace(pdf_path, cache_path)
+        _touch(cache_path)
+    except OSError as e:
+        logger.warning(f"Failed to store PDF cache {cache_key}: {str(e)}")
+
+def record_cache_result(kind: str, hit: bool, parent_job_id: Optional[str] = None) -> None:
+    """
+    キャッシュのヒット・ミスを全体・インポート単位・ジョブ単位で記録
+
+    Args:
+        kind: 'markdown' または 'pdf'
+        hit: キャッシュにあったかどうか
+        parent_job_id: 親ジョブID（省略時は実行中のジョブから取得。並列処理のスレッドからは必ず渡す）
+    """
+    field = f"{kind}_{'hits' if hit else 'misses'}"
+    try:
+        redis_conn = get_redis_connection()
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.hincrby(CACHE_STATS_KEY, field, 1)
+
+        job = get_current_job()
+        if parent_job_id is None and job is not None:
+            parent_job_id = job.meta.get('parent_job_id')
+        if parent_job_id:
+            import_stats_key = f"{CACHE_IMPORT_STATS_KEY_PREFIX}:{parent_job_id}"
+            pipe.hincrby(import_stats_key, field, 1)
+            pipe.expire(import_stats_key, PROGRESS_TTL)
+        if job is not None:
+            job_stats = job.meta.setdefault('conversion_cache', {})
+            job_stats[field] = job_stats.get(field, 0) + 1
+            job.save_meta()
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record conversion cache result: {str(e)}")
+
+def get_cache_stats(parent_job_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    キャッシュのヒット率を取得
+
+    Args:
+        parent_job_id: 親ジョブID（省略時は全体）
+
+    Returns:
+        dict: markdown/pdfごとのhits, misses, hit_rate
+    """
+    key = f"{CACHE_IMPORT_STATS_KEY_PREFIX}:{parent_job_id}" if parent_job_id else CACHE_STATS_KEY
+    counters = {
+        field.decode('utf-8'): int(value)
+        for field, value in get_redis_connection().hgetall(key).items()
+    }
+    stats = {}
+    for kind in ('markdown', 'pdf'):
+        hits = counters.get(f"{kind}_hits", 0)
+        misses = counters.get(f"{kind}_misses", 0)
+        stats[kind] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None
+        }
+    return stats
+
+def get_cache_usage() -> Dict[str, int]:
+    """キャッシュのエントリ数と合計サイズ（バイト）を取得"""
+    entries = _list_cache_entries(ConversionCacheSettings().conversion_cache_dir)
+    return {'entries': len(entries), 'size_bytes': sum(size for _, size, _ in entries)}
+
+def evict_conversion_cache() -> int:
+    """
+    キャッシュの合計サイズが上限を超えている場合、最終使用日時が古い順に削除
+    キャッシュ済みPDFはドキュメントのPDFとハードリンクで共有しているため、削除してもドキュメントのPDFは残る
+
+    Returns:
+        int: 削除したエントリ数
+    """
+    settings = ConversionCacheSettings()
+    entries = _list_cache_entries(settings.conversion_cache_dir)
+    total_bytes = sum(size for _, size, _ in entries)
+    if total_bytes <= settings.conversion_cache_max_bytes:
+        return 0
+
+    removed = 0
+    for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+        if total_bytes <= settings.conversion_cache_max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue  # 他のプロセスが削除した場合など
+        if os.path.exists(path + USED_MARKER_SUFFIX):
+            os.remove(path + USED_MARKER_SUFFIX)
+        total_bytes -= size
+        removed += 1
+
+    logger.info(f"Evicted {removed} conversion cache entries")
+    return removed
+
+def _get_cache_path(cache_key: str, ext: str) -> str:
+    cache_dir = ConversionCacheSettings().conversion_cache_dir
+    return os.path.join(cache_dir, cache_key[:2], f"{cache_key}.{ext}")
+
+def _list_cache_entries(cache_dir: str) -> list:
+    """キャッシュファイルの(パス, サイズ, 最終使用日時)の一覧"""
+    entries = []
+    if not os.path.isdir(cache_dir):
+        return entries
+    for dir_path, _, file_names in os.walk(cache_dir):
+        for file_name in file_names:
+            if file_name.endswith(('.tmp', USED_MARKER_SUFFIX)):
+                continue
+            path = os.path.join(dir_path, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            last_used = stat.st_mtime
+            if file_name.endswith('.pdf'):
+                try:
+                    last_used = os.stat(path + USED_MARKER_SUFFIX).st_mtime
+                except OSError:
+                    pass  # 印ファイルを作成する前の場合は登録日時を使用
+            entries.append((path, stat.st_size, last_used))
+    return entries
+
+def _link_replace(source_path: str, dest_path: str) -> None:
+    """dest_pathをsource_pathへのハードリンクで置き換える"""
+    temp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(source_path, temp_path)
+        os.replace(temp_path, dest_path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def _touch(path: str) -> None:
+    """
+    最終使用日時を更新（LRUの削除順に使用）
+    PDFはドキュメントのPDFとハードリンクで実体を共有しており、更新日時を変えると配信時のETagが変わるため、
+    隣に置いた印ファイルの更新日時で記録する
+    """
+    try:
+        if path.endswith('.pdf'):
+            marker_path = path + USED_MARKER_SUFFIX
+            with open(marker_path, 'a'):
+                pass
+            os.utime(marker_path)
+        else:
+            os.utime(path)
+    except OSError:
+        pass
@@ -0,0 +1,209 @@
+import multiprocessing
+import os
+import pickle
+import resource
+import signal
+import threading
+from typing import Any, Callable, List, Optional
+
+from pydantic_settings import BaseSettings
+
+from ..logging_config import setup_logging
+from .failure_service import PermanentError
+
+logger = setup_logging()
+"""
+変換サンドボックスモジュール
+MarkItDownなどによる文書の変換・抽出を再利用可能な子プロセスで実行し、
+ファイルごとのCPU時間・メモリ（アドレス空間）の上限とファイルサイズに応じた実行時間の上限を設ける
+異常な文書で子プロセスが停止・終了しても、ワーカーと他のジョブには影響させない
+子プロセスはforkserverから起動する（並列処理のスレッドを持つワーカーから直接forkすると、
+他のスレッドが保持していたロックを子プロセスが取得できずに停止する場合があるため）
+子プロセスの再利用はワーカープロセスが常駐する WORKER_MODE=warm の場合のみ有効
+（forkモードではジョブごとにプロセスが終了するため、ジョブごとに子プロセスを起動する）
+"""
+
+# forkserverで読み込んでおくモジュール（子プロセスの起動ごとに変換器を読み込み直さない）
+SANDBOX_PRELOAD_MODULES = [__name__, 'app.services.file_converter']
+
+class SandboxSettings(BaseSettings):
+    """変換サンドボックス設定クラス"""
+    conversion_sandbox_enabled: bool = True  # falseの場合はワーカープロセス内で直接変換
+    conversion_sandbox_idle_processes: int = 2  # ワーカープロセスごとに待機させておく子プロセス数（warmモードのみ）
+    conversion_sandbox_max_tasks: int = 100  # 子プロセスを作り直すまでの変換数（メモリの断片化・リーク対策）
+    conversion_sandbox_cpu_seconds: int = 600  # ファイルごとのCPU時間の上限（秒）
+    conversion_sandbox_memory_mb: int = 4096  # 子プロセスのアドレス空間の上限（MB、0で無制限）
+    # 実行時間の上限（秒）: 基準値 + ファイルサイズ(MB) × 係数（上限あり）
+    conversion_sandbox_base_timeout: float = 60
+    conversion_sandbox_timeout_per_mb: float = 10
+    conversion_sandbox_max_timeout: float = 20 * 60  # ジョブのタイムアウト(30分)より短くする
+
+class _SandboxProcess:
+    """変換を実行する子プロセス（パイプで1件ずつ依頼する）"""
+
+    def __init__(self, memory_limit_bytes: int):
+        context = _get_context()
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_sandbox_main,
+            args=(child_conn, memory_limit_bytes),
+            name='conversion-sandbox',
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def kill(self) -> Optional[int]:
+        """子プロセスを停止し、終了コードを返す"""
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+        return self.process.exitcode
+
+def _get_context():
+    """子プロセスの起動に使うforkserverのコンテキスト（起動前に読み込むモジュールを設定）"""
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(SANDBOX_PRELOAD_MODULES)
+    return context
+
+_idle_processes: List[_SandboxProcess] = []
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+def run_in_sandbox(func: Callable[..., Any], file_path: str, *args) -> Any:
+    """
+    変換関数を子プロセスで実行して結果を返す
+
+    Args:
+        func: 変換関数（第1引数にファイルパスを受け取り、pickle可能な結果を返す）
+        file_path: 変換するファイルのパス（実行時間の上限の計算にも使用）
+        *args: 変換関数に渡す追加の引数
+
+    Returns:
+        Any: 変換関数の戻り値
+
+    Raises:
+        PermanentError: 実行時間・CPU時間・メモリの上限を超えた場合や、子プロセスが異常終了した場合
+        Exception: 変換関数が送出した例外
+    """
+    settings = SandboxSettings()
+    if not settings.conversion_sandbox_enabled:
+        return func(file_path, *args)
+
+    timeout = _get_timeout(file_path, settings)
+    file_name = os.path.basename(file_path)
+    sandbox = _checkout_process(settings)
+    reusable = False
+    try:
+        sandbox.conn.send((func, (file_path,) + args, settings.conversion_sandbox_cpu_seconds))
+        if not sandbox.conn.poll(timeout):
+            logger.warning(f"Conversion of {file_name} did not finish in {timeout:.0f}s, killing sandbox process")
+            raise PermanentError(f"Conversion of {file_name} timed out after {timeout:.0f}s", cause='conversion_timeout')
+        try:
+            succeeded, value = sandbox.conn.recv()
+        except EOFError:
+            exitcode = sandbox.kill()
+            raise _build_exit_error(file_name, exitcode, settings)
+        sandbox.tasks += 1
+        # メモリ不足になった子プロセスは状態が不定のため再利用しない
+        reusable = succeeded or not isinstance(value, MemoryError)
+    finally:
+        if reusable:
+            _release_process(sandbox, settings)
+        else:
+            sandbox.kill()
+
+    if succeeded:
+        return value
+    if isinstance(value, MemoryError):
+        raise PermanentError(
+            f"Conversion of {file_name} exceeded the memory limit ({settings.conversion_sandbox_memory_mb}MB)",
+            cause='conversion_memory_limit'
+        )
+    raise value
+
+def _get_timeout(file_path: str, settings: SandboxSettings) -> float:
+    """ファイルサイズに応じた実行時間の上限"""
+    size_mb = os.path.getsize(file_path) / (1024 * 1024)
+    return min(settings.conversion_sandbox_base_timeout + size_mb * settings.conversion_sandbox_timeout_per_mb,
+               settings.conversion_sandbox_max_timeout)
+
+def _checkout_process(settings: SandboxSettings) -> _SandboxProcess:
+    """待機中の子プロセスを取得（なければ起動）"""
+    global _pool_pid
+    with _pool_lock:
+        # fork後のプロセス（RQのジョブ実行プロセスなど）では親プロセスの子プロセスを使わない
+        if _pool_pid != os.getpid():
+            _idle_processes.clear()
+            _pool_pid = os.getpid()
+        while _idle_processes:
+            sandbox = _idle_processes.pop()
+            if sandbox.process.is_alive():
+                return sandbox
+            sandbox.kill()
+    return _SandboxProcess(settings.conversion_sandbox_memory_mb * 1024 * 1024)
+
+def _release_process(sandbox: _SandboxProcess, settings: SandboxSettings) -> None:
+    """子プロセスを待機状態に戻す（変換数の上限に達した場合や待機数を超える場合は停止）"""
+    with _pool_lock:
+        if (sandbox.tasks < settings.conversion_sandbox_max_tasks
+                and len(_idle_processes) < settings.conversion_sandbox_idle_processes):
+            _idle_processes.append(sandbox)
+            return
+    sandbox.kill()
+
+def _build_exit_error(file_name: str, exitcode: Optional[int], settings: SandboxSettings) -> PermanentError:
+    """子プロセスの終了コードから失敗原因を判定"""
+    if exitcode == -signal.SIGXCPU:
+        return PermanentError(
+            f"Conversion of {file_name} exceeded the CPU time limit ({settings.conversion_sandbox_cpu_seconds}s)",
+            cause='conversion_cpu_limit'
+        )
+    return PermanentError(
+        f"Conversion process for {file_name} exited unexpectedly (exit code {exitcode})",
+        cause='conversion_crashed'
+    )
+
+def _sandbox_main(conn, memory_limit_bytes: int) -> None:
+    """子プロセスの本体: パイプから変換の依頼を受け取り、結果を返す"""
+    # 停止はワーカー（親プロセス）から行うため、端末からの割り込みは無視する
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # CPU時間の上限で停止した場合にコアダンプを出力しない
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    if memory_limit_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+
+    while True:
+        try:
+            func, args, cpu_seconds = conn.recv()
+        except (EOFError, OSError):
+            return  # 親プロセスの終了
+
+        # CPU時間の上限はプロセス全体の累計のため、これまでの使用時間に加算して設定する
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        _, hard_limit = resource.getrlimit(resource.RLIMIT_CPU)
+        soft_limit = int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+        if hard_limit != resource.RLIM_INFINITY:
+            soft_limit = min(soft_limit, hard_limit)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft_limit, hard_limit))
+
+        try:
+            result = (True, func(*args))
+        except Exception as e:
+            result = (False, e if _is_picklable(e) else RuntimeError(f"{type(e).__name__}: {str(e)}"))
+        try:
+            conn.send(result)
+        except Exception as e:
+            # 結果をpickleできない場合
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {str(e)}")))
+
+def _is_picklable(exc: Exception) -> bool:
+    """例外を親プロセスで復元できるか"""
+    try:
+        pickle.loads(pickle.dumps(exc))
+    except Exception:
+        return False
+    return True
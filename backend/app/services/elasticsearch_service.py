@@ -1,5 +1,5 @@
 from elasticsearch import Elasticsearch, AsyncElasticsearch
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from pydantic_settings import BaseSettings
 import datetime
 import logging
@@ -89,6 +89,7 @@ class ESService:
                                 }
                             },
                             "updated_at": { "type": "date" },
+                            "revision": { "type": "long" },
                             "pdf_name": { "type": "text" },
                             "file_path": { "type": "text" },
                             "sort_name": {
@@ -112,7 +113,7 @@ class ESService:
 
     def save_document(self, doc_id: str, url: str, file_name: str, 
                                   sections: list, pdf_name: str = None, 
-                                  file_path: str = None) -> None:
+                                  file_path: str = None, revision: int = None) -> None:
         """セクション分割済みのドキュメントを保存（同じURLの場合は更新）"""
         doc_body = {
             "url": url,
@@ -134,6 +135,12 @@ class ESService:
                 "file_path": file_path
             })
         
+        # SVNの最終変更リビジョンがあれば追加（再インポート時の変更判定に使用）
+        if revision is not None:
+            doc_body.update({
+                "revision": revision
+            })
+        
         # 同じURLのドキュメントが存在するか確認
         if self.es.exists(index=self.index_name, id=doc_id):
             # 更新処理
@@ -316,6 +323,48 @@ class ESService:
         )
         logging.info(f"Updated PDF info for document {doc_id}: {pdf_name}")
 
+    def get_document_revisions(self, doc_ids: list) -> Dict[str, int]:
+        """指定されたIDのドキュメントに保存されているSVNリビジョンを取得
+        
+        Args:
+            doc_ids: ドキュメントIDのリスト
+            
+        Returns:
+            dict: ドキュメントID -> リビジョン（未登録・リビジョンなしのドキュメントは含まない）
+        """
+        revisions = {}
+        chunk_size = 1000
+        for i in range(0, len(doc_ids), chunk_size):
+            response = self.es.mget(
+                index=self.index_name,
+                ids=doc_ids[i:i + chunk_size],
+                _source=["revision"]
+            )
+            for doc in response["docs"]:
+                if doc.get("found") and doc["_source"].get("revision") is not None:
+                    revisions[doc["_id"]] = doc["_source"]["revision"]
+        return revisions
+
+    def get_document_ids_by_url_prefix(self, url_prefix: str) -> list:
+        """URLが指定の文字列で始まるドキュメントのIDリストを取得
+        
+        Args:
+            url_prefix: URLの先頭部分（フォルダURL + "/"）
+        """
+        result = self.es.search(
+            index=self.index_name,
+            body={
+                "_source": False,
+                "query": {
+                    "prefix": {
+                        "url": url_prefix
+                    }
+                },
+                "size": 10000  # 十分大きな数を指定して全件取得
+            }
+        )
+        return [hit["_id"] for hit in result["hits"]["hits"]]
+
     def delete_documents(self, doc_ids: list) -> Dict[str, Any]:
         """指定されたIDのドキュメントを削除
         
@@ -361,3 +410,12 @@ class ESService:
         except Exception as e:
             logging.error(f"Failed to delete documents: {e}")
             raise
+
+_shared_service: Optional[ESService] = None
+
+def get_es_service() -> ESService:
+    """プロセス内で共有するESServiceを取得（ワーカーでクライアントを使い回す）"""
+    global _shared_service
+    if _shared_service is None:
+        _shared_service = ESService()
+    return _shared_service
@@ -0,0 +1,377 @@
+import json
+import pickle
+import subprocess
+import time
+import uuid
+from typing import Optional, Tuple, List, Dict, Any, Iterator
+
+import redis
+import requests
+from elasticsearch import ApiError, ConnectionError as ESConnectionError, ConnectionTimeout as ESConnectionTimeout
+from rq import get_current_job
+from rq.exceptions import ShutDownImminentException
+from rq.timeouts import JobTimeoutException
+from rq.worker import StopRequested
+
+from ..logging_config import setup_logging
+from .queue_service import get_redis_connection, enqueue_replay_task
+from .progress_service import update_progress, record_result
+from .svn_dav_client import SvnDavError
+
+logger = setup_logging()
+"""
+タスク失敗処理サービスモジュール
+失敗を一時的(transient)/恒久的(permanent)に分類し、
+再試行の可否判定・原因別カウンタ・デッドレターキューを管理する
+"""
+
+# 再試行で回復が見込めるHTTPステータス
+TRANSIENT_HTTP_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+# 再試行で回復が見込めるSVNエラーコード（接続断・タイムアウトなど）
+SVN_TRANSIENT_ERROR_CODES = (
+    'E000104',  # Connection reset by peer
+    'E000110',  # Connection timed out
+    'E000111',  # Connection refused
+    'E120108',  # The server unexpectedly closed the connection
+    'E170013',  # Unable to connect to a repository
+    'E175002',  # Unexpected HTTP status / connection failure
+    'E175012',  # Connection timed out
+    'E670008',  # nodename nor servname provided, or not known
+)
+
+# ワーカーがジョブ自体を中断するための例外（個々の処理の失敗として扱わずに再送出する）
+WORKER_INTERRUPTIONS = (JobTimeoutException, ShutDownImminentException, StopRequested)
+
+DEAD_LETTER_KEY = 'dead_letter'  # エントリIDを失敗日時順に保持するSorted Set
+DEAD_LETTER_ENTRIES_KEY = 'dead_letter:entries'  # エントリID -> エントリ内容(pickle)
+FAILURE_COUNTERS_KEY = 'failure_counters'  # 原因別の失敗回数
+
+class TransientError(Exception):
+    """再試行で回復が見込める失敗"""
+    def __init__(self, message: str, cause: str = 'transient'):
+        super().__init__(message)
+        self.cause = cause
+
+class PermanentError(Exception):
+    """再試行しても回復しない失敗"""
+    def __init__(self, message: str, cause: str = 'permanent'):
+        super().__init__(message)
+        self.cause = cause
+
+def classify_failure(exc: Exception) -> Tuple[bool, str]:
+    """
+    例外を一時的/恒久的な失敗に分類
+
+    Args:
+        exc: 発生した例外
+
+    Returns:
+        Tuple[bool, str]: (一時的な失敗かどうか, 失敗原因)
+    """
+    if isinstance(exc, TransientError):
+        return True, exc.cause
+    if isinstance(exc, PermanentError):
+        return False, exc.cause
+
+    # SVNへのHTTP(WebDAV)アクセス
+    if isinstance(exc, SvnDavError):
+        if exc.status is None or exc.status in TRANSIENT_HTTP_STATUSES:
+            return True, 'svn_unavailable'
+        return False, 'svn_error'
+
+    # 変換サーバー(unoserver)などへのHTTP通信
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True, 'conversion_server_unavailable'
+    if isinstance(exc, requests.HTTPError):
+        status = exc.response.status_code if exc.response is not None else None
+        if status in TRANSIENT_HTTP_STATUSES:
+            return True, 'conversion_server_unavailable'
+        return False, 'conversion_rejected'
+
+    # Elasticsearch
+    if isinstance(exc, (ESConnectionError, ESConnectionTimeout)):
+        return True, 'elasticsearch_unavailable'
+    if isinstance(exc, ApiError):
+        if exc.status_code == 429:
+            return True, 'elasticsearch_throttled'
+        if exc.status_code in TRANSIENT_HTTP_STATUSES:
+            return True, 'elasticsearch_unavailable'
+        return False, 'elasticsearch_rejected'
+
+    # Redis
+    if isinstance(exc, (redis.ConnectionError, redis.TimeoutError)):
+        return True, 'redis_unavailable'
+
+    # SVNコマンド
+    if isinstance(exc, subprocess.CalledProcessError):
+        stderr = exc.stderr or ''
+        if isinstance(stderr, bytes):
+            stderr = stderr.decode('utf-8', errors='replace')
+        if any(code in stderr for code in SVN_TRANSIENT_ERROR_CODES):
+            return True, 'svn_unavailable'
+        return False, 'svn_error'
+
+    if isinstance(exc, subprocess.TimeoutExpired):
+        return True, 'svn_unavailable'
+
+    # ジョブタイムアウトは再実行しても同じ結果になる可能性が高い
+    if isinstance(exc, JobTimeoutException):
+        return False, 'job_timeout'
+
+    return False, 'processing_error'
+
+def handle_task_failure(
+    exc: Exception,
+    parent_job_id: Optional[str] = None,
+    progress_kind: Optional[str] = 'file'
+) -> bool:
+    """
+    RQタスク内で発生した失敗を分類・記録し、再試行されるかを返す
+    呼び出し元はこの関数の後に例外を再送出すること（RQがジョブを失敗/再試行扱いにする）
+
+    Args:
+        exc: 発生した例外
+        parent_job_id: 親ジョブID（進捗集計用）
+        progress_kind: 進捗上の種別（'file': ファイル, 'folder': フォルダ探索, None: 集計対象外）
+
+    Returns:
+        bool: RQにより再試行される場合True
+    """
+    transient, cause = classify_failure(exc)
+    record_failure_cause(cause)
+
+    job = get_current_job()
+    if job is None:
+        return False
+
+    if not transient:
+        # 恒久的な失敗は残り再試行回数を0にしてRQの再試行を抑止する
+        job.retries_left = 0
+
+    will_retry = bool(job.retries_left)
+    if will_retry:
+        logger.warning(f"Transient failure ({cause}) in job {job.id}, will retry: {str(exc)}")
+        return True
+
+    # 最終的な失敗: 進捗に反映してデッドレターキューへ
+    _record_final_progress(parent_job_id, progress_kind)
+    add_dead_letter(
+        func_name=job.func_name,
+        args=job.args,
+        kwargs=job.kwargs,
+        queue_name=job.origin,
+        timeout=job.timeout,
+        cause=cause,
+        error=str(exc),
+        transient=transient,
+        parent_job_id=parent_job_id,
+        progress_kind=progress_kind,
+        job_id=job.id
+    )
+    return False
+
+def _record_final_progress(parent_job_id: Optional[str], progress_kind: Optional[str]) -> None:
+    if progress_kind == 'file':
+        record_result(parent_job_id, 'failed')
+    elif progress_kind == 'folder':
+        update_progress(parent_job_id, exploring=-1)
+
+def record_failure_cause(cause: str) -> None:
+    """原因別の失敗回数を加算"""
+    try:
+        get_redis_connection().hincrby(FAILURE_COUNTERS_KEY, cause, 1)
+    except Exception as e:
+        logger.warning(f"Failed to record failure cause {cause}: {str(e)}")
+
+def get_failure_counts() -> Dict[str, int]:
+    """原因別の失敗回数を取得"""
+    raw = get_redis_connection().hgetall(FAILURE_COUNTERS_KEY)
+    return {cause.decode('utf-8'): int(count) for cause, count in raw.items()}
+
+def add_dead_letter(
+    func_name: str,
+    args: tuple,
+    kwargs: dict,
+    queue_name: str,
+    cause: str,
+    error: str,
+    timeout: Optional[int] = None,
+    transient: bool = False,
+    parent_job_id: Optional[str] = None,
+    progress_kind: Optional[str] = None,
+    job_id: Optional[str] = None
+) -> str:
+    """
+    デッドレターキューにエントリを追加
+    再実行できるよう、関数名と引数をそのまま保持する
+
+    Returns:
+        str: エントリID
+    """
+    entry_id = uuid.uuid4().hex
+    failed_at = time.time()
+    entry = {
+        'id': entry_id,
+        'func_name': func_name,
+        'args': tuple(args),
+        'kwargs': dict(kwargs or {}),
+        'queue': queue_name,
+        'timeout': timeout,
+        'cause': cause,
+        'error': error,
+        'transient': transient,
+        'parent_job_id': parent_job_id,
+        'progress_kind': progress_kind,
+        'job_id': job_id,
+        'failed_at': failed_at
+    }
+
+    pipe = get_redis_connection().pipeline(transaction=True)
+    pipe.hset(DEAD_LETTER_ENTRIES_KEY, entry_id, pickle.dumps(entry))
+    pipe.zadd(DEAD_LETTER_KEY, {entry_id: failed_at})
+    pipe.execute()
+
+    logger.error(f"Moved to dead letter queue ({cause}): {func_name} {_describe_first_arg(entry['args'])}")
+    return entry_id
+
+def list_dead_letters(limit: int = 100, offset: int = 0) -> Dict[str, Any]:
+    """
+    デッドレターキューのエントリ一覧を取得（新しい順）
+
+    Args:
+        limit: 取得件数
+        offset: 取得開始位置
+
+    Returns:
+        dict: 総件数とエントリ一覧
+    """
+    redis_conn = get_redis_connection()
+    total = redis_conn.zcard(DEAD_LETTER_KEY)
+    entry_ids = redis_conn.zrevrange(DEAD_LETTER_KEY, offset, offset + limit - 1)
+    raw_entries = redis_conn.hmget(DEAD_LETTER_ENTRIES_KEY, entry_ids) if entry_ids else []
+
+    entries = []
+    for raw in raw_entries:
+        if raw is None:
+            continue
+        entry = pickle.loads(raw)
+        entries.append({
+            'id': entry['id'],
+            'function': entry['func_name'],
+            'queue': entry['queue'],
+            'first_arg': _describe_first_arg(entry['args']),
+            'cause': entry['cause'],
+            'error': entry['error'],
+            'transient': entry['transient'],
+            'parent_job_id': entry['parent_job_id'],
+            'job_id': entry['job_id'],
+            'failed_at': entry['failed_at']
+        })
+
+    return {'total': total, 'entries': entries}
+
+def iter_dead_letter_args(func_name: str) -> Iterator[tuple]:
+    """
+    デッドレターキューにある指定タスクのエントリの引数を列挙
+    （再実行に必要なファイルを定期メンテナンスで削除しないために使用する）
+
+    Args:
+        func_name: タスクの関数名
+
+    Yields:
+        tuple: エントリの引数
+    """
+    for _, raw in get_redis_connection().hscan_iter(DEAD_LETTER_ENTRIES_KEY):
+        entry = pickle.loads(raw)
+        if entry['func_name'] == func_name:
+            yield entry['args']
+
+def replay_dead_letters(entry_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    デッドレターキューのエントリを再実行キューに戻す
+
+    Args:
+        entry_ids: 再実行するエントリIDのリスト（未指定の場合は全件）
+
+    Returns:
+        dict: 再実行件数とエラー
+    """
+    redis_conn = get_redis_connection()
+    if not entry_ids:
+        entry_ids = [entry_id.decode('utf-8') for entry_id in redis_conn.zrange(DEAD_LETTER_KEY, 0, -1)]
+
+    replayed = 0
+    errors = []
+    for entry_id in entry_ids:
+        raw = redis_conn.hget(DEAD_LETTER_ENTRIES_KEY, entry_id)
+        if raw is None:
+            errors.append({'id': entry_id, 'error': 'Entry not found'})
+            continue
+
+        entry = pickle.loads(raw)
+        try:
+            job = enqueue_replay_task(
+                entry['func_name'],
+                entry['args'],
+                entry['kwargs'],
+                entry['queue'],
+                entry['timeout'],
+                entry['parent_job_id']
+            )
+        except Exception as e:
+            errors.append({'id': entry_id, 'error': str(e)})
+            continue
+
+        # 進捗を「失敗」から「処理待ち」に戻す（同じファイルを取り込み中で投入しなかった場合はスキップ扱い）
+        if entry['progress_kind'] == 'file' and job is None:
+            update_progress(entry['parent_job_id'], failed=-1, skipped=1)
+        elif entry['progress_kind'] == 'file':
+            update_progress(entry['parent_job_id'], failed=-1, queued=1)
+        elif entry['progress_kind'] == 'folder':
+            update_progress(entry['parent_job_id'], exploring=1)
+
+        _remove_dead_letter(redis_conn, entry_id)
+        replayed += 1
+
+    logger.info(f"Replayed {replayed} dead letter entries, errors: {len(errors)}")
+    return {'replayed': replayed, 'errors': errors}
+
+def delete_dead_letters(entry_ids: Optional[List[str]] = None) -> int:
+    """
+    デッドレターキューのエントリを削除
+
+    Args:
+        entry_ids: 削除するエントリIDのリスト（未指定の場合は全件）
+
+    Returns:
+        int: 削除件数
+    """
+    redis_conn = get_redis_connection()
+    if not entry_ids:
+        deleted = redis_conn.zcard(DEAD_LETTER_KEY)
+        redis_conn.delete(DEAD_LETTER_KEY, DEAD_LETTER_ENTRIES_KEY)
+        return deleted
+
+    deleted = 0
+    for entry_id in entry_ids:
+        deleted += _remove_dead_letter(redis_conn, entry_id)
+    return deleted
+
+def _remove_dead_letter(redis_conn: redis.Redis, entry_id: str) -> int:
+    pipe = redis_conn.pipeline(transaction=True)
+    pipe.zrem(DEAD_LETTER_KEY, entry_id)
+    pipe.hdel(DEAD_LETTER_ENTRIES_KEY, entry_id)
+    removed, _ = pipe.execute()
+    return removed
+
+def _describe_first_arg(args: tuple) -> Optional[str]:
+    """一覧表示用に最初の引数を文字列化（バイト列やリストは要約する）"""
+    if not args:
+        return None
+    first_arg = args[0]
+    if isinstance(first_arg, (bytes, bytearray)):
+        return f"<{len(first_arg)} bytes>"
+    if isinstance(first_arg, list):
+        return json.dumps(first_arg[:3], default=str) + (f" ... ({len(first_arg)} items)" if len(first_arg) > 3 else "")
+    return str(first_arg)
@@ -1,11 +1,44 @@
 from markitdown import MarkItDown
+from openpyxl import load_workbook
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LTTextContainer
+from pydantic_settings import BaseSettings
+from importlib import metadata
+from typing import Iterator, List, Dict, Set, Tuple
 import re
 import os
-import requests
+import shutil
+import uuid
+
+from .unoserver_client import convert_file
 
 CONVERTIBLE_EXTS = ['docx', 'pptx', 'xlsx', 'xls', 'xlsm']
 PDF_CONVERTIBLE_EXTS = ['xlsx', 'xls', 'xlsb', 'xlsm', 'docx', 'doc']
 OLD_WORD_EXTS = ['doc']
+PDF_EXTS = ['pdf']
+SPREADSHEET_EXTS = ['xlsx', 'xlsm']  # 読み取り専用モードで行ごとに読み込む形式（xlsはMarkItDownで変換）
+TABLE_SEPARATOR_CHARS = frozenset('-:| ')  # 表の区切り行（|---|形式）に使われる文字
+PDF_STORAGE_DIR = "/var/lib/pdf_storage"  # PDF保存用のDockerボリューム
+# 変換・クリーンアップ処理を変更した場合は上げる（変換結果キャッシュを無効化するため）
+CONVERTER_VERSION = "1"
+
+def get_converter_version() -> str:
+    """変換結果キャッシュのキーに含める変換処理のバージョン（MarkItDownのバージョンを含む）"""
+    try:
+        markitdown_version = metadata.version('markitdown')
+    except metadata.PackageNotFoundError:
+        markitdown_version = 'unknown'
+    return f"{CONVERTER_VERSION}-{markitdown_version}"
+
+class FileConverterSettings(BaseSettings):
+    """ファイル変換設定クラス"""
+    pdf_max_page_chars: int = 20000  # PDFから抽出する1ページあたりの最大文字数
+    # Excelの1セクションあたりの行数（0でシートごとに1セクション）
+    # セクションを作成するまで行を保持するため、0の場合は大きなシートほどメモリを消費する
+    spreadsheet_rows_per_section: int = 1000
+    spreadsheet_max_rows: int = 100000  # Excelのシートごとに読み込む最大行数
+    spreadsheet_max_columns: int = 256  # Excelのシートごとに読み込む最大列数
+    spreadsheet_max_cell_chars: int = 1000  # Excelのセルあたりの最大文字数
 
 class FileConverter:
     markitdown = MarkItDown()
@@ -30,28 +63,161 @@ class FileConverter:
         ext = file_name.split('.')[-1].lower() if '.' in file_name else ''
         return ext in PDF_CONVERTIBLE_EXTS
 
+    @classmethod
+    def get_pdf_output_path(cls, file_path: str) -> str:
+        """変換したPDFの保存先パス"""
+        # PDFファイル名はdoc_id(元ファイルのURLから生成したハッシュ値)
+        doc_id = os.path.splitext(os.path.basename(file_path))[0]
+        return os.path.join(PDF_STORAGE_DIR, f"{doc_id}.pdf")
+
     @classmethod
     def convert_to_pdf_and_save(cls, file_path: str) -> str:
         """OfficeファイルをPDFに変換して保存"""
         # PDF保存ディレクトリが存在しない場合は作成
-        pdf_dir = "/var/lib/pdf_storage" # PDF保存用のDockerボリューム
-        os.makedirs(pdf_dir, exist_ok=True)
-        # PDFファイル名はdoc_id(元ファイルのURLから生成したハッシュ値)
-        doc_id = os.path.splitext(os.path.basename(file_path))[0]
-        output_file_path = os.path.join(pdf_dir, f"{doc_id}.pdf")
-        
-        with open(file_path, 'rb') as f:
-            response = requests.post(
-                'http://unoserver:2004/request',
-                files={'file': f},
-                data={'convert-to': 'pdf'},
-                stream=True
-            )
-            response.raise_for_status()
-            with open(output_file_path, 'wb') as out_f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    out_f.write(chunk)
+        os.makedirs(PDF_STORAGE_DIR, exist_ok=True)
+        output_file_path = cls.get_pdf_output_path(file_path)
+        
+        return convert_file(file_path, 'pdf', output_file_path)
+
+    @classmethod
+    def is_pdf(cls, file_name: str) -> bool:
+        """PDFファイルか判定"""
+        ext = file_name.split('.')[-1].lower() if '.' in file_name else ''
+        return ext in PDF_EXTS
 
+    @classmethod
+    def extract_pdf_sections(cls, file_path: str) -> List[Dict[str, str]]:
+        """PDFのテキストをページごとのセクションとして抽出（1ページずつ読み込み、ページあたりの文字数に上限を設ける）"""
+        max_chars = FileConverterSettings().pdf_max_page_chars
+        sections = []
+        for page_number, page in enumerate(extract_pages(file_path), start=1):
+            texts = []
+            length = 0
+            for element in page:
+                if not isinstance(element, LTTextContainer):
+                    continue
+                text = element.get_text()
+                texts.append(text)
+                length += len(text)
+                if length >= max_chars:
+                    break
+            content = re.sub(r'\n\s*\n', '\n\n', ''.join(texts)).strip()[:max_chars]
+            # テキストのないページ（画像のみなど）はセクションにしない
+            if content:
+                sections.append({
+                    "title": f"{page_number}ページ",
+                    "content": content
+                })
+        return sections
+
+    @classmethod
+    def is_spreadsheet(cls, file_name: str) -> bool:
+        """行ごとに読み込むExcelファイルか判定"""
+        ext = file_name.split('.')[-1].lower() if '.' in file_name else ''
+        return ext in SPREADSHEET_EXTS
+
+    @classmethod
+    def extract_spreadsheet_sections(cls, file_path: str) -> List[Dict[str, str]]:
+        """
+        Excelファイルをシートごとのセクション（マークダウンの表）として抽出
+        ブック全体を読み込まないよう読み取り専用モードで1行ずつ読み込み、空白の行・列を除く
+        """
+        settings = FileConverterSettings()
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            sections = []
+            for sheet in workbook.worksheets:
+                sections.extend(cls._extract_sheet_sections(sheet, settings))
+            return sections
+        finally:
+            workbook.close()
+
+    @classmethod
+    def _extract_sheet_sections(cls, sheet, settings: FileConverterSettings) -> List[Dict[str, str]]:
+        """
+        シートを1つまたは指定行数ごとのセクションに分割（先頭の行を各セクションの表のヘッダとする）
+        空白でない列は読み込みながら記録し、セクションを作成する際に行を走査し直さない
+        """
+        rows_per_section = settings.spreadsheet_rows_per_section
+        sections = []
+        header = None
+        header_columns = set()
+        rows = []
+        filled_columns = set()
+        first_row_number = None
+        last_row_number = None
+        for row_number, values in enumerate(sheet.iter_rows(
+            max_row=settings.spreadsheet_max_rows,
+            max_col=settings.spreadsheet_max_columns,
+            values_only=True
+        ), start=1):
+            cells = [cls._format_cell(value, settings.spreadsheet_max_cell_chars) for value in values]
+            # 空白の行は読み飛ばす
+            if not any(cells):
+                continue
+            row_columns = {col_idx for col_idx, cell in enumerate(cells) if cell}
+            if header is None:
+                header = cells
+                header_columns = row_columns
+                filled_columns = set(header_columns)
+                continue
+            if first_row_number is None:
+                first_row_number = row_number
+            last_row_number = row_number
+            rows.append(cells)
+            filled_columns |= row_columns
+            if rows_per_section and len(rows) >= rows_per_section:
+                title = f"{sheet.title} ({first_row_number}-{last_row_number}行目)"
+                sections.append({"title": title, "content": cls._build_markdown_table(header, rows, filled_columns)})
+                rows = []
+                filled_columns = set(header_columns)
+                first_row_number = None
+
+        if header is None:
+            return sections  # 空白のシート
+        if rows or not sections:
+            title = sheet.title
+            if rows_per_section and rows:
+                title = f"{sheet.title} ({first_row_number}-{last_row_number}行目)"
+            sections.append({"title": title, "content": cls._build_markdown_table(header, rows, filled_columns)})
+        return sections
+
+    @classmethod
+    def _format_cell(cls, value, max_chars: int) -> str:
+        """セルの値を表のセルとして出力する文字列に変換（改行・連続する空白は1つの空白にする）"""
+        if value is None:
+            return ''
+        text = ' '.join(str(value).split())[:max_chars]
+        return text.replace('|', '\\|')
+
+    @classmethod
+    def _build_markdown_table(cls, header: List[str], rows: List[List[str]], filled_columns: Set[int]) -> str:
+        """
+        ヘッダとデータ行からマークダウンの表を作成
+        filled_columns: ヘッダ・データ行のいずれかが空白でない列（すべて空白の列は表に含めない）
+        """
+        columns = sorted(filled_columns)
+
+        def format_row(row: List[str]) -> str:
+            return "| " + " | ".join(row[col_idx] if col_idx < len(row) else '' for col_idx in columns) + " |"
+
+        lines = [format_row(header), "| " + " | ".join(["---"] * len(columns)) + " |"]
+        lines.extend(format_row(row) for row in rows)
+        return "\n".join(lines)
+
+    @classmethod
+    def save_pdf(cls, file_path: str) -> str:
+        """PDFファイルを変換せずにPDF保存ディレクトリに保存"""
+        os.makedirs(PDF_STORAGE_DIR, exist_ok=True)
+        output_file_path = cls.get_pdf_output_path(file_path)
+        # 保存済みのPDFは変換結果キャッシュとハードリンクで共有している場合があるため、別ファイルから置き換える
+        temp_path = f"{output_file_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            shutil.copyfile(file_path, temp_path)
+            os.replace(temp_path, output_file_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
         return output_file_path
 
     @classmethod
@@ -61,40 +227,37 @@ class FileConverter:
         return ext in OLD_WORD_EXTS
 
     @classmethod
-    def convert_to_valid_office_file(cls, file_path: str) -> None:
+    def get_valid_office_file_path(cls, file_path: str) -> str:
+        """古い形式のOfficeファイルの変換先パス（元ファイルと同じディレクトリ）"""
+        return os.path.splitext(file_path)[0] + '.docx'
+
+    @classmethod
+    def convert_to_valid_office_file(cls, file_path: str) -> str:
         """使用できるOfficeファイル形式に変換"""
 
         # .docを.docxに変換
-        new_file_path = os.path.splitext(file_path)[0] + '.docx'
-        with open(file_path, 'rb') as f:
-            response = requests.post(
-                'http://unoserver:2004/request',
-                files={'file': f},
-                data={'convert-to': 'docx'},
-                stream=True
-            )
-            response.raise_for_status()
-            with open(new_file_path, 'wb') as out_f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    out_f.write(chunk)
-
-        return new_file_path
+        new_file_path = cls.get_valid_office_file_path(file_path)
+        # 変換済みの場合（再試行時など）は再変換しない（変換結果は完成後に置き換えるため途中のファイルは残らない）
+        if os.path.exists(new_file_path):
+            return new_file_path
+        return convert_file(file_path, 'docx', new_file_path)
 
     @classmethod
     def _clean_markdown_content(cls, content: str) -> str:
         """マークダウンコンテンツをクリーンアップし、表を抽出"""
-        # まず表を抽出して個別に処理
-        tables = cls._extract_tables(content)
-        
-        # 抽出した表を修正して元のコンテンツに反映
-        if tables:
-            # 表を修正（後ろから処理して位置情報がずれないように）
-            for table in reversed(tables):
-                cleaned_table = cls._clean_table_data(table)
-                # 修正した表で元のコンテンツを置換
-                start = table['start_pos']
-                end = table['end_pos']
-                content = content[:start] + cleaned_table + content[end:]
+        # 表を修正しながら先頭から順に出力する（表ごとにコンテンツ全体を組み立て直さない）
+        parts = []
+        pos = 0
+        for start, end in cls._iter_table_spans(content):
+            table_content = content[start:end].strip()
+            table_data = cls._parse_markdown_table(table_content)
+            if not table_data:
+                continue
+            parts.append(content[pos:start])
+            parts.append(cls._clean_table_data(table_data))
+            pos = end
+        parts.append(content[pos:])
+        content = ''.join(parts)
         
         # 余分な空白行を削除
         content = re.sub(r'\n\s*\n', '\n\n', content)
@@ -104,27 +267,74 @@ class FileConverter:
         return content
 
     @classmethod
-    def _extract_tables(cls, content: str) -> list:
-        """マークダウンコンテンツから表を抽出"""
-        tables = []
-        
-        # マークダウン表のパターン: ヘッダ行 + 区切り行 + データ行
-        table_pattern = r'(\|.*\|\s*\n\|[-:| ]+\|\s*\n(?:\|.*\|\s*(?:\n|$))*)'
-        matches = re.finditer(table_pattern, content, re.MULTILINE)
-        
-        for match in matches:
-            table_content = match.group(0).strip()
-            table_data = cls._parse_markdown_table(table_content)
-            if table_data:
-                tables.append({
-                    'content': table_content,
-                    'headers': table_data['headers'],
-                    'rows': table_data['rows'],
-                    'start_pos': match.start(),
-                    'end_pos': match.end()
-                })
-        
-        return tables
+    def _iter_table_spans(cls, content: str) -> Iterator[Tuple[int, int]]:
+        """
+        マークダウンコンテンツから表の範囲（開始位置, 終了位置）を行単位の1回の走査で抽出
+        表: ヘッダ行 + 区切り行 + データ行（行の間の空白行と、表の後に続く空白行を含む）
+        """
+        lines = content.split('\n')
+        offsets = []  # 各行の開始位置
+        offset = 0
+        for line in lines:
+            offsets.append(offset)
+            offset += len(line) + 1
+        line_count = len(lines)
+
+        i = 0
+        while i < line_count:
+            line = lines[i]
+            if not cls._is_table_header_line(line):
+                i += 1
+                continue
+            # 区切り行は改行で終わっている必要がある
+            separator = cls._skip_blank_lines(lines, i + 1)
+            if separator >= line_count - 1 or not cls._is_table_separator_line(lines[separator]):
+                i += 1
+                continue
+            # ヘッダ行は行の途中（最初の|）から始まる場合がある
+            start = offsets[i] + line.find('|')
+
+            row = cls._skip_blank_lines(lines, separator + 1)
+            if row == line_count:
+                # 区切り行の後に空白しかない場合は最後の改行までを表とする
+                yield start, offsets[line_count - 1]
+                return
+            end = offsets[row]
+            while row < line_count and cls._is_table_row_line(lines[row]):
+                row = cls._skip_blank_lines(lines, row + 1)
+                end = offsets[row] if row < line_count else len(content)
+            yield start, end
+            i = row
+
+    @classmethod
+    def _skip_blank_lines(cls, lines: List[str], index: int) -> int:
+        """空白のみの行を飛ばした次の行の位置"""
+        while index < len(lines) and not lines[index].strip():
+            index += 1
+        return index
+
+    @classmethod
+    def _is_table_header_line(cls, line: str) -> bool:
+        """表のヘッダ行になりうるか（|で終わり、|を2つ以上含む）"""
+        stripped = line.rstrip()
+        return stripped.endswith('|') and stripped.count('|') >= 2
+
+    @classmethod
+    def _is_table_separator_line(cls, line: str) -> bool:
+        """表の区切り行か（|---|形式、行頭から）"""
+        stripped = line.rstrip()
+        return (
+            len(stripped) >= 3
+            and stripped[0] == '|'
+            and stripped[-1] == '|'
+            and all(char in TABLE_SEPARATOR_CHARS for char in stripped[1:-1])
+        )
+
+    @classmethod
+    def _is_table_row_line(cls, line: str) -> bool:
+        """表のデータ行か（行頭の|から|で終わる）"""
+        stripped = line.rstrip()
+        return line.startswith('|') and len(stripped) >= 2 and stripped.endswith('|')
 
     @classmethod
     def _parse_markdown_table(cls, table_content: str) -> dict:
@@ -187,15 +397,16 @@ class FileConverter:
                 if header_empty and all_rows_empty:
                     empty_columns.append(col_idx)
             
-            # 後ろから削除してインデックスがずれないように
-            for col_idx in reversed(empty_columns):
-                # ヘッダから削除
-                if col_idx < len(cleaned_headers):
-                    cleaned_headers.pop(col_idx)
-                # 各行から削除
-                for row in cleaned_rows:
-                    if col_idx < len(row):
-                        row.pop(col_idx)
+            # ヘッダと各行から空白の列を除く
+            if empty_columns:
+                empty_columns = set(empty_columns)
+                cleaned_headers = [
+                    cell for col_idx, cell in enumerate(cleaned_headers) if col_idx not in empty_columns
+                ]
+                cleaned_rows = [
+                    [cell for col_idx, cell in enumerate(row) if col_idx not in empty_columns]
+                    for row in cleaned_rows
+                ]
         
         # マークダウン表形式に変換
         markdown_table = []
@@ -0,0 +1,115 @@
+import posixpath
+from fnmatch import fnmatchcase
+from typing import Optional, Dict, Any, List, Iterable
+
+from ..logging_config import setup_logging
+from ..models.svn_models import SVNImportRequest
+
+logger = setup_logging()
+"""
+取り込み対象ファイルの絞り込みサービスモジュール
+拡張子・パスのglob・ファイルサイズで判定し、一覧の情報だけで除外できるようにする
+"""
+
+def build_file_filter(
+    file_types: Optional[str] = None,
+    include_patterns: Optional[List[str]] = None,
+    exclude_patterns: Optional[List[str]] = None,
+    max_file_size: Optional[int] = None,
+    root_url: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    絞り込み条件を構築（ジョブの引数として渡せる形式）
+
+    Args:
+        file_types: 取り込む拡張子（カンマ区切り）
+        include_patterns: 取り込むパスのglob（いずれかに一致するもののみ取り込む）
+        exclude_patterns: 除外するパスのglob
+        max_file_size: 取り込む最大ファイルサイズ（バイト）
+        root_url: パスのglobの基準とするURL（SVNインポートの場合）
+
+    Returns:
+        Optional[dict]: 絞り込み条件。条件が無い場合はNone
+    """
+    extensions = sorted({
+        file_type.strip().lstrip('.').lower()
+        for file_type in (file_types or '').split(',')
+        if file_type.strip()
+    })
+    include_patterns = [pattern for pattern in (include_patterns or []) if pattern]
+    exclude_patterns = [pattern for pattern in (exclude_patterns or []) if pattern]
+    if not (extensions or include_patterns or exclude_patterns or max_file_size):
+        return None
+
+    return {
+        "extensions": extensions,
+        "include_patterns": include_patterns,
+        "exclude_patterns": exclude_patterns,
+        "max_file_size": max_file_size or None,
+        "root_url": root_url
+    }
+
+def build_import_filter(request: SVNImportRequest) -> Optional[Dict[str, Any]]:
+    """SVNインポートリクエストの絞り込み条件を構築（パスはインポートしたURLからの相対パス）"""
+    return build_file_filter(
+        request.file_types,
+        request.include_patterns,
+        request.exclude_patterns,
+        request.max_file_size,
+        root_url=request.url
+    )
+
+def is_file_included(path: str, size: Optional[int], file_filter: Optional[Dict[str, Any]]) -> bool:
+    """
+    ファイルが絞り込み条件に一致するか
+    '/'を含まないglobはファイル名、含むglobはパス全体と照合する。サイズが不明な場合はサイズでは除外しない
+
+    Args:
+        path: ファイルのパス（SVNはインポートしたURLからの相対パス、アップロードは絶対パス）
+        size: ファイルサイズ（バイト）
+        file_filter: build_file_filterの結果
+    """
+    if not file_filter:
+        return True
+
+    path = path.replace('\\', '/').lstrip('/')
+    name = posixpath.basename(path)
+
+    extensions = file_filter["extensions"]
+    if extensions and posixpath.splitext(name)[1].lstrip('.').lower() not in extensions:
+        return False
+
+    max_file_size = file_filter["max_file_size"]
+    if max_file_size and size is not None and size > max_file_size:
+        return False
+
+    if file_filter["include_patterns"] and not _matches_any(path, name, file_filter["include_patterns"]):
+        return False
+    if _matches_any(path, name, file_filter["exclude_patterns"]):
+        return False
+    return True
+
+def filter_svn_entries(
+    file_entries: Iterable[Dict[str, Any]],
+    file_filter: Optional[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """SVNのファイル情報(url, size, revision)のうち絞り込み条件に一致するものを返す"""
+    if not file_filter:
+        return list(file_entries)
+    return [
+        entry for entry in file_entries
+        if is_file_included(_relative_svn_path(entry["url"], file_filter["root_url"]), entry.get("size"), file_filter)
+    ]
+
+def _relative_svn_path(url: str, root_url: Optional[str]) -> str:
+    """インポートしたURLからの相対パス（ファイル自体をインポートした場合はファイル名）"""
+    root_url = (root_url or '').rstrip('/')
+    if root_url and url.startswith(root_url + '/'):
+        return url[len(root_url) + 1:]
+    return url.rsplit('/', 1)[-1]
+
+def _matches_any(path: str, name: str, patterns: List[str]) -> bool:
+    return any(
+        fnmatchcase(path, pattern.lstrip('/')) if '/' in pattern else fnmatchcase(name, pattern)
+        for pattern in patterns
+    )
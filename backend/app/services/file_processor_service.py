@@ -1,11 +1,30 @@
 import os
 import re
-from typing import Optional, Dict, Any, List
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Iterator, Callable
+
+from redis.exceptions import LockError
+from rq import get_current_job
 
 from ..logging_config import setup_logging
-from .elasticsearch_service import ESService
+from .elasticsearch_service import get_es_service
 from .file_converter import FileConverter
-from .queue_service import enqueue_pdf_conversion_task
+from .queue_service import enqueue_pdf_conversion_task, get_redis_connection
+from .failure_service import handle_task_failure, TransientError
+from .progress_service import update_progress
+from .content_sniffer import sniff_file, decode_text
+from .conversion_sandbox import run_in_sandbox
+from .pdf_conversion_service import is_lazy_mode, keep_pdf_source, finish_pdf_conversion, fail_pdf_conversion
+from .conversion_cache_service import (
+    get_cache_key,
+    get_cached_markdown,
+    store_markdown,
+    get_cached_sections,
+    store_sections,
+    link_cached_pdf,
+    store_pdf,
+    record_cache_result
+)
 from .utils import url_to_id
 
 logger = setup_logging()
@@ -14,89 +33,142 @@ logger = setup_logging()
 SVNに依存しないファイル操作機能を提供
 """
 
+DOCUMENT_LOCK_PREFIX = 'document_lock'
+DOCUMENT_LOCK_TIMEOUT = 30 * 60  # ロックの最大保持時間（秒、ジョブのタイムアウトに合わせる）
+DOCUMENT_LOCK_WAIT = 30  # ロック取得の最大待ち時間（秒）
+
+@contextmanager
+def document_lock(doc_id: str) -> Iterator[None]:
+    """
+    ドキュメント単位の排他ロック
+    複数のワーカーが同じドキュメントを同時に処理・保存しないようにする
+    待ち時間内に取得できない場合は一時的な失敗として再試行に回す
+    
+    Args:
+        doc_id: ドキュメントID
+    """
+    lock = get_redis_connection().lock(
+        f"{DOCUMENT_LOCK_PREFIX}:{doc_id}",
+        timeout=DOCUMENT_LOCK_TIMEOUT,
+        blocking_timeout=DOCUMENT_LOCK_WAIT
+    )
+    if not lock.acquire():
+        raise TransientError(f"Document {doc_id} is being processed by another worker", cause='document_locked')
+    try:
+        yield
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # タイムアウトで既に失効している場合
+            logger.warning(f"Document lock for {doc_id} expired before release")
+
 def process_file(
     file_path: str,
     file_url: str,
-    stored_file_path: str = None
+    stored_file_path: str = None,
+    revision: Optional[int] = None,
+    parent_job_id: Optional[str] = None
 ) -> bool:
     """
     ファイル処理を実行してElasticsearchに保存
+    失敗時は例外をそのまま送出する（再試行の判定は呼び出し元のタスクで行う）
     
     Args:
         file_path: 処理するファイルのパス（一時ファイル）
         file_url: ファイルのURL（ドキュメントID生成用）
         stored_file_path: 保存されたファイルのパス（オプション）
+        revision: SVNの最終変更リビジョン（オプション）
+        parent_job_id: 親ジョブID（進捗集計用、省略時は実行中のジョブから取得）
     
     Returns:
         bool: 処理成功可否
     """
+    doc_id = url_to_id(file_url)
+    # 並列処理のスレッドからは実行中のジョブを参照できないため、呼び出し元から渡された値を優先する
+    if parent_job_id is None:
+        parent_job_id = _get_parent_job_id()
     try:
-        # ファイルを読み込み(必要ならマークダウン化)
-        result = _read_file_content(file_path)
-        
-        if result["status"] != "success":
-            logger.error(f"File processing failed for {file_url}: {result.get('error', 'Unknown error')}")
-            return False
-        
-        # 結果から情報を抽出
-        file_content = result.get("content", "")
-        
-        # セクション抽出
-        print(file_content)
-        sections = divide_toplevel_sections(file_content)
-        
-        # Elasticsearchにドキュメントを保存
-        doc_id = url_to_id(file_url)
-        file_name = file_url.split('/')[-1]
-        
-        # 保存されたファイルパスがあればDBに保存
-        saved_file_name = None
-        if stored_file_path and os.path.exists(stored_file_path):
-            saved_file_name = os.path.basename(stored_file_path)
-        
-        ESService().save_document(
-            doc_id,
-            file_url,
-            file_name,
-            sections,
-            pdf_name=None,
-            file_path=saved_file_name
-        )
-        
-        # PDF変換が必要な場合は別キューで処理
-        file_name = os.path.basename(file_path)
-        if FileConverter.is_pdf_convertible(file_name):
-            enqueue_pdf_conversion_task(
+        with document_lock(doc_id):
+            # ファイルを読み込み(必要ならマークダウン化)
+            result = _read_file_content(file_path, parent_job_id)
+            
+            # 結果から情報を抽出
+            file_content = result.get("content", "")
+            if result.get("type") == "binary":
+                logger.info(f"Indexed binary file {file_url} without content")
+                _record_binary_file(parent_job_id)
+            
+            # セクション抽出（PDFはページごとに抽出済み）
+            sections = result.get("sections")
+            if sections is None:
+                sections = divide_toplevel_sections(file_content)
+            
+            # PDFファイルは変換せずにそのまま表示用のPDFとして保存
+            pdf_name = None
+            if FileConverter.is_pdf(file_path):
+                pdf_name = os.path.basename(FileConverter.save_pdf(file_path))
+            
+            # Elasticsearchにドキュメントを保存
+            file_name = file_url.split('/')[-1]
+            
+            # 保存されたファイルパスがあればDBに保存
+            saved_file_name = None
+            if stored_file_path and os.path.exists(stored_file_path):
+                saved_file_name = os.path.basename(stored_file_path)
+            
+            get_es_service().save_document(
+                doc_id,
                 file_url,
-                file_path
+                file_name,
+                sections,
+                pdf_name=pdf_name,
+                file_path=saved_file_name,
+                revision=revision
             )
-            logger.info(f"Enqueued PDF conversion for {file_url}")
-        else:
-            # 一時ファイルをクリーンアップ
-            try:
-                os.remove(file_path)
-                temp_dir = os.path.dirname(file_path)
-                if os.path.exists(temp_dir):
-                    os.rmdir(temp_dir)
-            except OSError:
-                pass  # クリーンアップ失敗は無視
+            
+            # PDF変換が必要な場合は別キューで処理（遅延変換モードでは元ファイルを保存し、初回表示時に変換）
+            file_name = os.path.basename(file_path)
+            if FileConverter.is_pdf_convertible(file_name) and is_lazy_mode():
+                keep_pdf_source(file_path)
+                try:
+                    _remove_temp_files(file_path)
+                except OSError:
+                    pass  # クリーンアップ失敗は無視
+                logger.info(f"Kept source of {file_url} for on-demand PDF conversion")
+            elif FileConverter.is_pdf_convertible(file_name):
+                enqueue_pdf_conversion_task(
+                    file_url,
+                    file_path,
+                    parent_job_id=parent_job_id
+                )
+                logger.info(f"Enqueued PDF conversion for {file_url}")
+            else:
+                # 一時ファイルをクリーンアップ
+                try:
+                    _remove_temp_files(file_path)
+                except OSError:
+                    pass  # クリーンアップ失敗は無視
         
         return True
         
     except Exception as e:
         logger.error(f"Failed to process file {file_url}: {str(e)}", exc_info=True)
-        return False
+        raise
 
 def process_pdf_conversion_task(
     file_url: str,
-    file_path: str
+    file_path: str,
+    parent_job_id: Optional[str] = None
 ) -> bool:
     """
     PDF変換タスクを処理し、成功時にElasticsearchを更新
+    失敗時は一時ファイルを残したまま例外を送出する（再試行・デッドレターからの再実行で使用）
     
     Args:
         file_url: ファイルURL
         file_path: 一時ファイルパス
+        parent_job_id: 親ジョブID（変換結果キャッシュのインポート単位の集計用）
     
     Returns:
         bool: 処理成功可否
@@ -104,88 +176,170 @@ def process_pdf_conversion_task(
     try:
         logger.info(f"Starting PDF conversion for {file_url}")
         
-        # PDF変換を実行
-        pdf_path = FileConverter.convert_to_pdf_and_save(file_path)
+        # 同じ内容のファイルを変換済みの場合はPDFを共有し、変換サーバーには送らない
+        cache_key = get_cache_key(file_path)
+        pdf_path = FileConverter.get_pdf_output_path(file_path)
+        cache_hit = link_cached_pdf(cache_key, pdf_path)
+        if cache_key is not None:
+            record_cache_result('pdf', cache_hit, parent_job_id)
+        if cache_hit:
+            logger.info(f"Reused cached PDF for {file_url}")
+        else:
+            # 古い形式のファイルは、マークダウン化の際に変換した新しい形式のファイルからPDFを作成する
+            # （元ファイルを変換サーバーで再度読み込まない。マークダウンがキャッシュから取得された場合は元ファイルから作成）
+            source_path = file_path
+            if FileConverter.is_old_office_file(file_path):
+                converted_path = FileConverter.get_valid_office_file_path(file_path)
+                if os.path.exists(converted_path):
+                    source_path = converted_path
+            # PDF変換を実行
+            pdf_path = FileConverter.convert_to_pdf_and_save(source_path)
+            store_pdf(cache_key, pdf_path)
         
         if not pdf_path or not os.path.exists(pdf_path):
-            logger.error(f"PDF conversion failed for {file_url}")
-            return False
+            raise TransientError(f"PDF conversion produced no output for {file_url}", cause='conversion_no_output')
         
         # PDFファイル名を取得
         pdf_name = os.path.basename(pdf_path)
         
-        # 既存のドキュメントを取得してPDF情報を更新
-        es_service = ESService()
+        # 既存のドキュメントを取得してPDF情報を更新（本文の保存と競合しないようロックする）
+        es_service = get_es_service()
         doc_id = url_to_id(file_url)
-        existing_doc = es_service.get_document_by_id(doc_id, include_content=False)
-        
-        if existing_doc:
-            # 既存ドキュメントを更新
-            es_service.update_document_pdf_info(doc_id, pdf_name)
-            logger.info(f"Updated PDF info for document {file_url}: {pdf_name}")
+        with document_lock(doc_id):
+            existing_doc = es_service.get_document_by_id(doc_id, include_content=False)
+            
+            if existing_doc:
+                # 既存ドキュメントを更新
+                es_service.update_document_pdf_info(doc_id, pdf_name)
+                logger.info(f"Updated PDF info for document {file_url}: {pdf_name}")
         
-        # 一時ファイルをクリーンアップ
+        # 一時ファイル（遅延変換モードでは保存していた元ファイル）をクリーンアップ
         try:
-            os.remove(file_path)
-            temp_dir = os.path.dirname(file_path)
-            if os.path.exists(temp_dir):
-                os.rmdir(temp_dir)
+            _remove_temp_files(file_path)
         except OSError as e:
             logger.warning(f"Failed to clean up temporary files: {str(e)}")
+        finish_pdf_conversion(doc_id)
         
         logger.info(f"PDF conversion completed successfully for {file_url}")
         return True
         
     except Exception as e:
         logger.error(f"Failed to process PDF conversion for {file_url}: {str(e)}", exc_info=True)
-        return False
+        if not handle_task_failure(e, progress_kind=None):
+            fail_pdf_conversion(url_to_id(file_url))
+        raise
+
+def _get_parent_job_id() -> Optional[str]:
+    """実行中のジョブの親ジョブID（ジョブ外・並列処理のスレッドではNone）"""
+    job = get_current_job()
+    return job.meta.get('parent_job_id') if job is not None else None
 
-def _read_file_content(file_path: str) -> Dict[str, Any]:
+def _record_binary_file(parent_job_id: Optional[str]) -> None:
+    """内容を索引しなかったバイナリファイルの数をインポート単位で記録"""
+    update_progress(parent_job_id, binary=1)
+
+def _remove_temp_files(file_path: str) -> None:
+    """一時ファイル（古い形式のOfficeファイルの変換結果を含む）とその一時ディレクトリを削除"""
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass  # 遅延変換のために元ファイルを移動済みの場合
+    if FileConverter.is_old_office_file(file_path):
+        converted_path = FileConverter.get_valid_office_file_path(file_path)
+        if os.path.exists(converted_path):
+            os.remove(converted_path)
+    temp_dir = os.path.dirname(file_path)
+    if os.path.exists(temp_dir):
+        os.rmdir(temp_dir)
+
+def _read_file_content(file_path: str, parent_job_id: Optional[str] = None) -> Dict[str, Any]:
     """
     ファイルを読み込み内容を返す
     
     Args:
         file_path: 処理するファイルのパス
+        parent_job_id: 親ジョブID（変換結果キャッシュのインポート単位の集計用）
     
     Returns:
-        dict: 処理結果
+        dict: 処理結果（PDF・Excelの場合はcontentの代わりにページ・シートごとのsections、バイナリの場合は空のsections）
     """
-    try:
-        file_name = os.path.basename(file_path)
-        
-        # 古いOfficeファイルの変換
-        if FileConverter.is_old_office_file(file_path):
-            file_path = FileConverter.convert_to_valid_office_file(file_path)
-            file_name = os.path.basename(file_path)  # ファイル名を更新
-        
-        # マークダウン変換
-        if FileConverter.is_convertible(file_name):
-            content = FileConverter.convert_to_markdown(file_path)
-            return {
-                "status": "success", 
-                "content": content, 
-                "pdf_path": None,
-                "type": "auto"
-            }
-        else:
-            # テキストファイルの読み込み
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-            except UnicodeDecodeError:
-                with open(file_path, 'rb') as f:
-                    content = f.read().decode('utf-8', errors='replace')
-            
+    file_name = os.path.basename(file_path)
+    
+    # Excelはシートごとに抽出（同じ内容のファイルを抽出済みの場合はキャッシュを使用）
+    if FileConverter.is_spreadsheet(file_name):
+        return {
+            "status": "success",
+            "sections": _extract_sections_cached(file_path, FileConverter.extract_spreadsheet_sections, parent_job_id),
+            "pdf_path": None,
+            "type": "spreadsheet"
+        }
+    # マークダウン変換（同じ内容のファイルを変換済みの場合はキャッシュを使用）
+    elif FileConverter.is_old_office_file(file_path) or FileConverter.is_convertible(file_name):
+        cache_key = get_cache_key(file_path)
+        content = get_cached_markdown(cache_key)
+        if cache_key is not None:
+            record_cache_result('markdown', content is not None, parent_job_id)
+        if content is None:
+            content = _convert_to_markdown(file_path)
+            store_markdown(cache_key, content)
+        return {
+            "status": "success", 
+            "content": content, 
+            "pdf_path": None,
+            "type": "auto"
+        }
+    elif FileConverter.is_pdf(file_name):
+        # PDFはページごとにテキストを抽出（バイト列をテキストとして読み込まない）
+        return {
+            "status": "success",
+            "sections": _extract_sections_cached(file_path, FileConverter.extract_pdf_sections, parent_job_id),
+            "pdf_path": None,
+            "type": "pdf"
+        }
+    else:
+        # 読み込む前に内容を判定し、バイナリはファイル名・URLのみのドキュメントとして保存
+        is_binary, encoding = sniff_file(file_path)
+        if is_binary:
             return {
-                "status": "success", 
-                "content": content, 
+                "status": "success",
+                "sections": [],
                 "pdf_path": None,
-                "type": "text"
+                "type": "binary"
             }
         
-    except Exception as e:
-        logger.error(f"Failed to process file {file_path}: {str(e)}", exc_info=True)
-        return {"status": "error", "error": str(e)}
+        # テキストファイルの読み込み（判定した文字コードで復元）
+        with open(file_path, 'rb') as f:
+            content = decode_text(f.read(), encoding)
+        
+        return {
+            "status": "success", 
+            "content": content, 
+            "pdf_path": None,
+            "type": "text"
+        }
+
+def _extract_sections_cached(
+    file_path: str,
+    extract_func: Callable[[str], List[Dict[str, str]]],
+    parent_job_id: Optional[str] = None
+) -> List[Dict[str, str]]:
+    """ファイルからセクションを抽出（同じ内容のファイルを抽出済みの場合はキャッシュを使用）"""
+    cache_key = get_cache_key(file_path)
+    sections = get_cached_sections(cache_key)
+    if cache_key is not None:
+        record_cache_result('markdown', sections is not None, parent_job_id)
+    if sections is None:
+        sections = run_in_sandbox(extract_func, file_path)
+        store_sections(cache_key, sections)
+    return sections
+
+def _convert_to_markdown(file_path: str) -> str:
+    """Officeファイルをマークダウンに変換（古い形式は先に変換サーバーで新しい形式に変換）"""
+    # 古いOfficeファイルの変換
+    if FileConverter.is_old_office_file(file_path):
+        file_path = FileConverter.convert_to_valid_office_file(file_path)
+    # 異常な文書で変換が停止・メモリを使い果たしてもワーカーに影響しないよう、子プロセスで変換する
+    return run_in_sandbox(FileConverter.convert_to_markdown, file_path)
 
 def divide_toplevel_sections(content: str) -> List[Dict[str, str]]:
     """
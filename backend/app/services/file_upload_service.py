@@ -2,31 +2,55 @@ from typing import Dict, Any
 import tempfile
 import os
 import shutil
+import uuid
 
 from ..logging_config import setup_logging
 from .utils import url_to_id
 from .file_processor_service import process_file
+from .progress_service import record_result
+from .failure_service import handle_task_failure
 
 logger = setup_logging()
 
+FILE_STORAGE_DIR = "/var/lib/file_storage"
+# アップロードされたファイルをワーカーが処理するまで置いておくディレクトリ（API・ワーカー共有ボリューム）
+UPLOAD_STAGING_DIR = os.path.join(FILE_STORAGE_DIR, ".staging")
+
+def create_staging_path(file_name: str) -> str:
+    """
+    アップロードファイルの一時保存先パスを生成
+    
+    Args:
+        file_name: 元のファイル名（拡張子の引き継ぎに使用）
+    
+    Returns:
+        str: 一時保存先のパス
+    """
+    os.makedirs(UPLOAD_STAGING_DIR, exist_ok=True)
+    file_ext = os.path.splitext(file_name or "")[1]
+    return os.path.join(UPLOAD_STAGING_DIR, f"{uuid.uuid4().hex}{file_ext}")
+
 def process_local_file_upload(
     absolute_path: str,
-    file_data: bytes,
+    staged_file_path: str,
     file_name: str,
     job_id: str
 ) -> Dict[str, Any]:
     """
     ローカルファイルアップロード処理
+    一時保存されたファイルは成功時に削除し、失敗時は再試行・再実行のために残す
     
     Args:
         absolute_path: 絶対パス（完全なファイルパス）
-        file_data: ファイルデータ（バイト）
+        staged_file_path: アップロードされたファイルの一時保存パス
         file_name: ファイル名
         job_id: 親ジョブID（進捗追跡用）
     
     Returns:
         dict: 処理結果
     """
+    temp_dir = None
+    stored_file_path = None
     try:
         logger.info(f"Processing file upload: {file_name}, path: {absolute_path}, job_id: {job_id}")
         
@@ -34,66 +58,48 @@ def process_local_file_upload(
         temp_dir = tempfile.mkdtemp()
 
         # ファイル保存ディレクトリを作成
-        file_storage_dir = "/var/lib/file_storage"
-        os.makedirs(file_storage_dir, exist_ok=True)
+        os.makedirs(FILE_STORAGE_DIR, exist_ok=True)
         
         # ファイル名をパスのハッシュ化したものにする
         file_hash = url_to_id(absolute_path)
         file_ext = os.path.splitext(file_name)[1]
         hashed_file_name = f"{file_hash}{file_ext}"
         temp_file_path = os.path.join(temp_dir, hashed_file_name)
-        stored_file_path = os.path.join(file_storage_dir, hashed_file_name)
+        stored_file_path = os.path.join(FILE_STORAGE_DIR, hashed_file_name)
         
         # ファイルを一時ディレクトリと保存ディレクトリに保存
-        with open(stored_file_path, "wb") as f:
-            f.write(file_data)
+        shutil.copyfile(staged_file_path, stored_file_path)
         logger.info(f"File saved to: {stored_file_path}")
         shutil.copy2(stored_file_path, temp_file_path)
         
         # ファイルプロセッササービスを使用してファイルを処理（ファイルパスを渡す）
-        success = process_file(temp_file_path, absolute_path, stored_file_path)
-        
-        # 一時ファイルを削除
-        os.remove(temp_file_path)
-        try:
-            os.rmdir(temp_dir)
-        except OSError:
-            pass  # ディレクトリが空でない場合は無視
+        # 一時ファイルはprocess_fileが削除するか、PDF変換タスクに引き継ぐ
+        process_file(temp_file_path, absolute_path, stored_file_path)
         
-        if success:
-            logger.info(f"Successfully processed and saved file: {file_name}")
-            return {
-                "status": "success",
-                "message": f"Processed and saved file {file_name}",
-                "file_name": file_name,
-                "absolute_path": absolute_path,
-                "stored_file_path": stored_file_path
-            }
-        else:
-            logger.error(f"Failed to process file: {file_name}")
-            # 処理失敗時は保存したファイルも削除
+    except Exception as e:
+        logger.error(f"Failed to process file upload {file_name}: {str(e)}", exc_info=True)
+        # エラー時は一時ファイルと保存したファイルを削除（再試行時は再作成される）
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        if stored_file_path:
             try:
                 os.remove(stored_file_path)
             except OSError:
                 pass
-            return {
-                "status": "error",
-                "error": "File processing failed",
-                "file_name": file_name,
-                "absolute_path": absolute_path
-            }
-        
-    except Exception as e:
-        logger.error(f"Failed to process file upload {file_name}: {str(e)}", exc_info=True)
-        # エラー時は保存したファイルを削除
-        try:
-            if 'stored_file_path' in locals():
-                os.remove(stored_file_path)
-        except (OSError, UnboundLocalError):
-            pass
-        return {
-            "status": "error",
-            "error": str(e),
-            "file_name": file_name,
-            "absolute_path": absolute_path
-        }
+        handle_task_failure(e, job_id, progress_kind='file')
+        raise
+    
+    try:
+        os.remove(staged_file_path)
+    except OSError:
+        pass  # クリーンアップ失敗は無視（定期メンテナンスで削除される）
+    
+    record_result(job_id, "succeeded")
+    logger.info(f"Successfully processed and saved file: {file_name}")
+    return {
+        "status": "success",
+        "message": f"Processed and saved file {file_name}",
+        "file_name": file_name,
+        "absolute_path": absolute_path,
+        "stored_file_path": stored_file_path
+    }
@@ -0,0 +1,188 @@
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List
+from urllib.parse import urlparse
+
+from pydantic_settings import BaseSettings
+
+from ..logging_config import setup_logging
+from .queue_service import get_redis_connection
+from .failure_service import TransientError
+
+logger = setup_logging()
+"""
+SVNホスト別の同時接続数制御サービスモジュール
+複数のワーカー・プロセスにまたがって、SVNサーバー（ホスト）ごとの同時アクセス数と
+アクセス頻度をRedisで制限し、待ち時間を集計する
+"""
+
+HOST_SLOTS_KEY_PREFIX = 'svn_host:slots'  # ホスト -> 使用中の枠(Sorted Set: トークン -> 期限)
+HOST_RATE_KEY_PREFIX = 'svn_host:rate'  # ホスト -> トークンバケット(Hash)
+HOST_STATS_KEY_PREFIX = 'svn_host:stats'  # ホスト -> 待ち時間の集計(Hash)
+HOST_STATS_HOSTS_KEY = 'svn_host:hosts'  # 集計のあるホストの一覧(Set)
+
+# 期限切れの枠（異常終了したワーカーの分）を除いてから、空きがあれば枠を確保する
+ACQUIRE_SLOT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], ARGV[4], ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+"""
+
+# トークンバケット: 取得できた場合は0、できない場合は次のトークンまでの待ち時間(ミリ秒)を返す
+TAKE_TOKEN_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens')) or burst
+local updated_at = tonumber(redis.call('HGET', KEYS[1], 'updated_at')) or now
+tokens = math.min(burst, tokens + math.max(now - updated_at, 0) * rate)
+local wait_ms = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait_ms = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return wait_ms
+"""
+
+class HostLimitSettings(BaseSettings):
+    """SVNホスト別の同時接続数制御設定クラス"""
+    svn_host_max_concurrency: int = 4  # ホストごとの同時アクセス数（0で無制限）
+    # ホストごとの個別設定（例: {"svn.example.com:443": 2}）
+    svn_host_concurrency_overrides: Dict[str, int] = {}
+    svn_host_rate_limit: float = 0  # ホストごとの1秒あたりのアクセス開始数（0で無制限）
+    svn_host_rate_burst: int = 10  # 一時的に超過を許すアクセス数
+    svn_host_slot_lease: int = 2 * 60 * 60  # 枠の最大保持時間（秒、異常終了時に解放されるまでの時間）
+    svn_host_wait_timeout: int = 600  # 枠の最大待ち時間（秒、超えた場合は一時的な失敗として再試行）
+
+def get_svn_host(url: str) -> str:
+    """アクセス先URL（IPアドレスへの書き換え後）の制限単位となるホスト"""
+    return urlparse(url).netloc or url
+
+@contextmanager
+def svn_host_slot(url: str) -> Iterator[None]:
+    """
+    SVNホストへのアクセス枠を確保してから処理を実行
+    枠が空くまで（レート制限がある場合はトークンが貯まるまで）待つ
+
+    Args:
+        url: アクセス先URL（IPアドレスへの書き換え後）
+
+    Raises:
+        TransientError: 待ち時間の上限を超えた場合
+    """
+    settings = HostLimitSettings()
+    host = get_svn_host(url)
+    limit = settings.svn_host_concurrency_overrides.get(host, settings.svn_host_max_concurrency)
+    if not limit and not settings.svn_host_rate_limit:
+        yield
+        return
+
+    redis_conn = get_redis_connection()
+    slots_key = f"{HOST_SLOTS_KEY_PREFIX}:{host}"
+    token = uuid.uuid4().hex
+    started = time.monotonic()
+    deadline = started + settings.svn_host_wait_timeout
+    acquired = False
+    try:
+        if limit:
+            _acquire_slot(redis_conn, slots_key, token, limit, settings, deadline, host)
+            acquired = True
+        if settings.svn_host_rate_limit:
+            _take_token(redis_conn, host, settings, deadline)
+    except TransientError:
+        if acquired:
+            redis_conn.zrem(slots_key, token)
+        _record_wait(redis_conn, host, time.monotonic() - started, timed_out=True)
+        raise
+    _record_wait(redis_conn, host, time.monotonic() - started)
+
+    try:
+        yield
+    finally:
+        if acquired:
+            redis_conn.zrem(slots_key, token)
+
+def _acquire_slot(redis_conn, slots_key: str, token: str, limit: int, settings: HostLimitSettings,
+                  deadline: float, host: str) -> None:
+    acquire = redis_conn.register_script(ACQUIRE_SLOT_SCRIPT)
+    delay = 0.05
+    while True:
+        now = time.time()
+        if acquire(keys=[slots_key], args=[now, limit, token, now + settings.svn_host_slot_lease,
+                                           settings.svn_host_slot_lease]):
+            return
+        if time.monotonic() + delay > deadline:
+            raise TransientError(f"Timed out waiting for an SVN slot on {host}", cause='svn_throttled')
+        time.sleep(delay)
+        delay = min(delay * 2, 1.0)
+
+def _take_token(redis_conn, host: str, settings: HostLimitSettings, deadline: float) -> None:
+    take = redis_conn.register_script(TAKE_TOKEN_SCRIPT)
+    while True:
+        wait_ms = take(
+            keys=[f"{HOST_RATE_KEY_PREFIX}:{host}"],
+            args=[time.time(), settings.svn_host_rate_limit, max(settings.svn_host_rate_burst, 1)]
+        )
+        if not wait_ms:
+            return
+        delay = int(wait_ms) / 1000
+        if time.monotonic() + delay > deadline:
+            raise TransientError(f"Timed out waiting for the SVN rate limit on {host}", cause='svn_throttled')
+        time.sleep(delay)
+
+def _record_wait(redis_conn, host: str, wait_seconds: float, timed_out: bool = False) -> None:
+    """枠の確保にかかった時間を集計（集計の失敗でSVNアクセスは止めない）"""
+    stats_key = f"{HOST_STATS_KEY_PREFIX}:{host}"
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.sadd(HOST_STATS_HOSTS_KEY, host)
+        pipe.hincrby(stats_key, 'timeouts' if timed_out else 'acquired', 1)
+        if wait_seconds >= 0.01:
+            pipe.hincrby(stats_key, 'waited', 1)
+        pipe.hincrbyfloat(stats_key, 'wait_seconds', wait_seconds)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record SVN slot wait for {host}: {str(e)}")
+
+def get_host_limit_stats() -> List[Dict[str, Any]]:
+    """
+    SVNホストごとのアクセス枠の使用状況と待ち時間を取得
+
+    Returns:
+        List[dict]: host, in_use(使用中の枠), max_concurrency, acquired(確保回数),
+                    waited(待ちが発生した回数), timeouts, avg_wait_ms
+    """
+    settings = HostLimitSettings()
+    redis_conn = get_redis_connection()
+    hosts = sorted(host.decode('utf-8') for host in redis_conn.smembers(HOST_STATS_HOSTS_KEY))
+
+    pipe = redis_conn.pipeline(transaction=False)
+    now = time.time()
+    for host in hosts:
+        pipe.zcount(f"{HOST_SLOTS_KEY_PREFIX}:{host}", now, '+inf')
+        pipe.hgetall(f"{HOST_STATS_KEY_PREFIX}:{host}")
+    results = pipe.execute()
+
+    stats = []
+    for index, host in enumerate(hosts):
+        in_use, raw = results[index * 2], results[index * 2 + 1]
+        counters = {key.decode('utf-8'): float(value) for key, value in raw.items()}
+        attempts = counters.get('acquired', 0) + counters.get('timeouts', 0)
+        stats.append({
+            'host': host,
+            'in_use': in_use,
+            'max_concurrency': settings.svn_host_concurrency_overrides.get(host, settings.svn_host_max_concurrency),
+            'acquired': int(counters.get('acquired', 0)),
+            'waited': int(counters.get('waited', 0)),
+            'timeouts': int(counters.get('timeouts', 0)),
+            'avg_wait_ms': round(counters.get('wait_seconds', 0) / attempts * 1000, 1) if attempts else 0.0
+        })
+    return stats
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from typing import Callable, Dict
+
+from pydantic_settings import BaseSettings
+from rq import Queue
+from rq.job import Job
+from rq.results import Result
+
+from ..logging_config import setup_logging
+from .queue_service import (
+    ALL_QUEUES,
+    LOCAL_UPLOAD_TASK,
+    QUEUE_SUMMARY_KEY_PREFIX,
+    get_redis_connection,
+    get_job_ttls
+)
+from .progress_service import PROGRESS_TTL
+from .file_upload_service import UPLOAD_STAGING_DIR
+from .conversion_cache_service import evict_conversion_cache
+from .failure_service import iter_dead_letter_args
+
+logger = setup_logging()
+"""
+定期メンテナンスサービスモジュール
+ジョブレジストリの圧縮など、ワーカーがバックグラウンドで定期実行する処理を提供
+"""
+
+# 圧縮済みジョブのインポート（親ジョブ）別集計
+IMPORT_SUMMARY_KEY_PREFIX = 'job_summary:import'
+MAINTENANCE_LOCK_PREFIX = 'maintenance:lock'
+
+class MaintenanceSettings(BaseSettings):
+    """定期メンテナンス設定クラス"""
+    compaction_interval: int = 300  # レジストリ圧縮の実行間隔（秒）
+    # 保持期間の満了までこの秒数を切ったジョブを集計して削除する
+    # （実行間隔より長くしないと、集計前にRQが期限切れとして削除する場合がある）
+    compaction_expiry_window: int = 900
+    compaction_chunk_size: int = 500  # 1回のパイプラインで処理するジョブ数
+
+def compact_job_registries() -> Dict[str, int]:
+    """
+    保持期間の満了が近い終了済みジョブを集計カウンタにまとめてから削除し、Redisのメモリ使用量を一定に保つ
+    成功/失敗の件数はキュー別・インポート別の集計ハッシュに加算される
+    （保持期間内のジョブは削除しないため、失敗したジョブは設定した期間 /jobs などで確認できる）
+
+    Returns:
+        dict: キューごとの圧縮件数
+    """
+    settings = MaintenanceSettings()
+    redis_conn = get_redis_connection()
+    compacted = {}
+
+    for queue_name in ALL_QUEUES:
+        queue = Queue(queue_name, connection=redis_conn)
+        ttls = get_job_ttls(queue_name)
+        count = 0
+        for status, registry, ttl in (
+            ('finished', queue.finished_job_registry, ttls['result_ttl']),
+            ('failed', queue.failed_job_registry, ttls['failure_ttl']),
+        ):
+            if ttl is None or ttl < 0:
+                continue  # 無期限保持の設定では圧縮しない
+            count += _compact_registry(redis_conn, queue_name, status, registry.key, settings)
+        compacted[queue_name] = count
+
+    total = sum(compacted.values())
+    if total:
+        logger.info(f"Compacted {total} jobs: {compacted}")
+    return compacted
+
+def _compact_registry(redis_conn, queue_name: str, status: str, registry_key: str,
+                      settings: MaintenanceSettings) -> int:
+    """
+    1つのレジストリを圧縮
+    レジストリのスコアは「終了時刻 + 保持期間」（= RQが削除する時刻）なので、
+    スコアの範囲で満了の近いジョブだけを取り出せる（取り出したジョブは削除するため集計は1回のみ）
+    """
+    cutoff = time.time() + settings.compaction_expiry_window
+    queue_summary_key = f"{QUEUE_SUMMARY_KEY_PREFIX}:{queue_name}"
+    compacted = 0
+
+    while True:
+        job_ids = [
+            job_id.decode('utf-8')
+            for job_id in redis_conn.zrangebyscore(
+                registry_key, '-inf', cutoff, start=0, num=settings.compaction_chunk_size
+            )
+        ]
+        if not job_ids:
+            break
+
+        jobs = Job.fetch_many(job_ids, connection=redis_conn)
+        pipe = redis_conn.pipeline(transaction=False)
+        for job_id, job in zip(job_ids, jobs):
+            pipe.hincrby(queue_summary_key, status, 1)
+            if job is not None:
+                parent_job_id = job.meta.get('parent_job_id')
+                if parent_job_id:
+                    import_summary_key = f"{IMPORT_SUMMARY_KEY_PREFIX}:{parent_job_id}"
+                    pipe.hincrby(import_summary_key, f"{queue_name}:{status}", 1)
+                    pipe.expire(import_summary_key, PROGRESS_TTL)
+                pipe.delete(job.key, Result.get_key(job_id))
+            pipe.zrem(registry_key, job_id)
+        pipe.execute()
+
+        compacted += len(job_ids)
+        if len(job_ids) < settings.compaction_chunk_size:
+            break
+
+    return compacted
+
+def get_import_job_summary(parent_job_id: str) -> Dict[str, int]:
+    """
+    インポート（親ジョブ）単位の圧縮済みジョブ集計を取得
+
+    Returns:
+        dict: '{キュー名}:{finished|failed}' ごとのジョブ数
+    """
+    raw = get_redis_connection().hgetall(f"{IMPORT_SUMMARY_KEY_PREFIX}:{parent_job_id}")
+    return {key.decode('utf-8'): int(value) for key, value in raw.items()}
+
+def cleanup_staged_uploads() -> int:
+    """
+    失敗ジョブの保持期間を過ぎても残っているアップロード一時ファイルを削除
+    デッドレターキューに残っているアップロードのファイルは、再実行できるよう期間を過ぎても削除しない
+
+    Returns:
+        int: 削除したファイル数
+    """
+    if not os.path.isdir(UPLOAD_STAGING_DIR):
+        return 0
+
+    max_age = get_job_ttls('upload_local')['failure_ttl']
+    if max_age is None or max_age < 0:
+        return 0
+
+    cutoff = time.time() - max_age
+    retained_paths = {
+        os.path.abspath(args[1]) for args in iter_dead_letter_args(LOCAL_UPLOAD_TASK) if len(args) > 1
+    }
+    removed = 0
+    with os.scandir(UPLOAD_STAGING_DIR) as entries:
+        for entry in entries:
+            if os.path.abspath(entry.path) in retained_paths:
+                continue
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass  # 処理中に削除された場合などは無視
+
+    if removed:
+        logger.info(f"Removed {removed} stale staged uploads")
+    return removed
+
+def run_job_maintenance() -> None:
+    """定期実行するジョブ関連のメンテナンス処理"""
+    compact_job_registries()
+    cleanup_staged_uploads()
+    evict_conversion_cache()
+
+def start_periodic_task(name: str, interval: int, func: Callable[[], None]) -> threading.Thread:
+    """
+    バックグラウンドスレッドで定期タスクを開始
+    複数のワーカーが起動していても、Redisのロックにより各間隔で1回だけ実行される
+
+    Args:
+        name: タスク名（ロックキーに使用）
+        interval: 実行間隔（秒）
+        func: 実行する関数
+
+    Returns:
+        threading.Thread: 起動したスレッド
+    """
+    lock_key = f"{MAINTENANCE_LOCK_PREFIX}:{name}"
+
+    def loop():
+        while True:
+            try:
+                if get_redis_connection().set(lock_key, os.getpid(), nx=True, ex=interval):
+                    func()
+            except Exception as e:
+                logger.error(f"Periodic task {name} failed: {str(e)}", exc_info=True)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name=f"periodic-{name}", daemon=True)
+    thread.start()
+    logger.info(f"Started periodic task {name} (interval: {interval}s)")
+    return thread
@@ -0,0 +1,212 @@
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from pydantic_settings import BaseSettings
+from rq.exceptions import NoSuchJobError
+from rq.job import Job, JobStatus
+
+from ..logging_config import setup_logging
+from .elasticsearch_service import get_es_service
+from .file_converter import PDF_STORAGE_DIR, FileConverter
+from .queue_service import enqueue_pdf_conversion_task, get_queue, get_redis_connection
+
+logger = setup_logging()
+"""
+PDF遅延変換サービスモジュール
+遅延変換モードでは取り込み時にPDF変換を行わず元ファイルを保存しておき、
+PDFが最初に要求された時点で変換する（同じドキュメントへの同時要求は1つの変換ジョブを共有する）
+"""
+
+PDF_SOURCE_DIR = os.path.join(PDF_STORAGE_DIR, ".sources")  # 変換前の元ファイル（ドキュメントごとのディレクトリ）
+PDF_CONVERSION_KEY_PREFIX = 'pdf_conversion'
+PDF_CONVERSION_FAILED = 'failed'
+# 変換ジョブのタイムアウト(30分)より長くする（ワーカー停止などで解放されなかった場合の保険）
+PDF_CONVERSION_LOCK_TTL = 35 * 60
+# 変換要求の記録から投入（Elasticsearchの参照を含む）までにかかり得る時間（秒）
+# この時間内はジョブが見つからなくても投入中とみなし、記録を消さない（重複投入を防ぐ）
+PDF_CONVERSION_ENQUEUE_GRACE = 60
+
+# 記録した時点の値のままの場合だけ削除する（その間に他の要求が記録し直した場合は残す）
+DELETE_IF_UNCHANGED_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+# ドキュメントID（URL-safeなBase64）として有効な文字
+DOC_ID_PATTERN = re.compile(r'^[A-Za-z0-9_=-]+$')
+
+class PdfConversionSettings(BaseSettings):
+    """PDF変換モード設定クラス"""
+    pdf_conversion_mode: str = 'eager'  # eager: 取り込み時に変換 / lazy: 初回表示時に変換
+    pdf_prefetch_search_results: int = 0  # lazy時、検索結果の上位何件を先行して変換するか（0で無効）
+    pdf_conversion_retry_after: int = 2  # 変換中の応答で返す再取得までの待ち時間（秒）
+    pdf_conversion_failure_ttl: int = 10 * 60  # 変換に失敗したドキュメントの再変換を控える時間（秒）
+
+def is_lazy_mode() -> bool:
+    """遅延変換モードか判定"""
+    return PdfConversionSettings().pdf_conversion_mode == 'lazy'
+
+def keep_pdf_source(file_path: str) -> str:
+    """
+    PDF変換前の元ファイルを保存（一時ファイルを移動）
+    以前のバージョンから変換したPDFは削除し、次の表示時に新しい元ファイルから変換させる
+
+    Args:
+        file_path: 一時ファイルのパス（ファイル名は{doc_id}.{拡張子}）
+
+    Returns:
+        str: 保存した元ファイルのパス
+    """
+    file_name = os.path.basename(file_path)
+    doc_id = os.path.splitext(file_name)[0]
+    source_dir = os.path.join(PDF_SOURCE_DIR, doc_id)
+    os.makedirs(source_dir, exist_ok=True)
+    # 再インポートで拡張子が変わった場合に備えて以前の元ファイルを削除する
+    for old_name in os.listdir(source_dir):
+        if old_name != file_name:
+            os.remove(os.path.join(source_dir, old_name))
+
+    # 変換中のジョブが読み込んでいるファイルを書き換えないよう、別ファイルから置き換える
+    source_path = os.path.join(source_dir, file_name)
+    temp_path = f"{source_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        shutil.move(file_path, temp_path)
+        os.replace(temp_path, source_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    try:
+        os.remove(FileConverter.get_pdf_output_path(file_path))
+    except FileNotFoundError:
+        pass
+    return source_path
+
+def get_pdf_source_path(doc_id: str) -> Optional[str]:
+    """保存されている変換前の元ファイルのパス（なければNone）"""
+    if not DOC_ID_PATTERN.match(doc_id):
+        return None
+    source_dir = os.path.join(PDF_SOURCE_DIR, doc_id)
+    try:
+        names = [name for name in os.listdir(source_dir) if not name.endswith('.tmp')]
+    except FileNotFoundError:
+        return None
+    return os.path.join(source_dir, names[0]) if names else None
+
+def remove_pdf_source(doc_id: str) -> None:
+    """保存されている変換前の元ファイルを削除"""
+    if not DOC_ID_PATTERN.match(doc_id):
+        return
+    shutil.rmtree(os.path.join(PDF_SOURCE_DIR, doc_id), ignore_errors=True)
+
+def request_pdf_conversion(doc_id: str, file_url: Optional[str] = None, interactive: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    保存されている元ファイルのPDF変換を要求
+    変換ジョブはドキュメントごとに1つだけ投入し、変換中の要求は同じジョブの状態を返す
+
+    Args:
+        doc_id: ドキュメントID
+        file_url: ファイルのURL（省略時はElasticsearchから取得）
+        interactive: 表示のための要求の場合True（先行変換より先に処理させる）
+
+    Returns:
+        Optional[dict]: status(`converting` / `failed`), job_status, queue_position
+            元ファイルが無い場合はNone
+    """
+    source_path = get_pdf_source_path(doc_id)
+    if source_path is None:
+        return None
+
+    redis_conn = get_redis_connection()
+    key = f"{PDF_CONVERSION_KEY_PREFIX}:{doc_id}"
+    job_id = f"convert_pdf-{doc_id}"
+    # 値は要求を記録した時刻（ジョブが見つからない場合に投入中か判定する）
+    if redis_conn.set(key, repr(time.time()), nx=True, ex=PDF_CONVERSION_LOCK_TTL):
+        if file_url is None:
+            document = get_es_service().get_document_by_id(doc_id)
+            if not document or not document.get("found"):
+                redis_conn.delete(key)
+                return None
+            file_url = document["_source"]["url"]
+        try:
+            enqueue_pdf_conversion_task(file_url, source_path, job_id=job_id, at_front=interactive)
+        except Exception:
+            redis_conn.delete(key)
+            raise
+        logger.info(f"Requested on-demand PDF conversion for {file_url}")
+    elif redis_conn.get(key) == PDF_CONVERSION_FAILED.encode():
+        return {"status": "failed"}
+
+    try:
+        job = Job.fetch(job_id, connection=redis_conn)
+    except NoSuchJobError:
+        _discard_lost_conversion(redis_conn, key)
+        return {"status": "converting", "job_status": None, "queue_position": None}
+
+    job_status = job.get_status()
+    position = job.get_position() if job_status == JobStatus.QUEUED else None
+    if interactive and position:
+        # 先行変換で投入済みのジョブを表示のために先頭へ移す（既にワーカーが取り出した場合は何もしない）
+        queue = get_queue(job.origin)
+        if queue.remove(job_id):
+            queue.push_job_id(job_id, at_front=True)
+            position = 0
+    return {
+        "status": "converting",
+        "job_status": JobStatus(job_status).value if job_status else None,
+        "queue_position": position
+    }
+
+def _discard_lost_conversion(redis_conn, key: str) -> None:
+    """
+    ジョブの情報が失われた変換要求の記録を削除し、次の要求で投入し直す
+    他の要求が記録してから投入するまでの間は、ジョブがまだ無いだけなので削除しない
+    """
+    requested_at = redis_conn.get(key)
+    if requested_at is None or requested_at == PDF_CONVERSION_FAILED.encode():
+        return
+    try:
+        elapsed = time.time() - float(requested_at)
+    except ValueError:
+        elapsed = PDF_CONVERSION_ENQUEUE_GRACE  # 以前の形式（ジョブID）で記録されたもの
+    if elapsed < PDF_CONVERSION_ENQUEUE_GRACE:
+        return
+    delete_if_unchanged = redis_conn.register_script(DELETE_IF_UNCHANGED_SCRIPT)
+    delete_if_unchanged(keys=[key], args=[requested_at])
+
+def prefetch_pdf_conversions(hits: List[Dict[str, Any]]) -> None:
+    """
+    検索結果の上位のドキュメントを先行してPDFに変換
+    変換済み・変換中のものや元ファイルが無いものは何もしない
+
+    Args:
+        hits: Elasticsearchの検索結果
+    """
+    settings = PdfConversionSettings()
+    if settings.pdf_conversion_mode != 'lazy' or settings.pdf_prefetch_search_results <= 0:
+        return
+    for hit in hits[:settings.pdf_prefetch_search_results]:
+        doc_id = hit["_id"]
+        if os.path.exists(os.path.join(PDF_STORAGE_DIR, f"{doc_id}.pdf")):
+            continue
+        try:
+            request_pdf_conversion(doc_id, hit.get("_source", {}).get("url"), interactive=False)
+        except Exception as e:
+            logger.warning(f"Failed to prefetch PDF conversion for {doc_id}: {str(e)}")
+
+def finish_pdf_conversion(doc_id: str) -> None:
+    """変換ジョブの終了を記録（次の要求で再度変換できるようにする）"""
+    get_redis_connection().delete(f"{PDF_CONVERSION_KEY_PREFIX}:{doc_id}")
+
+def fail_pdf_conversion(doc_id: str) -> None:
+    """変換の最終的な失敗を記録（一定時間は表示の要求で再変換しない）"""
+    get_redis_connection().set(
+        f"{PDF_CONVERSION_KEY_PREFIX}:{doc_id}",
+        PDF_CONVERSION_FAILED,
+        ex=PdfConversionSettings().pdf_conversion_failure_ttl
+    )
@@ -0,0 +1,147 @@
+import json
+from typing import Optional, Dict, AsyncIterator
+
+from ..logging_config import setup_logging
+from .queue_service import get_redis_connection, get_async_redis_connection
+
+logger = setup_logging()
+"""
+インポート進捗集計サービスモジュール
+親ジョブID（1回のインポート操作）単位で進捗カウンタをRedisに保持し、
+更新差分をRedis Streamに記録してSSEで配信する
+"""
+
+# 進捗カウンタのフィールド
+# total: 検出したファイル数, queued: 処理待ちファイル数,
+# succeeded/failed/skipped: 処理結果ごとのファイル数, exploring: 未完了のフォルダ探索数
+# binary: 内容を索引せずファイル名・URLのみ保存したバイナリファイル数（succeededの内数）
+PROGRESS_FIELDS = ['total', 'queued', 'succeeded', 'failed', 'skipped', 'exploring', 'binary']
+
+PROGRESS_KEY_PREFIX = 'import_progress'
+PROGRESS_TTL = 7 * 24 * 60 * 60  # 最終更新から7日間保持
+EVENTS_MAXLEN = 1000  # 差分イベントの保持件数（概算）
+SSE_KEEPALIVE_MS = 15000  # SSEのキープアライブ間隔（ミリ秒）
+
+def _progress_key(parent_job_id: str) -> str:
+    return f"{PROGRESS_KEY_PREFIX}:{parent_job_id}"
+
+def _events_key(parent_job_id: str) -> str:
+    return f"{PROGRESS_KEY_PREFIX}:{parent_job_id}:events"
+
+def update_progress(parent_job_id: Optional[str], **deltas: int) -> None:
+    """
+    進捗カウンタを差分で更新し、差分イベントを記録
+    カウンタ更新とイベント追加は1回のトランザクションで行うため、
+    ファイル数によらず1更新あたりO(1)で済む
+
+    Args:
+        parent_job_id: 親ジョブID（未指定の場合は何もしない）
+        **deltas: フィールド名と増減値
+    """
+    if not parent_job_id:
+        return
+
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    unknown_fields = set(deltas) - set(PROGRESS_FIELDS)
+    if unknown_fields:
+        raise ValueError(f"Unknown progress fields: {sorted(unknown_fields)}")
+
+    try:
+        progress_key = _progress_key(parent_job_id)
+        events_key = _events_key(parent_job_id)
+
+        pipe = get_redis_connection().pipeline(transaction=True)
+        for field, delta in deltas.items():
+            pipe.hincrby(progress_key, field, delta)
+        pipe.expire(progress_key, PROGRESS_TTL)
+        pipe.xadd(events_key, {'delta': json.dumps(deltas)}, maxlen=EVENTS_MAXLEN, approximate=True)
+        pipe.expire(events_key, PROGRESS_TTL)
+        pipe.execute()
+    except Exception as e:
+        # 進捗集計の失敗で本処理を止めない
+        logger.warning(f"Failed to update progress for {parent_job_id}: {str(e)}")
+
+def record_enqueued(parent_job_id: Optional[str], count: int = 1) -> None:
+    """ファイルをキューに追加したことを記録"""
+    update_progress(parent_job_id, total=count, queued=count)
+
+def record_result(parent_job_id: Optional[str], status: str) -> None:
+    """
+    ファイル処理結果を記録
+
+    Args:
+        parent_job_id: 親ジョブID
+        status: 'succeeded', 'failed', 'skipped' のいずれか
+    """
+    update_progress(parent_job_id, queued=-1, **{status: 1})
+
+def get_progress(parent_job_id: str) -> Dict[str, int]:
+    """
+    進捗カウンタを取得
+
+    Args:
+        parent_job_id: 親ジョブID
+
+    Returns:
+        dict: 各フィールドのカウント
+    """
+    raw = get_redis_connection().hgetall(_progress_key(parent_job_id))
+    return _decode_progress(raw)
+
+def _decode_progress(raw: dict) -> Dict[str, int]:
+    progress = {field: 0 for field in PROGRESS_FIELDS}
+    for field, value in raw.items():
+        field = field.decode('utf-8') if isinstance(field, bytes) else field
+        progress[field] = int(value)
+    return progress
+
+def _format_sse(event: str, data: dict, event_id: Optional[str] = None) -> str:
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+async def iter_progress_events(parent_job_id: str) -> AsyncIterator[str]:
+    """
+    進捗イベントをSSE形式で生成
+    最初に現在値のスナップショットを送り、以降は差分のみを送る
+
+    Args:
+        parent_job_id: 親ジョブID
+
+    Yields:
+        str: SSEメッセージ
+    """
+    redis_conn = get_async_redis_connection()
+    progress_key = _progress_key(parent_job_id)
+    events_key = _events_key(parent_job_id)
+
+    try:
+        # スナップショットと最新イベントIDを同時に取得し、取りこぼしを防ぐ
+        async with redis_conn.pipeline(transaction=True) as pipe:
+            pipe.hgetall(progress_key)
+            pipe.xrevrange(events_key, count=1)
+            raw_progress, latest = await pipe.execute()
+
+        last_id = latest[0][0].decode('utf-8') if latest else '0-0'
+        yield _format_sse('snapshot', _decode_progress(raw_progress), last_id)
+
+        while True:
+            response = await redis_conn.xread({events_key: last_id}, block=SSE_KEEPALIVE_MS)
+            if not response:
+                # 接続維持のためのコメント行
+                yield ": keep-alive\n\n"
+                continue
+
+            for _, messages in response:
+                for message_id, fields in messages:
+                    last_id = message_id.decode('utf-8')
+                    delta = json.loads(fields[b'delta'])
+                    yield _format_sse('progress', delta, last_id)
+    finally:
+        await redis_conn.close()
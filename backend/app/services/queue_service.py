@@ -1,25 +1,102 @@
 import os
-from typing import Optional
+import random
+from datetime import timedelta
+from typing import Optional, List, Dict, Any, Iterable, Tuple
 import redis
-from rq import Queue
+import redis.asyncio as async_redis
+from pydantic_settings import BaseSettings
+from rq import Queue, Retry
 from rq.job import Job
 
 from ..logging_config import setup_logging
+from .utils import url_to_id
 logger = setup_logging()
 
+# 圧縮済みジョブのキュー別集計（maintenance_serviceが更新）
+QUEUE_SUMMARY_KEY_PREFIX = 'job_summary:queue'
+
+# 処理待ちドキュメントの登録（同一ドキュメント・同一リビジョンの重複投入を防ぐ）
+PENDING_IMPORT_KEY_PREFIX = 'pending_import'
+PENDING_IMPORT_TTL = 24 * 60 * 60  # ワーカー停止などで解放されなかった場合の保険
+
+# ジョブ処理時間の集計（ワーカーの実行方式・キュー別）
+JOB_TIMING_KEY_PREFIX = 'job_timing'
+WORKER_MODES = ['fork', 'warm']
+
+# ファイルインポートタスク（循環インポートを避けるため、関数名を文字列で指定）
+IMPORT_FILE_TASK = 'app.services.svn_service.process_file_task'
+IMPORT_FILE_TIMEOUT = 30 * 60  # ファイルインポートジョブのタイムアウト（秒）
+# ローカルファイルアップロードタスク（引数の2番目がアップロードファイルの一時保存パス）
+LOCAL_UPLOAD_TASK = 'app.services.file_upload_service.process_local_file_upload'
+
 # 利用可能なすべてのキューのリスト
 ALL_QUEUES = [
     'default',
     'import_file',
+    'import_batch',
     'convert_pdf', 
     'explore_folder',
     'upload_local'
 ]
 
+class RetrySettings(BaseSettings):
+    """ジョブ再試行設定クラス"""
+    retry_max_attempts: int = 5  # 一時的な失敗に対する最大再試行回数
+    retry_base_delay: int = 10  # 初回再試行までの基準待ち時間（秒）
+    retry_max_delay: int = 600  # 再試行待ち時間の上限（秒）
+
+def build_retry() -> Retry:
+    """
+    ジッター付き指数バックオフの再試行設定を生成
+    待ち時間は基準値の2^n倍を上限とし、その半分から上限の間でランダムに選ぶ
+    （多数のジョブが同時に失敗しても再試行が一斉に集中しないようにする）
+    """
+    settings = RetrySettings()
+    intervals = []
+    for attempt in range(settings.retry_max_attempts):
+        cap = min(settings.retry_max_delay, settings.retry_base_delay * (2 ** attempt))
+        intervals.append(int(cap / 2 + random.uniform(0, cap / 2)))
+    return Retry(max=settings.retry_max_attempts, interval=intervals)
+
+class JobRetentionSettings(BaseSettings):
+    """ジョブ結果の保持期間設定クラス"""
+    job_result_ttl: int = 60 * 60  # 成功したジョブの保持期間（秒）
+    job_failure_ttl: int = 7 * 24 * 60 * 60  # 失敗したジョブの保持期間（秒）
+    # キューごとの上書き（JSON形式、例: QUEUE_RESULT_TTLS='{"import_batch": 600}'）
+    queue_result_ttls: Dict[str, int] = {}
+    queue_failure_ttls: Dict[str, int] = {}
+
+def get_job_ttls(queue_name: str) -> Dict[str, int]:
+    """
+    キューごとのジョブ保持期間を取得
+
+    Returns:
+        dict: result_ttl, failure_ttl
+    """
+    settings = JobRetentionSettings()
+    return {
+        'result_ttl': settings.queue_result_ttls.get(queue_name, settings.job_result_ttl),
+        'failure_ttl': settings.queue_failure_ttls.get(queue_name, settings.job_failure_ttl)
+    }
+
+# プロセス内で共有するRedisコネクションプール（fork後は自動的に再作成される）
+_redis_pool: Optional[redis.ConnectionPool] = None
+
 # Redis接続設定
 def get_redis_connection():
     """Redis接続を取得"""
-    return redis.Redis(
+    global _redis_pool
+    if _redis_pool is None:
+        _redis_pool = redis.ConnectionPool(
+            host=os.getenv('REDIS_HOST', 'redis'),
+            port=int(os.getenv('REDIS_PORT', 6379)),
+            db=int(os.getenv('REDIS_DB', 0))
+        )
+    return redis.Redis(connection_pool=_redis_pool)
+
+def get_async_redis_connection() -> async_redis.Redis:
+    """非同期Redis接続を取得（SSEなどリクエストハンドラ用）"""
+    return async_redis.Redis(
         host=os.getenv('REDIS_HOST', 'redis'),
         port=int(os.getenv('REDIS_PORT', 6379)),
         db=int(os.getenv('REDIS_DB', 0))
@@ -30,43 +107,156 @@ def get_queue(name: str = 'default') -> Queue:
     redis_conn = get_redis_connection()
     return Queue(name, connection=redis_conn)
 
+def _pending_import_key(doc_id: str, revision: Optional[int]) -> str:
+    return f"{PENDING_IMPORT_KEY_PREFIX}:{doc_id}:{revision if revision is not None else 'head'}"
+
+def build_import_job_id(doc_id: str, revision: Optional[int]) -> str:
+    """ドキュメントIDとリビジョンからファイルインポートジョブのIDを生成"""
+    return f"import_file-{doc_id}-{revision if revision is not None else 'head'}"
+
+def claim_document_imports(documents: Iterable[Tuple[str, Optional[int]]]) -> List[bool]:
+    """
+    ドキュメントを処理待ちとして登録
+    同じドキュメント・リビジョンが既に処理待ちの場合は登録できず、呼び出し元は投入を省略する
+
+    Args:
+        documents: (ドキュメントID, リビジョン)の列
+
+    Returns:
+        List[bool]: ドキュメントごとの登録可否（Trueの場合のみキューに追加すること）
+    """
+    documents = list(documents)
+    if not documents:
+        return []
+
+    pipe = get_redis_connection().pipeline(transaction=False)
+    for doc_id, revision in documents:
+        pipe.set(_pending_import_key(doc_id, revision), 1, nx=True, ex=PENDING_IMPORT_TTL)
+    return [bool(claimed) for claimed in pipe.execute()]
+
+def release_document_imports(documents: Iterable[Tuple[str, Optional[int]]]) -> None:
+    """
+    処理待ち登録を解除（処理完了・最終的な失敗・投入失敗時に呼び出す）
+
+    Args:
+        documents: (ドキュメントID, リビジョン)の列
+    """
+    keys = [_pending_import_key(doc_id, revision) for doc_id, revision in documents]
+    if not keys:
+        return
+    try:
+        get_redis_connection().delete(*keys)
+    except Exception as e:
+        # 解放できなくてもTTLで期限切れになる
+        logger.warning(f"Failed to release pending imports: {str(e)}")
+
 def enqueue_import_file_task(
     url: str, 
     username: Optional[str] = None, 
     password: Optional[str] = None, 
-    ip_address: Optional[str] = None
+    ip_address: Optional[str] = None,
+    parent_job_id: Optional[str] = None,
+    delay: Optional[int] = None,
+    revision: Optional[int] = None
 ) -> Job:
     """
     SVNインポートタスクをキューに追加
+    ジョブIDはドキュメントIDとリビジョンから決まるため、同じファイルの同じ版は同じIDになる
     
     Args:
         url: SVNリソースURL
         username: SVNユーザー名
         password: SVNパスワード
         ip_address: IPアドレス
+        parent_job_id: 親ジョブID（進捗集計用）
+        delay: 実行開始までの待ち時間（秒、再試行用）
+        revision: ファイルの最終変更リビジョン
     
     Returns:
         Job: キューに追加されたジョブ
     """
     # 循環インポートを避けるため、関数名を文字列で指定
     queue = get_queue('import_file')
-    job = queue.enqueue(
-        'app.services.svn_service.process_file_task',  # モジュールパスを文字列で指定
+    args = (
+        IMPORT_FILE_TASK,
         url,
         username,
         password,
         ip_address,
-        job_timeout='30m'  # 30分のタイムアウト
+        parent_job_id,
+        revision
     )
+    options = {
+        'job_id': build_import_job_id(url_to_id(url), revision),
+        'job_timeout': IMPORT_FILE_TIMEOUT,
+        'retry': build_retry(),
+        'meta': {'parent_job_id': parent_job_id},
+        **get_job_ttls('import_file')
+    }
+    if delay:
+        job = queue.enqueue_in(timedelta(seconds=delay), *args, **options)
+    else:
+        job = queue.enqueue(*args, **options)
     
     logger.info(f"Enqueued SVN import task for {url}, job_id: {job.id}")
     return job
 
+def enqueue_replay_task(
+    func_name: str,
+    args: Tuple[Any, ...],
+    kwargs: Dict[str, Any],
+    queue_name: str,
+    timeout: Optional[int],
+    parent_job_id: Optional[str] = None
+) -> Optional[Job]:
+    """
+    デッドレターキューのタスクを再投入
+    通常の投入と同じ保持期間・再試行設定を使い、ファイルインポートは処理待ち登録と
+    ドキュメントIDから決まるジョブIDにより、同じファイルの取り込み中に重複して投入しない
+
+    Args:
+        func_name: タスクの関数名
+        args: タスクの引数
+        kwargs: タスクのキーワード引数
+        queue_name: キュー名
+        timeout: ジョブのタイムアウト（秒）
+        parent_job_id: 親ジョブID（進捗集計用）
+
+    Returns:
+        Optional[Job]: 投入したジョブ（同じドキュメントが既に処理待ちのため投入しなかった場合はNone）
+    """
+    if func_name == IMPORT_FILE_TASK and not kwargs:
+        url, username, password, ip_address, task_parent_job_id, revision = (list(args) + [None] * 6)[:6]
+        document = (url_to_id(url), revision)
+        if not claim_document_imports([document])[0]:
+            logger.info(f"Skipped replay of {url}: already pending import")
+            return None
+        try:
+            return enqueue_import_file_task(
+                url, username, password, ip_address, task_parent_job_id, revision=revision
+            )
+        except Exception:
+            release_document_imports([document])
+            raise
+
+    return get_queue(queue_name).enqueue_call(
+        func_name,
+        args=args,
+        kwargs=kwargs,
+        timeout=timeout,
+        retry=build_retry(),
+        meta={'parent_job_id': parent_job_id},
+        **get_job_ttls(queue_name)
+    )
+
 def enqueue_svn_explore_task(
     folder_url: str, 
     username: Optional[str] = None, 
     password: Optional[str] = None, 
-    ip_address: Optional[str] = None
+    ip_address: Optional[str] = None,
+    parent_job_id: Optional[str] = None,
+    delay: Optional[int] = None,
+    file_filter: Optional[Dict[str, Any]] = None
 ) -> Job:
     """
     SVNフォルダ探索タスクをキューに追加
@@ -76,27 +266,88 @@ def enqueue_svn_explore_task(
         username: SVNユーザー名
         password: SVNパスワード
         ip_address: IPアドレス
+        parent_job_id: 親ジョブID（進捗集計用）
+        delay: 実行開始までの待ち時間（秒、過負荷時の先送り用）
+        file_filter: 取り込むファイルの絞り込み条件
     
     Returns:
         Job: キューに追加されたジョブ
     """
     # 循環インポートを避けるため、関数名を文字列で指定
     queue = get_queue('explore_folder')
-    job = queue.enqueue(
+    args = (
         'app.services.svn_service.process_explore_task',
         folder_url,
         username,
         password,
         ip_address,
-        job_timeout='1h'  # 1時間のタイムアウト（大規模フォルダ用）
+        parent_job_id,
+        file_filter
     )
+    options = {
+        'job_timeout': '1h',  # 1時間のタイムアウト（大規模フォルダ用）
+        'retry': build_retry(),
+        'meta': {'parent_job_id': parent_job_id},
+        **get_job_ttls('explore_folder')
+    }
+    if delay:
+        job = queue.enqueue_in(timedelta(seconds=delay), *args, **options)
+    else:
+        job = queue.enqueue(*args, **options)
     
     logger.info(f"Enqueued SVN explore task for {folder_url}, job_id: {job.id}")
     return job
 
+def enqueue_import_batch_tasks(
+    batches: List[List[Dict[str, Any]]],
+    username: Optional[str] = None,
+    password: Optional[str] = None,
+    ip_address: Optional[str] = None,
+    parent_job_id: Optional[str] = None
+) -> List[Job]:
+    """
+    ファイルインポートのバッチタスクをまとめてキューに追加
+    Redisへの書き込みは1回のパイプラインで行う
+    
+    Args:
+        batches: ファイル情報(url, size, revision)のリストのリスト
+        username: SVNユーザー名
+        password: SVNパスワード
+        ip_address: IPアドレス
+        parent_job_id: 親ジョブID（進捗集計用）
+    
+    Returns:
+        List[Job]: キューに追加されたジョブのリスト
+    """
+    if not batches:
+        return []
+    
+    # 循環インポートを避けるため、関数名を文字列で指定
+    queue = get_queue('import_batch')
+    job_datas = [
+        Queue.prepare_data(
+            'app.services.svn_service.process_import_batch_task',
+            args=(batch, username, password, ip_address, parent_job_id),
+            timeout='1h',  # 1時間のタイムアウト（バッチ全体）
+            # バッチ全体は再試行しない（成功済みのファイルを再処理しないよう、失敗はファイル単位で再投入する）
+            meta={'parent_job_id': parent_job_id},
+            **get_job_ttls('import_batch')
+        )
+        for batch in batches
+    ]
+    
+    # enqueue_manyは内部で1つのパイプラインにまとめて実行する
+    jobs = queue.enqueue_many(job_datas)
+    
+    logger.info(f"Enqueued {len(jobs)} import batches ({sum(len(b) for b in batches)} files)")
+    return jobs
+
 def enqueue_pdf_conversion_task(
     file_url: str,
-    file_path: str
+    file_path: str,
+    job_id: Optional[str] = None,
+    at_front: bool = False,
+    parent_job_id: Optional[str] = None
 ) -> Job:
     """
     PDF変換タスクをキューに追加
@@ -104,6 +355,9 @@ def enqueue_pdf_conversion_task(
     Args:
         file_url: ファイルURL
         file_path: 一時ファイルのパス
+        job_id: ジョブID（省略時は自動生成）
+        at_front: キューの先頭に追加するか（表示のための遅延変換など）
+        parent_job_id: 親ジョブID（取り込み時の変換の場合）
     
     Returns:
         Job: キューに追加されたジョブ
@@ -114,7 +368,13 @@ def enqueue_pdf_conversion_task(
         'app.services.file_processor_service.process_pdf_conversion_task',
         file_url,
         file_path,
-        job_timeout='30m'  # 30分のタイムアウト
+        parent_job_id,
+        job_id=job_id,
+        at_front=at_front,
+        meta={'parent_job_id': parent_job_id},
+        job_timeout='30m',  # 30分のタイムアウト
+        retry=build_retry(),
+        **get_job_ttls('convert_pdf')
     )
     
     logger.info(f"Enqueued PDF conversion task for {file_url}, job_id: {job.id}")
@@ -122,16 +382,17 @@ def enqueue_pdf_conversion_task(
 
 def enqueue_local_file_upload_task(
     absolute_path: str,
-    file_data: bytes,
+    staged_file_path: str,
     file_name: str,
     job_id: str
 ) -> Job:
     """
     ローカルファイルアップロードタスクをキューに追加
+    ファイルデータは共有ボリュームに一時保存したパスで渡し、Redisには載せない
     
     Args:
         absolute_path: 絶対パス（完全なファイルパス）
-        file_data: ファイルデータ（バイト）
+        staged_file_path: アップロードされたファイルの一時保存パス
         file_name: ファイル名
         job_id: 親ジョブID（進捗追跡用）
     
@@ -141,45 +402,115 @@ def enqueue_local_file_upload_task(
     # 循環インポートを避けるため、関数名を文字列で指定
     queue = get_queue('upload_local')
     job = queue.enqueue(
-        'app.services.file_upload_service.process_local_file_upload',
+        LOCAL_UPLOAD_TASK,
         absolute_path,
-        file_data,
+        staged_file_path,
         file_name,
         job_id,
-        job_timeout='10m'  # 10分のタイムアウト
+        job_timeout='10m',  # 10分のタイムアウト
+        retry=build_retry(),
+        meta={'parent_job_id': job_id},
+        **get_job_ttls('upload_local')
     )
     
     logger.info(f"Enqueued local file upload task for {file_name}, job_id: {job.id}")
     return job
 
+def record_job_timing(queue_name: str, worker_mode: str, work_seconds: float, overhead_seconds: float) -> None:
+    """
+    ジョブ1件あたりの処理時間（ジョブ関数の実行時間）とオーバーヘッド（fork・初期化など）を加算
+
+    Args:
+        queue_name: キュー名
+        worker_mode: ワーカーの実行方式（'fork' または 'warm'）
+        work_seconds: ジョブ関数の実行時間（秒）
+        overhead_seconds: ジョブ実行全体からジョブ関数の実行時間を除いた時間（秒）
+    """
+    try:
+        key = f"{JOB_TIMING_KEY_PREFIX}:{worker_mode}:{queue_name}"
+        pipe = get_redis_connection().pipeline(transaction=False)
+        pipe.hincrby(key, 'jobs', 1)
+        pipe.hincrbyfloat(key, 'work_seconds', work_seconds)
+        pipe.hincrbyfloat(key, 'overhead_seconds', overhead_seconds)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record job timing for {queue_name}: {str(e)}")
+
+def get_job_timing_stats() -> dict:
+    """
+    ワーカーの実行方式・キューごとのジョブ処理時間の統計を取得
+
+    Returns:
+        dict: {実行方式: {キュー名: {jobs, avg_work_ms, avg_overhead_ms, overhead_ratio}}}
+    """
+    redis_conn = get_redis_connection()
+    keys = [(mode, queue_name) for mode in WORKER_MODES for queue_name in ALL_QUEUES]
+    pipe = redis_conn.pipeline(transaction=False)
+    for mode, queue_name in keys:
+        pipe.hgetall(f"{JOB_TIMING_KEY_PREFIX}:{mode}:{queue_name}")
+
+    stats = {}
+    for (mode, queue_name), raw in zip(keys, pipe.execute()):
+        if not raw:
+            continue
+        jobs = int(raw[b'jobs'])
+        work = float(raw[b'work_seconds'])
+        overhead = float(raw[b'overhead_seconds'])
+        stats.setdefault(mode, {})[queue_name] = {
+            'jobs': jobs,
+            'avg_work_ms': round(work / jobs * 1000, 1),
+            'avg_overhead_ms': round(overhead / jobs * 1000, 1),
+            'overhead_ratio': round(overhead / (work + overhead), 3) if work + overhead else 0.0
+        }
+    return stats
+
 def get_queue_stats() -> dict:
     """
     キューの統計情報を取得
+    レジストリの走査やクリーンアップは行わず、キュー長・レジストリ件数と
+    圧縮済みジョブの集計値を1回のパイプラインで取得する
     
     Returns:
         dict: キュー統計情報
     """
     redis_conn = get_redis_connection()
     
-    stats = {}
+    pipe = redis_conn.pipeline(transaction=False)
     for queue_name in ALL_QUEUES:
         queue = Queue(queue_name, connection=redis_conn)
+        pipe.llen(queue.key)
+        pipe.zcard(queue.started_job_registry.key)
+        pipe.zcard(queue.failed_job_registry.key)
+        pipe.zcard(queue.finished_job_registry.key)
+        pipe.hgetall(f"{QUEUE_SUMMARY_KEY_PREFIX}:{queue_name}")
+    results = pipe.execute()
+    
+    stats = {}
+    for i, queue_name in enumerate(ALL_QUEUES):
+        queued, started, failed, finished, summary = results[i * 5:(i + 1) * 5]
+        summary = {key.decode('utf-8'): int(value) for key, value in summary.items()}
         stats[queue_name] = {
-            'queued_jobs': queue.count,
-            'started_jobs': queue.started_job_registry.count,
-            'failed_jobs': queue.failed_job_registry.count,
-            'successful_jobs': queue.finished_job_registry.count,
+            'queued_jobs': queued,
+            'started_jobs': started,
+            'failed_jobs': failed + summary.get('failed', 0),
+            'successful_jobs': finished + summary.get('finished', 0),
         }
     
     return stats
 
-def get_job_list(queue_name: Optional[str] = None, status: Optional[str] = None) -> list:
+def get_job_list(
+    queue_name: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = 200
+) -> list:
     """
     ジョブ一覧を取得
+    レジストリ全体は走査せず、ステータスごとに新しいものから最大limit件を取得する
     
     Args:
         queue_name: キュー名（指定しない場合は全キュー）
         status: ジョブステータス（'queued', 'started', 'finished', 'failed', 'deferred', 'scheduled'）
+        limit: キュー・ステータスごとの最大取得件数
     
     Returns:
         list: ジョブ情報のリスト
@@ -192,42 +523,39 @@ def get_job_list(queue_name: Optional[str] = None, status: Optional[str] = None)
     else:
         queues_to_check = ALL_QUEUES
     
+    statuses = [status] if status else ['queued', 'started', 'finished', 'failed', 'deferred', 'scheduled']
     jobs = []
     
     for q_name in queues_to_check:
         queue = Queue(q_name, connection=redis_conn)
+        registries = {
+            'started': queue.started_job_registry,
+            'finished': queue.finished_job_registry,
+            'failed': queue.failed_job_registry,
+            'deferred': queue.deferred_job_registry,
+            'scheduled': queue.scheduled_job_registry,
+        }
         
-        # ステータスに基づいてジョブを取得
-        if status:
-            if status == 'queued':
-                job_ids = queue.get_job_ids()
-            elif status == 'started':
-                job_ids = queue.started_job_registry.get_job_ids()
-            elif status == 'finished':
-                job_ids = queue.finished_job_registry.get_job_ids()
-            elif status == 'failed':
-                job_ids = queue.failed_job_registry.get_job_ids()
-            elif status == 'deferred':
-                job_ids = queue.deferred_job_registry.get_job_ids()
-            elif status == 'scheduled':
-                job_ids = queue.scheduled_job_registry.get_job_ids()
-            else:
-                continue
-        else:
-            # ステータス指定がない場合は全ジョブを取得
-            job_ids = queue.get_job_ids() + \
-                     queue.started_job_registry.get_job_ids() + \
-                     queue.finished_job_registry.get_job_ids() + \
-                     queue.failed_job_registry.get_job_ids() + \
-                     queue.deferred_job_registry.get_job_ids() + \
-                     queue.scheduled_job_registry.get_job_ids()
+        # ステータスに基づいてジョブIDを取得（レジストリのクリーンアップは行わない）
+        pipe = redis_conn.pipeline(transaction=False)
+        for job_status in statuses:
+            if job_status == 'queued':
+                pipe.lrange(queue.key, 0, limit - 1)
+            elif job_status in registries:
+                pipe.zrevrange(registries[job_status].key, 0, limit - 1)
+        job_ids = []
+        for ids in pipe.execute():
+            job_ids.extend(job_id.decode('utf-8') for job_id in ids)
         
         # 重複を排除
-        job_ids = list(set(job_ids))
+        job_ids = list(dict.fromkeys(job_ids))
         
-        for job_id in job_ids:
+        fetched_jobs = Job.fetch_many(job_ids, connection=redis_conn) if job_ids else []
+        for job_id, job in zip(job_ids, fetched_jobs):
+            if job is None:
+                # 保持期間が過ぎて削除済みのジョブ
+                continue
             try:
-                job = Job.fetch(job_id, connection=redis_conn)
                 # ジョブ結果がバイトデータの場合、Base64エンコードして返す
                 result_value = None
                 if job.result:
@@ -240,7 +568,7 @@ def get_job_list(queue_name: Optional[str] = None, status: Optional[str] = None)
                 jobs.append({
                     'id': job.id,
                     'queue': q_name,
-                    'status': job.get_status(),
+                    'status': job.get_status(refresh=False),
                     'created_at': job.created_at.isoformat() if job.created_at else None,
                     'started_at': job.started_at.isoformat() if job.started_at else None,
                     'ended_at': job.ended_at.isoformat() if job.ended_at else None,
@@ -1,8 +1,30 @@
+import json
 import os
 import subprocess
-from typing import List, Optional
+import tempfile
+from typing import List, Optional, Iterator, Tuple
 from xml.etree import ElementTree
 from urllib.parse import urlparse, urlunparse
+from pydantic_settings import BaseSettings
+
+from ..logging_config import setup_logging
+from .svn_dav_client import SvnDavClient, DavProtocolError, get_http_session
+from .host_limit_service import svn_host_slot
+
+logger = setup_logging()
+"""
+SVNクライアントモジュール
+svnコマンド、またはHTTP(S)のリポジトリではWebDAVでSVNにアクセスする
+公開関数はアクセス先ホストごとの同時アクセス数の制限（host_limit_service）の枠内で実行する
+"""
+
+class SvnClientSettings(BaseSettings):
+    """SVNクライアント設定クラス"""
+    # 'subprocess': svnコマンドを実行
+    # 'dav': HTTP(S)のリポジトリにはWebDAVで直接アクセス（未対応のサーバー・操作はsvnコマンドを使用）
+    svn_client_backend: str = "subprocess"
+    svn_http_timeout: int = 60  # WebDAVアクセスのタイムアウト（秒）
+    svn_http_pool_size: int = 10  # ホストごとに保持するHTTP接続数
 
 def build_auth_args(username: Optional[str], password: Optional[str]) -> List[str]:
     """SVN認証引数を構築"""
@@ -13,36 +35,231 @@ def build_auth_args(username: Optional[str], password: Optional[str]) -> List[st
         auth_args.extend(["--password", password])
     return auth_args
 
-def get_file_info(file_url: str, auth_args: List[str], ip_address: Optional[str] = None):
-    """ファイル情報を取得"""
+def get_file_info(
+    file_url: str,
+    auth_args: List[str],
+    ip_address: Optional[str] = None,
+    timeout: Optional[int] = None
+):
+    """ファイル情報を取得（timeout: svnコマンドのタイムアウト秒数）"""
     # IPアドレスが渡された場合、ドメインの代わりにIPアドレスを用いてSVNにアクセスする
     target_url = _rewrite_svn_url(file_url, ip_address)
 
-    info_result = _run_svn_command(["info", "--xml", target_url], auth_args)
+    with svn_host_slot(target_url):
+        dav_client = _get_dav_client(file_url, auth_args, ip_address)
+        if dav_client is not None:
+            try:
+                return dav_client.get_file_info(target_url)
+            except DavProtocolError as e:
+                _log_fallback(file_url, e)
+
+        info_result = _run_svn_command(["info", "--xml", target_url], auth_args, timeout=timeout)
     entry = ElementTree.fromstring(info_result.stdout).find(".//entry")
+    commit = entry.find("commit")
+    relative_url = entry.find("relative-url")
     return {
         "is_folder": entry.get("kind") == "dir",
         "file_name": entry.find("name").text if entry.find("name") is not None 
-                  else os.path.basename(file_url.rstrip('/'))
+                  else os.path.basename(file_url.rstrip('/')),
+        "revision": int(commit.get("revision")) if commit is not None else None,
+        # リポジトリの最新リビジョンと、リポジトリルートからのパス（^/trunk/...形式）
+        "head_revision": int(entry.get("revision")),
+        "relative_url": relative_url.text if relative_url is not None else None
     }
 
 def list_svn_directory(path: str, auth_args: List[str], ip_address: Optional[str] = None):
-    """SVNディレクトリをリスト"""
+    """SVNディレクトリをリスト（アクセス数の制限はlist_svn_entriesで行う）"""
     # IPアドレスが渡された場合、ドメインの代わりにIPアドレスを用いてSVNにアクセスする
     target_path = _rewrite_svn_url(path, ip_address)
 
     result = _run_svn_command(["list", "--xml", target_path], auth_args)
     return ElementTree.fromstring(result.stdout)
 
-def download_svn_file(file_url: str, auth_args: List[str], ip_address: Optional[str] = None):
-    """SVNファイルをダウンロード (1MBチャンクで処理)"""
+def list_svn_entries(path: str, auth_args: List[str], ip_address: Optional[str] = None) -> List[dict]:
+    """SVNフォルダ直下のエントリ情報(種別・名前・サイズ・最終変更リビジョン)を取得"""
+    target_path = _rewrite_svn_url(path, ip_address)
+    with svn_host_slot(target_path):
+        dav_client = _get_dav_client(path, auth_args, ip_address)
+        if dav_client is not None:
+            try:
+                return dav_client.list_entries(target_path)
+            except DavProtocolError as e:
+                _log_fallback(path, e)
+
+        return parse_list_entries(list_svn_directory(path, auth_args, ip_address))
+
+def parse_list_entries(root: ElementTree.Element) -> List[dict]:
+    """svn list --xmlの結果からエントリ情報(種別・名前・サイズ・最終変更リビジョン)を抽出"""
+    return [_parse_list_entry(entry) for entry in root.findall(".//entry")]
+
+def iter_svn_tree(path: str, auth_args: List[str], ip_address: Optional[str] = None) -> Iterator[dict]:
+    """
+    SVNフォルダ配下の全エントリを再帰的に列挙
+    列挙結果はいったん一時ファイルに書き出し、ホストの同時アクセス枠を解放してから返す
+    （呼び出し元がキューへの追加などを行う間、SVNにアクセスしないまま枠を保持し続けないため）
+    
+    Yields:
+        dict: エントリ情報(種別・フォルダからの相対パス・サイズ・最終変更リビジョン)
+    """
+    target_path = _rewrite_svn_url(path, ip_address)
+    with tempfile.TemporaryFile(mode="w+", encoding="utf-8") as spool:
+        with svn_host_slot(target_path):
+            for entry in _iter_svn_tree_entries(path, auth_args, ip_address):
+                spool.write(json.dumps(entry) + "\n")
+        spool.seek(0)
+        for line in spool:
+            yield json.loads(line)
+
+def _iter_svn_tree_entries(path: str, auth_args: List[str], ip_address: Optional[str] = None) -> Iterator[dict]:
+    """SVNフォルダ配下の全エントリを再帰的に列挙（WebDAVが使えない場合はsvnコマンド）"""
+    target_path = _rewrite_svn_url(path, ip_address)
+    dav_client = _get_dav_client(path, auth_args, ip_address)
+    if dav_client is not None:
+        yielded = False
+        try:
+            for entry in dav_client.iter_tree(target_path):
+                yielded = True
+                yield entry
+            return
+        except DavProtocolError as e:
+            if yielded:
+                raise  # 途中から切り替えると列挙済みのエントリが重複する
+            _log_fallback(path, e)
+
+    yield from _iter_svn_tree_command(path, auth_args, ip_address)
+
+def _iter_svn_tree_command(path: str, auth_args: List[str], ip_address: Optional[str] = None) -> Iterator[dict]:
+    """
+    svnコマンドでSVNフォルダ配下の全エントリを1回で再帰的に列挙
+    svn list -R --xmlの出力を逐次解析するため、エントリ数が多くてもメモリ使用量は一定
+    """
+    # IPアドレスが渡された場合、ドメインの代わりにIPアドレスを用いてSVNにアクセスする
+    target_path = _rewrite_svn_url(path, ip_address)
+
+    cmd = ["svn", "list", "-R", "--xml", "--depth", "infinity", target_path] + auth_args
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    completed = False
+    parse_error = None
+    try:
+        list_element = None
+        for event, element in ElementTree.iterparse(process.stdout, events=("start", "end")):
+            if event == "start":
+                if element.tag == "list":
+                    list_element = element
+                continue
+            if element.tag == "entry":
+                yield _parse_list_entry(element)
+                # 処理済みのエントリは木から外してメモリを解放する
+                if list_element is not None:
+                    list_element.clear()
+        completed = True
+    except ElementTree.ParseError as e:
+        # コマンドが失敗して出力が途切れた場合は、終了コードのエラーを優先する
+        parse_error = e
+    finally:
+        if not completed and process.poll() is None:
+            # 呼び出し元が途中で列挙を止めた場合
+            process.kill()
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        returncode = process.wait()
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(
+            returncode, cmd, stderr=stderr.decode('utf-8', errors='replace')
+        )
+    if parse_error is not None:
+        raise parse_error
+
+def _parse_list_entry(entry: ElementTree.Element) -> dict:
+    size = entry.find("size")
+    commit = entry.find("commit")
+    return {
+        "kind": entry.get("kind"),
+        "name": entry.find("name").text,
+        "size": int(size.text) if size is not None else None,
+        "revision": int(commit.get("revision")) if commit is not None else None
+    }
+
+def get_svn_log(
+    url: str,
+    auth_args: List[str],
+    start_revision: int,
+    end_revision: int,
+    ip_address: Optional[str] = None
+) -> List[dict]:
+    """
+    指定範囲のリビジョンの変更履歴(svn log -v)を取得
+    
+    Returns:
+        List[dict]: リビジョンごとの変更パス（古い順）。パスはリポジトリルートからの絶対パス
+    """
+    # IPアドレスが渡された場合、ドメインの代わりにIPアドレスを用いてSVNにアクセスする
+    target_url = _rewrite_svn_url(url, ip_address)
+
+    with svn_host_slot(target_url):
+        result = _run_svn_command(
+            ["log", "-v", "--xml", "-r", f"{start_revision}:{end_revision}", target_url], auth_args
+        )
+    log_entries = []
+    for log_entry in ElementTree.fromstring(result.stdout).findall("logentry"):
+        log_entries.append({
+            "revision": int(log_entry.get("revision")),
+            "paths": [
+                {
+                    "path": path.text,
+                    "action": path.get("action"),  # A: 追加, M: 変更, D: 削除, R: 置換
+                    "kind": path.get("kind") or None,
+                    "copyfrom_path": path.get("copyfrom-path")
+                }
+                for path in log_entry.findall("paths/path")
+            ]
+        })
+    return log_entries
+
+def download_svn_file(
+    file_url: str,
+    dest_path: str,
+    auth_args: List[str],
+    ip_address: Optional[str] = None
+) -> None:
+    """
+    SVNファイルをダウンロードしてdest_pathに保存 (1MBチャンクで処理)
+    ホストの同時アクセス枠は保存が終わった時点で解放する
+    """
     # IPアドレスが渡された場合、ドメインの代わりにIPアドレスを用いてSVNにアクセスする
     target_url = _rewrite_svn_url(file_url, ip_address)
 
+    with svn_host_slot(target_url), open(dest_path, 'wb') as f:
+        dav_client = _get_dav_client(file_url, auth_args, ip_address)
+        if dav_client is not None:
+            written = False
+            try:
+                for chunk in dav_client.download(target_url):
+                    written = True
+                    f.write(chunk)
+                return
+            except DavProtocolError as e:
+                if written:
+                    raise
+                _log_fallback(file_url, e)
+
+        for chunk in _download_svn_file_command(target_url, auth_args):
+            f.write(chunk)
+
+def _download_svn_file_command(target_url: str, auth_args: List[str]) -> Iterator[bytes]:
+    """svn catでSVNファイルをダウンロード"""
     CHUNK_SIZE = 1024 * 1024  # 1MB固定
+    cmd = ["svn", "cat", target_url] + auth_args
     process = subprocess.Popen(
-        ["svn", "cat", target_url] + auth_args,
+        cmd,
         stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
         text=False
     )
     try:
@@ -50,17 +267,86 @@ def download_svn_file(file_url: str, auth_args: List[str], ip_address: Optional[
             yield chunk
     finally:
         process.stdout.close()
-        process.wait()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        returncode = process.wait()
+    
+    # 途中で失敗した場合に不完全なファイルを処理しないよう、終了コードを確認
+    if returncode != 0:
+        raise subprocess.CalledProcessError(
+            returncode, cmd, stderr=stderr.decode('utf-8', errors='replace')
+        )
+
+def fetch_svn_files(
+    base_url: str,
+    relative_paths: List[str],
+    dest_dir: str,
+    auth_args: List[str],
+    ip_address: Optional[str] = None
+) -> None:
+    """
+    フォルダ配下の複数ファイルを1回のSVNセッションでローカルに取得
+    空の作業コピーをチェックアウトし、指定したファイルだけを更新で取り込む（疎なチェックアウト）
+
+    Args:
+        base_url: 全ファイルに共通するフォルダのURL
+        relative_paths: base_urlからの相対パスのリスト
+        dest_dir: 作業コピーを作成する空のディレクトリ
+        auth_args: 認証引数
+        ip_address: IPアドレス
+    """
+    # IPアドレスが渡された場合、ドメインの代わりにIPアドレスを用いてSVNにアクセスする
+    target_url = _rewrite_svn_url(base_url, ip_address)
+
+    with svn_host_slot(target_url):
+        _run_svn_command(["checkout", "--quiet", "--depth", "empty", target_url, dest_dir], auth_args)
+
+        # ファイル数が多くてもコマンドライン長の制限に掛からないよう、対象は一覧ファイルで渡す
+        targets_file = os.path.join(dest_dir, ".svn", "fetch-targets")
+        with open(targets_file, "w", encoding="utf-8") as f:
+            for relative_path in relative_paths:
+                f.write(os.path.join(dest_dir, relative_path) + "\n")
+        _run_svn_command(["update", "--quiet", "--parents", "--targets", targets_file], auth_args)
+
+def _get_dav_client(url: str, auth_args: List[str], ip_address: Optional[str]) -> Optional[SvnDavClient]:
+    """WebDAVでアクセスする設定・URLの場合にクライアントを返す"""
+    settings = SvnClientSettings()
+    parsed_url = urlparse(url)
+    if settings.svn_client_backend != 'dav' or parsed_url.scheme not in ('http', 'https'):
+        return None
+
+    username, password = _parse_auth_args(auth_args)
+    # HTTPSのリポジトリにIPアドレスで接続する場合も、SNIと証明書の検証には元のホスト名を使う
+    server_hostname = parsed_url.hostname if ip_address and parsed_url.scheme == 'https' else None
+    return SvnDavClient(
+        get_http_session(settings.svn_http_pool_size, server_hostname),
+        username,
+        password,
+        # IPアドレスで接続する場合も、仮想ホストの判定には元のホスト名を使わせる
+        host=parsed_url.netloc if ip_address else None,
+        timeout=settings.svn_http_timeout
+    )
+
+def _parse_auth_args(auth_args: List[str]) -> Tuple[Optional[str], Optional[str]]:
+    """build_auth_argsの結果からユーザー名・パスワードを取り出す"""
+    options = dict(zip(auth_args[::2], auth_args[1::2]))
+    return options.get("--username"), options.get("--password")
+
+def _log_fallback(url: str, exc: Exception) -> None:
+    logger.warning(f"WebDAV access to {url} is not supported, falling back to svn command: {str(exc)}")
 
-def _run_svn_command(cmd: List[str], auth_args: List[str]) -> subprocess.CompletedProcess:
-    """SVNコマンドを実行 (プライベートメソッド)"""
+def _run_svn_command(
+    cmd: List[str], auth_args: List[str], timeout: Optional[int] = None
+) -> subprocess.CompletedProcess:
+    """SVNコマンドを実行 (プライベートメソッド、タイムアウト時はプロセスを終了してTimeoutExpiredを送出)"""
     full_cmd = ["svn"] + cmd + auth_args
     return subprocess.run(
         full_cmd,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         text=True,
-        check=True
+        check=True,
+        timeout=timeout
     )
 
 def _rewrite_svn_url(url: str, ip_address: Optional[str]) -> str:
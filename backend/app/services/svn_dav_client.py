@@ -0,0 +1,277 @@
+import os
+import threading
+from collections import deque
+from typing import Optional, Iterator, List, Dict, Any, Tuple
+from urllib.parse import quote, unquote
+from xml.etree import ElementTree
+
+import requests
+from requests.adapters import HTTPAdapter
+
+"""
+SVNリポジトリのHTTP(WebDAV)クライアントモジュール
+mod_dav_svnにPROPFIND(情報・一覧)とGET(内容)で直接アクセスし、
+svnコマンドのプロセス起動と接続・認証の確立を呼び出しごとに行わずに済ませる
+"""
+
+DAV_NAMESPACE = '{DAV:}'
+SVN_DAV_NAMESPACE = '{http://subversion.tigris.org/xmlns/dav/}'
+
+PROPFIND_BODY = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<D:propfind xmlns:D="DAV:" xmlns:S="http://subversion.tigris.org/xmlns/dav/">'
+    '<D:prop><D:resourcetype/><D:getcontentlength/><D:version-name/><S:baseline-relative-path/></D:prop>'
+    '</D:propfind>'
+)
+OPTIONS_BODY = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<D:options xmlns:D="DAV:"><D:activity-collection-set/></D:options>'
+)
+
+CHUNK_SIZE = 1024 * 1024  # 1MB固定
+
+# URLのパスでそのまま使える文字（%XXは符号化済みとして扱う。svnコマンドのURL正規化と同じ扱い）
+URL_PATH_SAFE_CHARS = "/%:@!$&'()*+,;=~"
+
+class SvnDavError(Exception):
+    """SVNサーバーへのHTTPアクセスの失敗（statusがNoneの場合は接続エラー）"""
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class DavProtocolError(Exception):
+    """サーバーがSVNのWebDAVアクセスに対応していない（svnコマンドで再実行する）"""
+
+# 証明書のホスト名 -> HTTPセッション（Noneは通常の接続用）
+_sessions: Dict[Optional[str], requests.Session] = {}
+_sessions_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+class ServerHostnameAdapter(HTTPAdapter):
+    """
+    IPアドレスに書き換えたURLに接続しつつ、TLSのSNIと証明書の検証には元のホスト名を使うアダプター
+    （Hostヘッダーの上書きだけでは、証明書のホスト名がIPアドレスと一致せず検証に失敗する）
+    """
+
+    def __init__(self, server_hostname: str, **kwargs):
+        self.server_hostname = server_hostname
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs.update(server_hostname=self.server_hostname, assert_hostname=self.server_hostname)
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+
+def get_http_session(pool_size: int, server_hostname: Optional[str] = None) -> requests.Session:
+    """
+    接続を再利用するHTTPセッションを取得（プロセス・証明書のホスト名ごとに1つ）
+
+    Args:
+        pool_size: ホストごとに保持する接続数
+        server_hostname: HTTPSのリポジトリにIPアドレスで接続する場合の元のホスト名
+    """
+    global _sessions_pid
+    with _session_lock:
+        # fork後の子プロセスでは、親プロセスの接続を共有しないよう作り直す
+        if _sessions_pid != os.getpid():
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+        session = _sessions.get(server_hostname)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+            if server_hostname:
+                https_adapter = ServerHostnameAdapter(
+                    server_hostname, pool_connections=pool_size, pool_maxsize=pool_size
+                )
+            else:
+                https_adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', https_adapter)
+            _sessions[server_hostname] = session
+        return session
+
+class SvnDavClient:
+    """
+    SVNリポジトリのWebDAVクライアント
+    各メソッドのURLはIPアドレスへの書き換え後のもので、元のホスト名はHostヘッダーで渡す
+    （HTTPSの場合はServerHostnameAdapterを使うセッションを渡すこと）
+    """
+
+    def __init__(
+        self,
+        session: requests.Session,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        host: Optional[str] = None,
+        timeout: int = 60
+    ):
+        self.session = session
+        self.auth = (username, password or '') if username else None
+        self.headers = {'Host': host} if host else {}
+        self.timeout = timeout
+
+    def get_file_info(self, url: str) -> Dict[str, Any]:
+        """ファイル情報を取得（svn_client.get_file_infoと同じ形式）"""
+        resources = self._propfind(url, depth='0')
+        if not resources:
+            raise DavProtocolError(f"PROPFIND {url} returned no resources")
+        resource = resources[0]
+
+        relative_path = resource['relative_path']
+        return {
+            "is_folder": resource['is_folder'],
+            "file_name": os.path.basename(resource['path']) or os.path.basename(url.rstrip('/')),
+            "revision": resource['revision'],
+            "head_revision": self._get_youngest_revision(url),
+            "relative_url": "^/" + quote(relative_path) if relative_path is not None else None
+        }
+
+    def list_entries(self, url: str) -> List[dict]:
+        """フォルダ直下のエントリ情報を取得（svn_client.parse_list_entriesと同じ形式）"""
+        return [entry for entry, _ in self._list_children(url)]
+
+    def iter_tree(self, url: str) -> Iterator[dict]:
+        """
+        フォルダ配下の全エントリを再帰的に列挙
+        フォルダごとにPROPFIND(Depth: 1)を送るが、接続は使い回す
+
+        Yields:
+            dict: エントリ情報(種別・フォルダからの相対パス・サイズ・最終変更リビジョン)
+        """
+        folders = deque([(url, '')])
+        while folders:
+            folder_url, prefix = folders.popleft()
+            for entry, child_url in self._list_children(folder_url):
+                name = prefix + entry['name']
+                yield {**entry, 'name': name}
+                if entry['kind'] == 'dir':
+                    folders.append((child_url, name + '/'))
+
+    def download(self, url: str) -> Iterator[bytes]:
+        """ファイルの内容を取得 (1MBチャンクで処理)"""
+        response = self._request('GET', url, stream=True)
+        try:
+            yield from response.iter_content(CHUNK_SIZE)
+        except requests.RequestException as e:
+            # 途中で切断された場合に不完全なファイルを処理しないよう、エラーとして扱う
+            raise SvnDavError(f"GET {url} was interrupted: {str(e)}") from e
+        finally:
+            response.close()
+
+    def _list_children(self, url: str) -> List[Tuple[dict, str]]:
+        """フォルダ直下のエントリ情報と、その取得用URLの組を返す"""
+        self_path = _decoded_path(url)
+        children = []
+        for resource in self._propfind(url, depth='1'):
+            if resource['path'] == self_path:
+                continue  # フォルダ自身
+            name = os.path.basename(resource['path'])
+            child_url = url.rstrip('/') + '/' + quote(name, safe='')
+            children.append(({
+                "kind": "dir" if resource['is_folder'] else "file",
+                "name": name,
+                "size": resource['size'],
+                "revision": resource['revision']
+            }, child_url))
+        return children
+
+    def _propfind(self, url: str, depth: str) -> List[Dict[str, Any]]:
+        response = self._request(
+            'PROPFIND',
+            url,
+            data=PROPFIND_BODY.encode('utf-8'),
+            headers={'Depth': depth, 'Content-Type': 'text/xml; charset="utf-8"'}
+        )
+        if response.status_code != 207:
+            raise DavProtocolError(f"PROPFIND {url} returned {response.status_code} instead of 207")
+        try:
+            return _parse_multistatus(response.content)
+        except ElementTree.ParseError as e:
+            raise DavProtocolError(f"PROPFIND {url} returned invalid XML: {str(e)}") from e
+
+    def _get_youngest_revision(self, url: str) -> Optional[int]:
+        """リポジトリの最新リビジョンを取得（HTTPv2に対応したmod_dav_svn以外ではNone）"""
+        try:
+            response = self._request(
+                'OPTIONS',
+                url,
+                data=OPTIONS_BODY.encode('utf-8'),
+                headers={'Content-Type': 'text/xml; charset="utf-8"'}
+            )
+        except DavProtocolError:
+            return None
+        youngest = response.headers.get('SVN-Youngest-Rev')
+        response.close()
+        if youngest is None or not youngest.strip().isdigit():
+            return None
+        return int(youngest)
+
+    def _request(self, method: str, url: str, headers: Optional[dict] = None, **kwargs) -> requests.Response:
+        try:
+            response = self.session.request(
+                method,
+                _encode_url(url),
+                headers={**self.headers, **(headers or {})},
+                auth=self.auth,
+                timeout=self.timeout,
+                **kwargs
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise SvnDavError(f"{method} {url} failed: {str(e)}") from e
+
+        if response.status_code in (405, 501):
+            response.close()
+            raise DavProtocolError(f"{method} {url} is not supported by the server")
+        if response.status_code >= 400:
+            response.close()
+            raise SvnDavError(f"{method} {url} returned {response.status_code}", response.status_code)
+        return response
+
+def _parse_multistatus(content: bytes) -> List[Dict[str, Any]]:
+    """PROPFINDの応答(multistatus)からリソースごとの情報を抽出"""
+    resources = []
+    for response in ElementTree.fromstring(content).findall(f'{DAV_NAMESPACE}response'):
+        href = response.findtext(f'{DAV_NAMESPACE}href')
+        if href is None:
+            continue
+
+        props = {}
+        for propstat in response.findall(f'{DAV_NAMESPACE}propstat'):
+            status = (propstat.findtext(f'{DAV_NAMESPACE}status') or '').split()
+            if len(status) < 2 or status[1] != '200':
+                continue  # 存在しないプロパティ(404)など
+            prop = propstat.find(f'{DAV_NAMESPACE}prop')
+            if prop is not None:
+                props.update({child.tag: child for child in prop})
+
+        resource_type = props.get(f'{DAV_NAMESPACE}resourcetype')
+        size = props.get(f'{DAV_NAMESPACE}getcontentlength')
+        version = props.get(f'{DAV_NAMESPACE}version-name')
+        relative_path = props.get(f'{SVN_DAV_NAMESPACE}baseline-relative-path')
+        resources.append({
+            "path": _decoded_path(href),
+            "is_folder": resource_type is not None and resource_type.find(f'{DAV_NAMESPACE}collection') is not None,
+            "size": int(size.text) if size is not None and (size.text or '').isdigit() else None,
+            "revision": int(version.text) if version is not None and (version.text or '').isdigit() else None,
+            "relative_path": (relative_path.text or '') if relative_path is not None else None
+        })
+    return resources
+
+def _decoded_path(url: str) -> str:
+    """URL(またはhref)の復号済みパス（末尾の/なし）"""
+    return unquote(_split_url(url)[1]).rstrip('/')
+
+def _encode_url(url: str) -> str:
+    """URLのパスの空白や非ASCII文字などを符号化（符号化済みの%XXはそのまま）"""
+    origin, path = _split_url(url)
+    return origin + quote(path, safe=URL_PATH_SAFE_CHARS)
+
+def _split_url(url: str) -> Tuple[str, str]:
+    """
+    URLを'scheme://host'とパスに分割
+    ファイル名に含まれる'#'や'?'をフラグメント・クエリとして扱わないよう、urlparseは使わない
+    """
+    if '://' not in url:
+        return '', url
+    scheme, rest = url.split('://', 1)
+    netloc, slash, path = rest.partition('/')
+    return f"{scheme}://{netloc}", slash + path
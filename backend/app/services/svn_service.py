@@ -1,57 +1,271 @@
+import asyncio
 import os
+import shutil
 import tempfile
-from typing import Optional, Dict, Any
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Tuple, Callable
+from pydantic_settings import BaseSettings
 
 from ..logging_config import setup_logging
 from .svn_client import (
     build_auth_args,
     get_file_info,
-    list_svn_directory,
-    download_svn_file
+    list_svn_entries,
+    iter_svn_tree,
+    download_svn_file,
+    fetch_svn_files
 )
 from .file_converter import FileConverter
-from .queue_service import enqueue_import_file_task, enqueue_svn_explore_task
+from .queue_service import (
+    IMPORT_FILE_TASK,
+    IMPORT_FILE_TIMEOUT,
+    build_retry,
+    build_import_job_id,
+    claim_document_imports,
+    release_document_imports,
+    enqueue_import_file_task,
+    enqueue_import_batch_tasks,
+    enqueue_svn_explore_task
+)
 from ..models.svn_models import SVNImportRequest
 from .utils import url_to_id
+from .elasticsearch_service import get_es_service
 from .file_processor_service import process_file
+from .progress_service import update_progress, record_enqueued, record_result
+from .failure_service import (
+    WORKER_INTERRUPTIONS,
+    TransientError,
+    handle_task_failure,
+    classify_failure,
+    record_failure_cause,
+    add_dead_letter
+)
+from .admission_service import AdmissionSettings, is_overloaded
+from .file_filter_service import build_import_filter, filter_svn_entries
 
 logger = setup_logging()
 """
 SVNリポジトリ操作サービスモジュール
 """
 
-async def import_resource(request: SVNImportRequest):
-    """SVNファイルまたはフォルダをElasticSearchに取り込む"""
+class ExploreSettings(BaseSettings):
+    """フォルダ探索設定クラス"""
+    # 'recursive': svn list -Rで配下を1回で列挙, 'per_folder': フォルダごとに探索ジョブを作成
+    svn_explore_mode: str = "recursive"
+    explore_enqueue_chunk_size: int = 1000  # 再帰列挙時にまとめてキューに追加するファイル数
+
+class SvnRequestSettings(BaseSettings):
+    """APIリクエストからのSVNアクセス設定クラス"""
+    svn_request_timeout: int = 30  # インポート開始（svn infoなど）のタイムアウト（秒）
+    svn_request_workers: int = 4  # SVNにアクセスするスレッド数の上限
+    svn_info_cache_ttl: int = 10  # svn infoの結果をURLごとにキャッシュする秒数（0で無効）
+
+class ImportBatchSettings(BaseSettings):
+    """ファイルインポートのバッチ設定クラス"""
+    import_batch_max_files: int = 100  # 1バッチあたりの最大ファイル数
+    import_batch_max_bytes: int = 64 * 1024 * 1024  # 1バッチあたりの合計ファイルサイズ上限（バイト）
+    # 'checkout': バッチのファイルを疎なチェックアウトで一括取得, 'cat': ファイルごとにsvn catで取得
+    import_batch_fetch_mode: str = "checkout"
+    import_batch_workers: int = 4  # 一括取得したファイルを並列に処理するスレッド数
+
+# svn info結果のキャッシュ: (URL, 認証引数, IPアドレス) -> (有効期限, 結果)
+_file_info_cache: Dict[Tuple, Tuple[float, Dict[str, Any]]] = {}
+_file_info_cache_lock = threading.Lock()
+_request_executor: Optional[ThreadPoolExecutor] = None
+
+class ImportCancelledError(Exception):
+    """APIリクエストがタイムアウトで打ち切られたため、インポートを投入しなかった"""
+
+class _ImportCancellation:
+    """
+    APIリクエストの打ち切りとインポートの投入のどちらが先かを決める
+    打ち切られた後は投入せず、投入を始めた後は打ち切らずに結果を返す
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state: Optional[str] = None  # 'committed' または 'cancelled'
+
+    def commit(self) -> bool:
+        """投入を開始する（既に打ち切られている場合はFalse）"""
+        with self._lock:
+            if self._state is None:
+                self._state = 'committed'
+            return self._state == 'committed'
+
+    def cancel(self) -> bool:
+        """打ち切る（既に投入を開始している場合はFalse）"""
+        with self._lock:
+            if self._state is None:
+                self._state = 'cancelled'
+            return self._state == 'cancelled'
+
+async def import_resource(request: SVNImportRequest, parent_job_id: Optional[str] = None):
+    """
+    SVNファイルまたはフォルダをElasticSearchに取り込む
+    SVNへのアクセスはブロッキング処理のため、イベントループを止めないよう上限付きのスレッドで実行する
+    
+    Raises:
+        asyncio.TimeoutError: SVN_REQUEST_TIMEOUT秒以内にSVNの情報を取得できなかった場合
+            （スレッドの処理は続くが、ジョブの投入・同期対象の登録は行わない）
+    """
+    settings = SvnRequestSettings()
+    loop = asyncio.get_running_loop()
+    cancellation = _ImportCancellation()
+    future = loop.run_in_executor(
+        _get_request_executor(settings), start_import, request, parent_job_id or str(uuid.uuid4()), cancellation
+    )
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout=settings.svn_request_timeout)
+    except asyncio.TimeoutError:
+        if cancellation.cancel():
+            # スレッドの処理はImportCancelledErrorで終わるため、結果は参照せずに破棄する
+            future.add_done_callback(lambda done: done.cancelled() or done.exception())
+            raise
+        # 投入を始めていた場合はSVNへのアクセスは終わっているため、完了を待って結果を返す
+        return await future
+
+def _get_request_executor(settings: SvnRequestSettings) -> ThreadPoolExecutor:
+    """APIリクエストからのSVNアクセス用のスレッドプールを取得"""
+    global _request_executor
+    if _request_executor is None:
+        _request_executor = ThreadPoolExecutor(
+            max_workers=max(settings.svn_request_workers, 1), thread_name_prefix="svn-request"
+        )
+    return _request_executor
+
+def get_file_info_cached(
+    url: str, auth_args: List[str], ip_address: Optional[str] = None, timeout: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    短時間キャッシュしたsvn infoの結果を取得
+    インポートの連続クリックなどで同じURLの情報を何度もSVNサーバーに問い合わせないようにする
+    """
+    ttl = SvnRequestSettings().svn_info_cache_ttl
+    if ttl <= 0:
+        return get_file_info(url, auth_args, ip_address, timeout=timeout)
+    
+    key = (url, tuple(auth_args), ip_address)
+    now = time.monotonic()
+    with _file_info_cache_lock:
+        cached = _file_info_cache.get(key)
+    if cached is not None and cached[0] > now:
+        return dict(cached[1])
+    
+    resource_info = get_file_info(url, auth_args, ip_address, timeout=timeout)
+    with _file_info_cache_lock:
+        # 期限切れのエントリを掃除してからキャッシュする
+        for expired_key in [k for k, (expires_at, _) in _file_info_cache.items() if expires_at <= now]:
+            del _file_info_cache[expired_key]
+        _file_info_cache[key] = (now + ttl, resource_info)
+    return dict(resource_info)
+
+def start_import(
+    request: SVNImportRequest,
+    parent_job_id: str,
+    cancellation: Optional[_ImportCancellation] = None
+) -> dict:
+    """
+    SVNファイルまたはフォルダのインポートジョブをキューに追加
+    保留されていたインポートをワーカーから投入する場合にも使用する
+    
+    Args:
+        request: インポートリクエスト
+        parent_job_id: 進捗集計用の親ジョブID
+        cancellation: APIリクエストの打ち切り状態（打ち切られた場合は投入しない）
+    
+    Returns:
+        dict: 投入結果
+    
+    Raises:
+        ImportCancelledError: SVNの情報を取得する間にAPIリクエストが打ち切られた場合
+    """
+    # 循環インポートを避けるため関数内でインポート
+    from .sync_service import register_sync_root
+    
     auth_args = build_auth_args(request.username, request.password)  # 認証引数作成
-    resource_info = get_file_info(request.url, auth_args, request.ip_address)  # ファイル情報取得
+    resource_info = get_file_info_cached(
+        request.url, auth_args, request.ip_address, timeout=SvnRequestSettings().svn_request_timeout
+    )  # ファイル情報取得
+    if cancellation is not None and not cancellation.commit():
+        logger.warning(f"Import of {request.url} was cancelled by the request timeout, not enqueueing")
+        raise ImportCancelledError(f"Import of {request.url} was cancelled")
+    # 以降の変更は差分同期で取り込む
+    register_sync_root(request, resource_info)
+    file_filter = build_import_filter(request)
     
     if resource_info["is_folder"]:  # 指定されたリソースがフォルダの場合
-        # フォルダ探索タスクをキューに追加
+        # フォルダ探索タスクをキューに追加（ワーカーが先に完了しても進捗が崩れないよう先に計上）
+        update_progress(parent_job_id, exploring=1)
         job = enqueue_svn_explore_task(
             request.url, 
             request.username, 
             request.password, 
-            request.ip_address
+            request.ip_address,
+            parent_job_id,
+            file_filter=file_filter
         )
         
         return {
             "status": "success", 
             "message": f"Enqueued folder exploration task for {request.url}",
-            "job_id": job.id
+            "job_id": job.id,
+            "parent_job_id": parent_job_id
         }
     else: # 指定されたリソースがファイルの場合
+        document = (url_to_id(request.url), resource_info["revision"])
+        if not filter_svn_entries([{"url": request.url, "size": None}], file_filter):
+            # フォルダ内の除外したファイルと同じく、進捗の件数には含めない
+            return {
+                "status": "success",
+                "message": f"File {request.url} is excluded by the file filter",
+                "job_id": None,
+                "parent_job_id": parent_job_id
+            }
+        if _filter_unchanged([{"url": request.url, "revision": resource_info["revision"]}]) == []:
+            # 取り込み済みの版から変更されていない場合はダウンロードしない
+            update_progress(parent_job_id, total=1, skipped=1)
+            return {
+                "status": "success",
+                "message": f"File {request.url} is unchanged since revision {resource_info['revision']}",
+                "job_id": None,
+                "parent_job_id": parent_job_id
+            }
+        if not claim_document_imports([document])[0]:
+            # 同じファイルの同じ版が処理待ちの場合は、既存のジョブにまとめる
+            update_progress(parent_job_id, total=1, skipped=1)
+            return {
+                "status": "success",
+                "message": f"File {request.url} is already queued for import",
+                "job_id": build_import_job_id(*document),
+                "parent_job_id": parent_job_id
+            }
+        
         # 単一ファイルをキューに追加
-        job = enqueue_import_file_task(
-            request.url, 
-            request.username, 
-            request.password, 
-            request.ip_address
-        )
+        record_enqueued(parent_job_id)
+        try:
+            job = enqueue_import_file_task(
+                request.url, 
+                request.username, 
+                request.password, 
+                request.ip_address,
+                parent_job_id,
+                revision=resource_info["revision"]
+            )
+        except Exception:
+            record_enqueued(parent_job_id, -1)
+            release_document_imports([document])
+            raise
         
         return {
             "status": "success", 
             "message": f"Enqueued file {request.url} for import",
-            "job_id": job.id
+            "job_id": job.id,
+            "parent_job_id": parent_job_id
         }
 
 
@@ -59,7 +273,9 @@ def process_explore_task(
     folder_url: str, 
     username: Optional[str] = None, 
     password: Optional[str] = None, 
-    ip_address: Optional[str] = None
+    ip_address: Optional[str] = None,
+    parent_job_id: Optional[str] = None,
+    file_filter: Optional[Dict[str, Any]] = None
 ) -> dict:
     """
     RQワーカー用: SVNフォルダ探索タスクを処理
@@ -69,71 +285,503 @@ def process_explore_task(
         username: SVNユーザー名
         password: SVNパスワード
         ip_address: IPアドレス
+        parent_job_id: 親ジョブID（進捗集計用）
+        file_filter: 取り込むファイルの絞り込み条件
     
     Returns:
         dict: 処理結果
     """
+    processed_count = 0
+    enqueued_count = 0
+    
+    if is_overloaded():
+        # キューが溢れている間は探索を先送りし、これ以上ジョブを増やさない（再試行回数は消費しない）
+        delay = AdmissionSettings().admission_retry_after
+        try:
+            enqueue_svn_explore_task(
+                folder_url, username, password, ip_address, parent_job_id, delay=delay, file_filter=file_filter
+            )
+        except Exception as e:
+            # 先送りできない場合はこのまま探索する（探索中の件数は探索の完了・失敗時に減算される）
+            logger.warning(f"Failed to postpone exploration of {folder_url}, exploring now: {str(e)}")
+        else:
+            logger.info(f"Queues are overloaded, postponed exploration of {folder_url} by {delay}s")
+            return {
+                "status": "postponed",
+                "message": f"Postponed exploration by {delay}s due to queue pressure",
+                "processed_files": 0,
+                "enqueued_folders": 0,
+                "folder_url": folder_url
+            }
+    
     try:
         auth_args = build_auth_args(username, password)
         
-        # SVNディレクトリの内容を取得
-        root = list_svn_directory(folder_url, auth_args, ip_address)
-        
-        processed_count = 0
-        enqueued_count = 0
+        if ExploreSettings().svn_explore_mode == "recursive":
+            # 配下のフォルダもまとめて1回のコマンドで列挙する（サブフォルダの探索ジョブは作らない）
+            processed_count, skipped_count, batch_count = enqueue_recursive_listing(
+                folder_url, auth_args, username, password, ip_address, parent_job_id, file_filter
+            )
+            logger.info(
+                f"Enqueued {processed_count} files in {batch_count} batches from {folder_url} "
+                f"recursively ({skipped_count} skipped)"
+            )
+        else:
+            # SVNディレクトリの内容を取得
+            entries = list_svn_entries(folder_url, auth_args, ip_address)
         
-        for entry in root.findall(".//entry"):
-            kind = entry.get("kind")
-            name = entry.find("name").text
-            url = f"{folder_url}/{name}" if not folder_url.endswith("/") else f"{folder_url}{name}"
+            file_entries = []
+            for entry in entries:
+                url = _join_svn_url(folder_url, entry["name"])
             
-            if kind == "dir":
-                # サブフォルダの場合、さらに探索タスクをキューに追加
-                enqueue_svn_explore_task(url, username, password, ip_address)
-                enqueued_count += 1
-                logger.info(f"Enqueued subfolder exploration: {url}")
-            else:
-                # ファイルの場合、インポートタスクをキューに追加
-                enqueue_import_file_task(url, username, password, ip_address)
-                processed_count += 1
-                logger.info(f"Enqueued file import: {url}")
+                if entry["kind"] == "dir":
+                    # サブフォルダの場合、さらに探索タスクをキューに追加
+                    update_progress(parent_job_id, exploring=1)
+                    try:
+                        enqueue_svn_explore_task(
+                            url, username, password, ip_address, parent_job_id, file_filter=file_filter
+                        )
+                    except Exception:
+                        update_progress(parent_job_id, exploring=-1)
+                        raise
+                    enqueued_count += 1
+                    logger.info(f"Enqueued subfolder exploration: {url}")
+                else:
+                    file_entries.append({
+                        "url": url,
+                        "size": entry["size"],
+                        "revision": entry["revision"]
+                    })
         
-        return {
-            "status": "success",
-            "message": f"Processed {processed_count} files and enqueued {enqueued_count} subfolders",
-            "processed_files": processed_count,
-            "enqueued_folders": enqueued_count,
-            "folder_url": folder_url
-        }
+            processed_count, skipped_count, batch_count = enqueue_file_entries(
+                file_entries, username, password, ip_address, parent_job_id, file_filter
+            )
+            logger.info(
+                f"Enqueued {processed_count} files in {batch_count} batches from {folder_url} "
+                f"({skipped_count} skipped)"
+            )
         
     except Exception as e:
         logger.error(f"Failed to process explore task for {folder_url}: {str(e)}", exc_info=True)
-        return {
-            "status": "error",
-            "error": str(e),
-            "folder_url": folder_url
+        # 最終的な失敗の場合は探索中の件数も減算される
+        handle_task_failure(e, parent_job_id, progress_kind='folder')
+        raise
+    
+    # 自身の探索が完了したことを進捗に反映
+    update_progress(parent_job_id, exploring=-1)
+    
+    return {
+        "status": "success",
+        "message": f"Processed {processed_count} files and enqueued {enqueued_count} subfolders",
+        "processed_files": processed_count,
+        "enqueued_folders": enqueued_count,
+        "folder_url": folder_url
+    }
+
+def enqueue_recursive_listing(
+    folder_url: str,
+    auth_args: List[str],
+    username: Optional[str],
+    password: Optional[str],
+    ip_address: Optional[str],
+    parent_job_id: Optional[str],
+    file_filter: Optional[Dict[str, Any]] = None
+) -> Tuple[int, int, int]:
+    """
+    svn list -Rの結果を逐次読みながら、一定件数ごとにファイルをバッチにまとめてキューに追加
+    
+    Returns:
+        Tuple[int, int, int]: (投入したファイル数, 変更なし・処理待ちのため省略したファイル数, バッチ数)
+    """
+    chunk_size = ExploreSettings().explore_enqueue_chunk_size
+    file_entries = (
+        {
+            "url": _join_svn_url(folder_url, entry["name"]),
+            "size": entry["size"],
+            "revision": entry["revision"]
         }
+        for entry in iter_svn_tree(folder_url, auth_args, ip_address)
+        if entry["kind"] == "file"
+    )
+    
+    totals = [0, 0, 0]
+    while chunk := list(islice(file_entries, chunk_size)):
+        counts = enqueue_file_entries(chunk, username, password, ip_address, parent_job_id, file_filter)
+        totals = [total + count for total, count in zip(totals, counts)]
+    return tuple(totals)
+
+def enqueue_file_entries(
+    file_entries: List[Dict[str, Any]],
+    username: Optional[str],
+    password: Optional[str],
+    ip_address: Optional[str],
+    parent_job_id: Optional[str],
+    file_filter: Optional[Dict[str, Any]] = None
+) -> Tuple[int, int, int]:
+    """
+    ファイル情報をバッチにまとめてキューに追加
+    絞り込み条件に一致しないファイルは件数にも含めない
+    
+    Returns:
+        Tuple[int, int, int]: (投入したファイル数, 変更なし・処理待ちのため省略したファイル数, バッチ数)
+    """
+    file_entries = filter_svn_entries(file_entries, file_filter)
+    # 取り込み済みの版から変更されていないファイルはダウンロード前に除外する
+    changed_entries = _filter_unchanged(file_entries)
+    # 既に処理待ちのファイル（重複クリックや重なったフォルダのインポート）は投入しない
+    claims = claim_document_imports(_document_key(entry) for entry in changed_entries)
+    new_entries = [entry for entry, claimed in zip(changed_entries, claims) if claimed]
+    skipped_count = len(file_entries) - len(new_entries)
+    if skipped_count:
+        update_progress(parent_job_id, total=skipped_count, skipped=skipped_count)
+    
+    # ファイルはサイズに応じたバッチにまとめてキューに追加
+    batches = list(iter_import_batches(new_entries))
+    # ワーカーが結果を記録する前に件数を計上しておく
+    record_enqueued(parent_job_id, len(new_entries))
+    try:
+        enqueue_import_batch_tasks(batches, username, password, ip_address, parent_job_id)
+    except Exception:
+        record_enqueued(parent_job_id, -len(new_entries))
+        release_document_imports(_document_key(entry) for entry in new_entries)
+        raise
+    return len(new_entries), skipped_count, len(batches)
+
+def _filter_unchanged(file_entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Elasticsearchに保存済みのリビジョンと一覧のリビジョンが一致するファイルを除外
+    リビジョンが不明なファイル（一覧に無い・未登録のドキュメント）は残す
+    """
+    doc_ids = [url_to_id(entry["url"]) for entry in file_entries if entry.get("revision") is not None]
+    if not doc_ids:
+        return list(file_entries)
+    
+    stored_revisions = get_es_service().get_document_revisions(doc_ids)
+    return [
+        entry for entry in file_entries
+        if entry.get("revision") is None
+        or stored_revisions.get(url_to_id(entry["url"])) != entry["revision"]
+    ]
+
+def _join_svn_url(folder_url: str, name: str) -> str:
+    """フォルダURLと相対パスを結合"""
+    return f"{folder_url}/{name}" if not folder_url.endswith("/") else f"{folder_url}{name}"
+
+def _document_key(entry: Dict[str, Any]) -> Tuple[str, Optional[int]]:
+    """ファイル情報から処理待ち登録のキー(ドキュメントID, リビジョン)を生成"""
+    return url_to_id(entry["url"]), entry.get("revision")
+
+def iter_import_batches(file_entries: Iterable[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    """
+    ファイル情報をインポートバッチに分割
+    ファイル数の上限に加えて合計サイズの上限でも区切るため、
+    小さいファイルは大きなバッチに、大きいファイルは小さなバッチにまとまる
+    
+    Args:
+        file_entries: ファイル情報(url, size, revision)の列
+    
+    Yields:
+        List[Dict[str, Any]]: 1バッチ分のファイル情報
+    """
+    settings = ImportBatchSettings()
+    batch = []
+    batch_bytes = 0
+    
+    for entry in file_entries:
+        size = entry.get("size") or 0
+        if batch and (
+            len(batch) >= settings.import_batch_max_files
+            or batch_bytes + size > settings.import_batch_max_bytes
+        ):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(entry)
+        batch_bytes += size
+    
+    if batch:
+        yield batch
+
+def process_import_batch_task(
+    file_entries: List[Dict[str, Any]],
+    username: Optional[str] = None,
+    password: Optional[str] = None,
+    ip_address: Optional[str] = None,
+    parent_job_id: Optional[str] = None
+) -> dict:
+    """
+    RQワーカー用: 複数ファイルをまとめて処理してElasticsearchに保存
+    
+    Args:
+        file_entries: ファイル情報(url, size, revision)のリスト
+        username: SVNユーザー名
+        password: SVNパスワード
+        ip_address: IPアドレス
+        parent_job_id: 親ジョブID（進捗集計用）
+    
+    Returns:
+        dict: ファイルごとの処理結果を含むバッチ処理結果
+    """
+    settings = ImportBatchSettings()
+    # 結果を記録済みのファイルURL（一括取得後の並列処理のスレッドからも追加される）
+    finished_urls = set()
+    try:
+        if settings.import_batch_fetch_mode == "checkout" and len(file_entries) > 1:
+            results = _import_batch_from_checkout(
+                file_entries, username, password, ip_address, parent_job_id, finished_urls
+            )
+        else:
+            results = [
+                _import_batch_entry(
+                    entry,
+                    lambda entry=entry: _import_svn_file(
+                        entry["url"], username, password, ip_address, entry.get("revision")
+                    ),
+                    username, password, ip_address, parent_job_id, finished_urls
+                )
+                for entry in file_entries
+            ]
+    except Exception as e:
+        # バッチ全体は再試行しないため、未処理のファイルだけをファイル単位の失敗として扱う
+        unfinished_entries = [entry for entry in file_entries if entry["url"] not in finished_urls]
+        logger.error(
+            f"Import batch failed with {len(unfinished_entries)} unfinished files: {str(e)}", exc_info=True
+        )
+        # タイムアウトなどによる中断はファイル自体の失敗ではないため、単一ファイルのジョブとして再投入する
+        failure = TransientError(str(e), cause='batch_interrupted') if isinstance(e, WORKER_INTERRUPTIONS) else e
+        for entry in unfinished_entries:
+            _fail_batch_entry(entry, failure, username, password, ip_address, parent_job_id)
+        raise
+    
+    succeeded_count = sum(1 for r in results if r["status"] == "succeeded")
+    failed_count = sum(1 for r in results if r["status"] == "failed")
+    requeued_count = sum(1 for r in results if r["status"] == "requeued")
+    logger.info(
+        f"Processed import batch: {succeeded_count} succeeded, {failed_count} failed, "
+        f"{requeued_count} requeued"
+    )
+    
+    return {
+        "status": "success" if succeeded_count == len(results) else "partial",
+        "processed_files": len(results),
+        "succeeded_files": succeeded_count,
+        "failed_files": failed_count,
+        "requeued_files": requeued_count,
+        "results": results
+    }
+
+def _import_batch_entry(
+    entry: Dict[str, Any],
+    import_func: Callable[[], bool],
+    username: Optional[str],
+    password: Optional[str],
+    ip_address: Optional[str],
+    parent_job_id: Optional[str],
+    finished_urls: set
+) -> dict:
+    """バッチ内の1ファイルを処理し、結果の記録と処理待ち登録の解除を行う"""
+    file_url = entry["url"]
+    try:
+        import_func()
+        record_result(parent_job_id, "succeeded")
+        finished_urls.add(file_url)
+        release_document_imports([_document_key(entry)])
+        return {"url": file_url, "status": "succeeded"}
+    except WORKER_INTERRUPTIONS:
+        # ジョブのタイムアウトなどはこのファイルの失敗ではないため、次のファイルに進まずバッチを中断する
+        raise
+    except Exception as e:
+        # バッチ全体を再試行すると成功済みファイルも再処理されるため、ファイル単位で扱う
+        result = _fail_batch_entry(entry, e, username, password, ip_address, parent_job_id)
+        finished_urls.add(file_url)
+        return result
+
+def _fail_batch_entry(
+    entry: Dict[str, Any],
+    exc: Exception,
+    username: Optional[str],
+    password: Optional[str],
+    ip_address: Optional[str],
+    parent_job_id: Optional[str]
+) -> dict:
+    """バッチ内の1ファイルの失敗を処理し、再投入したファイル以外は処理待ち登録を解除する"""
+    status = _handle_batch_file_failure(
+        exc, entry["url"], username, password, ip_address, parent_job_id, entry.get("revision")
+    )
+    if status != "requeued":
+        release_document_imports([_document_key(entry)])
+    return {"url": entry["url"], "status": status, "error": str(exc)}
+
+def _import_batch_from_checkout(
+    file_entries: List[Dict[str, Any]],
+    username: Optional[str],
+    password: Optional[str],
+    ip_address: Optional[str],
+    parent_job_id: Optional[str],
+    finished_urls: set
+) -> List[dict]:
+    """
+    バッチのファイルを疎なチェックアウトで一括取得し、ローカルディスクから並列に処理
+    ファイルごとにsvn catを実行するとSVNセッションの確立と認証がファイル数だけ発生するため、
+    バッチ単位で1回にまとめる。作業領域の使用量はバッチのサイズ上限で抑えられる
+    """
+    settings = ImportBatchSettings()
+    file_urls = [entry["url"] for entry in file_entries]
+    base_url, relative_paths = _split_common_base(file_urls)
+    scratch_dir = tempfile.mkdtemp(prefix="svn_batch_")
+    try:
+        try:
+            fetch_svn_files(
+                base_url, relative_paths, scratch_dir, build_auth_args(username, password), ip_address
+            )
+        except Exception as e:
+            # 一括取得に失敗した場合はファイルごとの取得に切り替える（個別のエラーはそちらで扱う）
+            logger.warning(f"Failed to check out import batch under {base_url}, falling back to svn cat: {str(e)}")
+            record_failure_cause('batch_checkout_failed')
+            return [
+                _import_batch_entry(
+                    entry,
+                    lambda entry=entry: _import_svn_file(
+                        entry["url"], username, password, ip_address, entry.get("revision")
+                    ),
+                    username, password, ip_address, parent_job_id, finished_urls
+                )
+                for entry in file_entries
+            ]
+        
+        def import_entry(entry: Dict[str, Any], relative_path: str) -> dict:
+            local_path = os.path.join(scratch_dir, relative_path)
+            return _import_batch_entry(
+                entry,
+                lambda: _import_local_svn_file(local_path, entry["url"], entry.get("revision"), parent_job_id),
+                username, password, ip_address, parent_job_id, finished_urls
+            )
+        
+        executor = ThreadPoolExecutor(max_workers=max(settings.import_batch_workers, 1))
+        try:
+            return list(executor.map(import_entry, file_entries, relative_paths))
+        finally:
+            # タイムアウトなどで中断した場合は、未着手のファイルを処理せずに呼び出し元へ返す
+            executor.shutdown(wait=True, cancel_futures=True)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+def _split_common_base(file_urls: List[str]) -> Tuple[str, List[str]]:
+    """ファイルURLの共通の親フォルダURLと、そこからの相対パスを求める"""
+    parts = [file_url.split('/') for file_url in file_urls]
+    common = os.path.commonprefix([file_parts[:-1] for file_parts in parts])
+    return '/'.join(common), ['/'.join(file_parts[len(common):]) for file_parts in parts]
+
+def _handle_batch_file_failure(
+    exc: Exception,
+    file_url: str,
+    username: Optional[str],
+    password: Optional[str],
+    ip_address: Optional[str],
+    parent_job_id: Optional[str],
+    revision: Optional[int] = None
+) -> str:
+    """
+    バッチ内の1ファイルの失敗を処理
+    一時的な失敗は単一ファイルのジョブとして遅延再投入し、恒久的な失敗はデッドレターキューへ送る
+
+    Returns:
+        str: 'requeued' または 'failed'
+    """
+    transient, cause = classify_failure(exc)
+    record_failure_cause(cause)
+    
+    if transient:
+        delay = build_retry().intervals[0]
+        enqueue_import_file_task(
+            file_url, username, password, ip_address, parent_job_id, delay=delay, revision=revision
+        )
+        logger.warning(f"Transient failure ({cause}) for {file_url}, requeued in {delay}s")
+        return "requeued"
+    
+    record_result(parent_job_id, "failed")
+    add_dead_letter(
+        func_name=IMPORT_FILE_TASK,
+        args=(file_url, username, password, ip_address, parent_job_id, revision),
+        kwargs={},
+        queue_name='import_file',
+        timeout=IMPORT_FILE_TIMEOUT,
+        cause=cause,
+        error=str(exc),
+        transient=False,
+        parent_job_id=parent_job_id,
+        progress_kind='file'
+    )
+    return "failed"
 
 def process_file_task(
     file_url: str, 
     username: Optional[str] = None, 
     password: Optional[str] = None, 
-    ip_address: Optional[str] = None
+    ip_address: Optional[str] = None,
+    parent_job_id: Optional[str] = None,
+    revision: Optional[int] = None
 ) -> bool:
     """
     RQワーカー用: 単一ファイルを処理してElasticsearchに保存
     元のシグネチャを維持し、ファイルをダウンロード後にprocess_fileを呼び出す
+    失敗時は例外を送出し、一時的な失敗であればRQが指数バックオフで再試行する
     """
+    document = (url_to_id(file_url), revision)
+    try:
+        _import_svn_file(file_url, username, password, ip_address, revision)
+    except Exception as e:
+        if not handle_task_failure(e, parent_job_id, progress_kind='file'):
+            release_document_imports([document])
+        raise
+    
+    record_result(parent_job_id, "succeeded")
+    release_document_imports([document])
+    return True
+
+def _import_svn_file(
+    file_url: str,
+    username: Optional[str] = None,
+    password: Optional[str] = None,
+    ip_address: Optional[str] = None,
+    revision: Optional[int] = None
+) -> bool:
+    """SVNファイルをダウンロードしてprocess_fileで処理（失敗時は例外を送出）"""
+    temp_file_path = None
     try:
         # SVNファイルをダウンロード
         temp_file_path = _download_svn_file_to_temp(file_url, username, password, ip_address)
         
         # 新しいファイルプロセッササービスを使用してファイルを処理
-        return process_file(temp_file_path, file_url)
+        return process_file(temp_file_path, file_url, revision=revision)
+        
+    except Exception as e:
+        logger.error(f"Failed to process file {file_url}: {str(e)}", exc_info=True)
+        # 再試行時は再ダウンロードするため、一時ファイルは残さない
+        if temp_file_path:
+            shutil.rmtree(os.path.dirname(temp_file_path), ignore_errors=True)
+        raise
+
+def _import_local_svn_file(
+    local_path: str,
+    file_url: str,
+    revision: Optional[int] = None,
+    parent_job_id: Optional[str] = None
+) -> bool:
+    """チェックアウト済みのSVNファイルをprocess_fileで処理（失敗時は例外を送出）"""
+    temp_file_path = None
+    try:
+        # process_fileは一時ファイルの所有権を持つため、作業コピーから専用の一時ディレクトリへ移す
+        temp_file_path = _create_temp_file_path(file_url)
+        shutil.move(local_path, temp_file_path)
+        # 並列処理のスレッドからは実行中のジョブを参照できないため、親ジョブIDを渡す
+        return process_file(temp_file_path, file_url, revision=revision, parent_job_id=parent_job_id)
         
     except Exception as e:
         logger.error(f"Failed to process file {file_url}: {str(e)}", exc_info=True)
-        return False
+        if temp_file_path:
+            shutil.rmtree(os.path.dirname(temp_file_path), ignore_errors=True)
+        raise
 
 def _download_svn_file_to_temp(
     file_url: str, 
@@ -155,16 +803,17 @@ def _download_svn_file_to_temp(
     """
     auth_args = build_auth_args(username, password)
     
-    # 一時ディレクトリを作成
-    temp_dir = tempfile.mkdtemp()
-    doc_id = url_to_id(file_url)
-    file_name = file_url.split('/')[-1]
-    file_ext = os.path.splitext(file_name)[1]
-    temp_file_path = os.path.join(temp_dir, f"{doc_id}{file_ext}")
+    temp_file_path = _create_temp_file_path(file_url)
     
     # ファイルをダウンロード
-    with open(temp_file_path, 'wb') as f:
-        for chunk in download_svn_file(file_url, auth_args, ip_address):
-            f.write(chunk)
+    download_svn_file(file_url, temp_file_path, auth_args, ip_address)
     
     return temp_file_path
+
+def _create_temp_file_path(file_url: str) -> str:
+    """一時ディレクトリを作成し、ドキュメントIDをファイル名とする一時ファイルのパスを返す"""
+    temp_dir = tempfile.mkdtemp()
+    doc_id = url_to_id(file_url)
+    file_name = file_url.split('/')[-1]
+    file_ext = os.path.splitext(file_name)[1]
+    return os.path.join(temp_dir, f"{doc_id}{file_ext}")
@@ -0,0 +1,261 @@
+import json
+import os
+import time
+import uuid
+from typing import Dict, Any, List
+from urllib.parse import unquote
+
+from pydantic_settings import BaseSettings
+from redis.exceptions import LockError
+
+from ..logging_config import setup_logging
+from ..models.svn_models import SVNImportRequest
+from .svn_client import build_auth_args, get_file_info, get_svn_log
+from .svn_service import enqueue_file_entries
+from .queue_service import get_redis_connection, enqueue_svn_explore_task
+from .admission_service import is_overloaded
+from .elasticsearch_service import get_es_service
+from .file_converter import PDF_STORAGE_DIR
+from .pdf_conversion_service import remove_pdf_source
+from .file_filter_service import build_import_filter
+from .progress_service import update_progress
+from .utils import url_to_id
+
+logger = setup_logging()
+"""
+SVN差分同期サービスモジュール
+インポートしたURL（同期ルート）ごとに同期済みリビジョンを記録し、
+svn logの変更履歴から追加・変更されたファイルだけを取り込み、削除されたファイルを削除する
+"""
+
+SYNC_ROOTS_KEY = 'svn_sync:roots'  # 同期ルートURL -> 同期情報(JSON)
+SYNC_LOCK_PREFIX = 'svn_sync:lock'  # 同期ルートごとの排他ロック
+
+class SyncSettings(BaseSettings):
+    """SVN差分同期設定クラス"""
+    svn_sync_interval: int = 900  # 定期同期の間隔（秒、0で無効）
+    svn_sync_lock_timeout: int = 60 * 60  # 同期ルートのロックの最大保持時間（秒、1回の同期の所要時間より長くする）
+    # 同期ルートにSVNパスワードを保存するか（Redisには平文で保存される。Falseの場合は認証なしで同期する）
+    svn_sync_store_password: bool = True
+
+def register_sync_root(request: SVNImportRequest, resource_info: Dict[str, Any]) -> None:
+    """
+    インポートしたURLを同期ルートとして登録
+    インポート開始時点のリポジトリの最新リビジョンを同期済みリビジョンとする
+
+    Args:
+        request: インポートリクエスト
+        resource_info: get_file_infoの結果
+    """
+    relative_url = resource_info.get("relative_url")
+    if not relative_url or resource_info.get("head_revision") is None:
+        logger.warning(f"Cannot register {request.url} for sync: repository revision information is unavailable")
+        return
+
+    root = {
+        "url": request.url,
+        "username": request.username,
+        "password": request.password if SyncSettings().svn_sync_store_password else None,
+        "ip_address": request.ip_address,
+        "file_filter": build_import_filter(request),
+        # '^/trunk/docs' -> '/trunk/docs'（svn logのパスと同じ形式）
+        "root_path": unquote(relative_url[1:]).rstrip("/") or "/",
+        "last_revision": resource_info["head_revision"],
+        "synced_at": time.time(),
+        "last_parent_job_id": None
+    }
+    try:
+        get_redis_connection().hset(SYNC_ROOTS_KEY, request.url, json.dumps(root))
+    except Exception as e:
+        # 同期ルートの登録失敗でインポート自体は止めない
+        logger.warning(f"Failed to register sync root {request.url}: {str(e)}")
+
+def list_sync_roots() -> List[Dict[str, Any]]:
+    """同期ルートの一覧を取得（パスワードは含めない）"""
+    roots = []
+    for raw in get_redis_connection().hvals(SYNC_ROOTS_KEY):
+        root = json.loads(raw)
+        root.pop("password", None)
+        roots.append(root)
+    return sorted(roots, key=lambda root: root["url"])
+
+def remove_sync_root(url: str) -> bool:
+    """同期ルートの登録を解除（取り込み済みのドキュメントは残る）"""
+    return bool(get_redis_connection().hdel(SYNC_ROOTS_KEY, url))
+
+def sync_all_roots() -> List[Dict[str, Any]]:
+    """
+    すべての同期ルートを同期
+    1つのルートの失敗で他のルートの同期は止めない
+
+    Returns:
+        List[dict]: ルートごとの同期結果
+    """
+    results = []
+    for url in get_redis_connection().hkeys(SYNC_ROOTS_KEY):
+        url = url.decode('utf-8')
+        try:
+            results.append(sync_root(url))
+        except Exception as e:
+            logger.error(f"Failed to sync {url}: {str(e)}", exc_info=True)
+            results.append({"url": url, "status": "failed", "error": str(e)})
+    return results
+
+def sync_root(url: str) -> Dict[str, Any]:
+    """
+    同期ルートを前回の同期済みリビジョンから最新リビジョンまで同期
+    処理量は変更されたパスの数に比例し、リポジトリ全体の大きさには依存しない
+    手動の同期と定期同期が同じルートを同時に処理しないよう、ルートごとにロックを取得する
+
+    Args:
+        url: 同期ルートURL
+
+    Returns:
+        dict: 同期結果（他で同期中の場合はstatusが`in_progress`、キューの過負荷で先送りした場合は`deferred`）
+    """
+    lock = get_redis_connection().lock(
+        f"{SYNC_LOCK_PREFIX}:{url}", timeout=SyncSettings().svn_sync_lock_timeout, blocking=False
+    )
+    if not lock.acquire():
+        logger.info(f"Skipped sync of {url}: already being synced")
+        return {"url": url, "status": "in_progress"}
+    try:
+        return _sync_root(url)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # タイムアウトで既に失効している場合
+            logger.warning(f"Sync lock for {url} expired before release")
+
+def _sync_root(url: str) -> Dict[str, Any]:
+    """ロックを取得した同期ルートを同期"""
+    raw = get_redis_connection().hget(SYNC_ROOTS_KEY, url)
+    if raw is None:
+        raise ValueError(f"{url} is not registered for sync")
+    root = json.loads(raw)
+
+    auth_args = build_auth_args(root["username"], root["password"])
+    head_revision = get_file_info(url, auth_args, root["ip_address"])["head_revision"]
+    last_revision = root["last_revision"]
+    if head_revision <= last_revision:
+        return {"url": url, "status": "up_to_date", "revision": head_revision}
+    if is_overloaded():
+        # 同期済みリビジョンは進めず、負荷が下がった後の同期でまとめて取り込む
+        logger.info(f"Queues are overloaded, deferred sync of {url} r{last_revision + 1}:{head_revision}")
+        return {"url": url, "status": "deferred", "revision": last_revision}
+
+    log_entries = get_svn_log(url, auth_args, last_revision + 1, head_revision, root["ip_address"])
+    changes = _collect_changes(log_entries, root, auth_args)
+
+    # 削除を先に反映してから、追加・変更されたファイルを取り込む
+    deleted_count = _delete_documents(changes["deleted_files"], changes["deleted_folders"])
+
+    parent_job_id = str(uuid.uuid4())
+    update_progress(parent_job_id, exploring=1)
+    try:
+        file_count, skipped_count, _ = enqueue_file_entries(
+            changes["files"], root["username"], root["password"], root["ip_address"], parent_job_id,
+            root.get("file_filter")
+        )
+        # コピー・移動で追加されたフォルダは、配下のファイルが履歴に個別に現れないため探索ジョブで列挙する
+        # （探索ジョブはキューの過負荷中は自身を先送りする）
+        for folder_url in changes["folders"]:
+            update_progress(parent_job_id, exploring=1)
+            try:
+                enqueue_svn_explore_task(
+                    folder_url, root["username"], root["password"], root["ip_address"], parent_job_id,
+                    file_filter=root.get("file_filter")
+                )
+            except Exception:
+                update_progress(parent_job_id, exploring=-1)
+                raise
+    finally:
+        update_progress(parent_job_id, exploring=-1)
+
+    root["last_revision"] = head_revision
+    root["synced_at"] = time.time()
+    root["last_parent_job_id"] = parent_job_id
+    get_redis_connection().hset(SYNC_ROOTS_KEY, url, json.dumps(root))
+
+    logger.info(
+        f"Synced {url} r{last_revision + 1}:{head_revision} - enqueued {file_count} files "
+        f"({skipped_count} skipped) and {len(changes['folders'])} folders, deleted {deleted_count} documents"
+    )
+    return {
+        "url": url,
+        "status": "synced",
+        "from_revision": last_revision + 1,
+        "revision": head_revision,
+        "enqueued_files": file_count,
+        "enqueued_folders": len(changes["folders"]),
+        "deleted_documents": deleted_count,
+        "parent_job_id": parent_job_id
+    }
+
+def _collect_changes(
+    log_entries: List[Dict[str, Any]], root: Dict[str, Any], auth_args: List[str]
+) -> Dict[str, list]:
+    """
+    変更履歴をパスごとの最終的な状態にまとめる
+    移動(リネーム)は移動元の削除(D)と移動先の追加(A)として扱う
+    種別を返さない古いサーバーの場合、削除以外のパスは最新リビジョンの情報から種別を判定する
+
+    Returns:
+        dict: files(取り込むファイル), folders(配下を取り込むフォルダ),
+              deleted_files(削除するファイルURL), deleted_folders(配下を削除するフォルダURL)
+    """
+    root_path = root["root_path"].rstrip("/")
+    root_url = root["url"].rstrip("/")
+
+    # パス -> (操作, 種別, リビジョン)。古い順に上書きするので最後の操作が残る
+    final_changes = {}
+    for log_entry in log_entries:
+        for change in log_entry["paths"]:
+            path = change["path"]
+            if path != root_path and not path.startswith(root_path + "/"):
+                continue  # 同じコミットに含まれる同期ルート外の変更
+            final_changes[path] = (change["action"], change["kind"], log_entry["revision"])
+
+    changes = {"files": [], "folders": [], "deleted_files": [], "deleted_folders": []}
+    for path, (action, kind, revision) in final_changes.items():
+        url = root_url + path[len(root_path):]
+        if action != "D" and kind is None:
+            # フォルダのコピーなどをファイルとして取り込まないよう、svn infoで種別を確認する
+            kind = "dir" if get_file_info(url, auth_args, root["ip_address"])["is_folder"] else "file"
+        if action == "D":
+            if kind != "dir":
+                changes["deleted_files"].append(url)
+            if kind != "file":
+                # 種別が不明な場合はファイル・フォルダの両方として削除する
+                changes["deleted_folders"].append(url)
+        elif kind == "dir":
+            if action in ("A", "R"):
+                # 追加・置換されたフォルダは、以前の内容を削除してから全体を取り込み直す
+                changes["deleted_folders"].append(url)
+                changes["folders"].append(url)
+            # M(プロパティ変更のみ)は対象外
+        else:
+            changes["files"].append({"url": url, "size": None, "revision": revision})
+    return changes
+
+def _delete_documents(file_urls: List[str], folder_urls: List[str]) -> int:
+    """削除されたファイル・フォルダ配下のドキュメントと保存済みPDF（遅延変換用の元ファイルを含む）を削除"""
+    es_service = get_es_service()
+    doc_ids = {url_to_id(url) for url in file_urls}
+    for folder_url in folder_urls:
+        doc_ids.update(es_service.get_document_ids_by_url_prefix(folder_url.rstrip("/") + "/"))
+    if not doc_ids:
+        return 0
+
+    result = es_service.delete_documents(list(doc_ids))
+    for doc_id in doc_ids:
+        pdf_path = os.path.join(PDF_STORAGE_DIR, f"{doc_id}.pdf")
+        try:
+            os.remove(pdf_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove PDF {pdf_path}: {str(e)}")
+        remove_pdf_source(doc_id)
+    return result["deleted"]
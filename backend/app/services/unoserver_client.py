@@ -0,0 +1,247 @@
+import os
+import random
+import threading
+import time
+import uuid
+from typing import List, Dict, Any, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from pydantic_settings import BaseSettings
+
+from ..logging_config import setup_logging
+from .queue_service import get_redis_connection
+from .failure_service import TransientError
+
+logger = setup_logging()
+"""
+変換サーバー(unoserver)クライアントモジュール
+複数のunoserverに処理中リクエストの少ない順で振り分け、ファイルサイズに応じたタイムアウトと
+異常なインスタンスを一定時間切り離すサーキットブレーカーで、変換の停止がワーカーに波及しないようにする
+"""
+
+UNOSERVER_OUTSTANDING_KEY_PREFIX = 'unoserver:outstanding'  # インスタンス -> 処理中リクエスト(Sorted Set: トークン -> 期限)
+UNOSERVER_CIRCUIT_KEY_PREFIX = 'unoserver:circuit'  # インスタンス -> 連続失敗数・切り離し期限(Hash)
+UNOSERVER_PROBE_KEY_PREFIX = 'unoserver:probe'  # 切り離し期限の経過後（半開状態）に試しに送っているリクエストのトークン
+CHUNK_SIZE = 8192
+
+# 自分が確保した試行のトークンの場合だけ削除する（期限切れ後に他のワーカーが確保した試行は残す）
+RELEASE_PROBE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class UnoserverSettings(BaseSettings):
+    """変換サーバー設定クラス"""
+    unoserver_urls: List[str] = ['http://unoserver:2004/request']  # 変換サーバーのURL（JSONのリスト）
+    unoserver_pool_size: int = 4  # インスタンスごとに保持するHTTP接続数
+    unoserver_connect_timeout: float = 5  # 接続タイムアウト（秒）
+    # 応答待ちのタイムアウト（秒）: 基準値 + ファイルサイズ(MB) × 係数（上限あり）
+    unoserver_base_timeout: float = 60
+    unoserver_timeout_per_mb: float = 20
+    unoserver_max_timeout: float = 25 * 60  # PDF変換ジョブのタイムアウト(30分)より短くする
+    unoserver_failure_threshold: int = 3  # この回数連続で失敗したインスタンスを切り離す
+    unoserver_recovery_timeout: int = 30  # 切り離したインスタンスに再び送るまでの時間（秒）
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+def get_unoserver_session(pool_size: int) -> requests.Session:
+    """接続を再利用するHTTPセッションを取得（プロセスごとに1つ）"""
+    global _session, _session_pid
+    with _session_lock:
+        # fork後の子プロセスでは、親プロセスの接続を共有しないよう作り直す
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+def convert_file(file_path: str, convert_to: str, output_path: str) -> str:
+    """
+    ファイルを変換サーバーで変換して保存
+
+    Args:
+        file_path: 変換するファイルのパス
+        convert_to: 変換後の形式（'pdf', 'docx'など）
+        output_path: 保存先のパス（変換が完了するまで既存のファイルは置き換えない）
+
+    Returns:
+        str: 保存先のパス
+
+    Raises:
+        TransientError: すべてのインスタンスが切り離されている場合
+        requests.RequestException: 変換サーバーとの通信に失敗した場合
+    """
+    settings = UnoserverSettings()
+    read_timeout = _get_read_timeout(file_path, settings)
+    endpoint, token = _acquire_endpoint(settings, settings.unoserver_connect_timeout + read_timeout)
+    temp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(file_path, 'rb') as f:
+            response = get_unoserver_session(settings.unoserver_pool_size).post(
+                endpoint,
+                files={'file': f},
+                data={'convert-to': convert_to},
+                stream=True,
+                timeout=(settings.unoserver_connect_timeout, read_timeout)
+            )
+        try:
+            response.raise_for_status()
+            # 保存済みのPDFは他のドキュメントとハードリンクで共有している場合があるため、
+            # 上書きせず別ファイルに書き込んでから置き換える
+            with open(temp_path, 'wb') as out_f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    out_f.write(chunk)
+        finally:
+            response.close()
+        os.replace(temp_path, output_path)
+        # 半開状態の試行の場合は、トークンを解放する前に切り離しを解除する
+        _record_success(endpoint)
+    except requests.RequestException as e:
+        if _is_instance_failure(e):
+            _record_failure(endpoint, settings)
+        raise
+    finally:
+        _release_endpoint(endpoint, token)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return output_path
+
+def get_unoserver_status() -> List[Dict[str, Any]]:
+    """
+    変換サーバーのインスタンスごとの状態を取得
+
+    Returns:
+        List[dict]: url, outstanding(処理中リクエスト数),
+                    state('closed': 正常 / 'open': 切り離し中 / 'half_open': 1件ずつ試行中), failures
+    """
+    settings = UnoserverSettings()
+    redis_conn = get_redis_connection()
+    now = time.time()
+    pipe = redis_conn.pipeline(transaction=False)
+    for endpoint in settings.unoserver_urls:
+        pipe.zcount(f"{UNOSERVER_OUTSTANDING_KEY_PREFIX}:{endpoint}", now, '+inf')
+        pipe.hgetall(f"{UNOSERVER_CIRCUIT_KEY_PREFIX}:{endpoint}")
+    results = pipe.execute()
+
+    status = []
+    for index, endpoint in enumerate(settings.unoserver_urls):
+        circuit = {key.decode('utf-8'): value.decode('utf-8') for key, value in results[index * 2 + 1].items()}
+        opened_until = circuit.get('opened_until')
+        if opened_until is None:
+            state = 'closed'
+        else:
+            state = 'open' if float(opened_until) > now else 'half_open'
+        status.append({
+            'url': endpoint,
+            'outstanding': results[index * 2],
+            'state': state,
+            'failures': int(circuit.get('failures', 0))
+        })
+    return status
+
+def _get_read_timeout(file_path: str, settings: UnoserverSettings) -> float:
+    """ファイルサイズに応じた応答待ちのタイムアウト"""
+    size_mb = os.path.getsize(file_path) / (1024 * 1024)
+    return min(settings.unoserver_base_timeout + size_mb * settings.unoserver_timeout_per_mb,
+               settings.unoserver_max_timeout)
+
+def _acquire_endpoint(settings: UnoserverSettings, lease: float) -> Tuple[str, str]:
+    """
+    切り離されていないインスタンスのうち、処理中リクエストが最も少ないものを選んで計上
+    処理中リクエストは期限付きで記録するため、異常終了したワーカーの分は期限後に除かれる
+    切り離し期限の経過後（半開状態）のインスタンスには、試行のトークンを確保できた1件だけを送る
+    """
+    redis_conn = get_redis_connection()
+    now = time.time()
+    pipe = redis_conn.pipeline(transaction=False)
+    for endpoint in settings.unoserver_urls:
+        outstanding_key = f"{UNOSERVER_OUTSTANDING_KEY_PREFIX}:{endpoint}"
+        pipe.zremrangebyscore(outstanding_key, '-inf', now)
+        pipe.zcard(outstanding_key)
+        pipe.hget(f"{UNOSERVER_CIRCUIT_KEY_PREFIX}:{endpoint}", 'opened_until')
+    results = pipe.execute()
+
+    candidates = []
+    for index, endpoint in enumerate(settings.unoserver_urls):
+        outstanding, opened_until = results[index * 3 + 1], results[index * 3 + 2]
+        if opened_until is not None and float(opened_until) > now:
+            continue  # 切り離し中
+        candidates.append((outstanding, random.random(), endpoint, opened_until is not None))
+
+    # 処理中リクエストが同数の場合はランダムに選び、特定のインスタンスに偏らないようにする
+    token = uuid.uuid4().hex
+    for _, _, endpoint, half_open in sorted(candidates):
+        if not half_open:
+            break
+        # 試行の結果（_record_success / _record_failure）が記録されるまで、他のリクエストは送らない
+        if redis_conn.set(f"{UNOSERVER_PROBE_KEY_PREFIX}:{endpoint}", token, nx=True, ex=int(lease) + 1):
+            break
+    else:
+        raise TransientError("All unoserver instances are unavailable", cause='conversion_server_unavailable')
+
+    outstanding_key = f"{UNOSERVER_OUTSTANDING_KEY_PREFIX}:{endpoint}"
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.zadd(outstanding_key, {token: now + lease})
+    pipe.expire(outstanding_key, int(lease) + 60)
+    pipe.execute()
+    return endpoint, token
+
+def _release_endpoint(endpoint: str, token: str) -> None:
+    try:
+        redis_conn = get_redis_connection()
+        redis_conn.zrem(f"{UNOSERVER_OUTSTANDING_KEY_PREFIX}:{endpoint}", token)
+        # 試行がインスタンスの異常以外（変換できないファイルなど）で終わった場合は、次のリクエストで試行する
+        release_probe = redis_conn.register_script(RELEASE_PROBE_SCRIPT)
+        release_probe(keys=[f"{UNOSERVER_PROBE_KEY_PREFIX}:{endpoint}"], args=[token])
+    except Exception as e:
+        # 期限切れで自然に除かれるため、変換結果には影響させない
+        logger.warning(f"Failed to release unoserver request on {endpoint}: {str(e)}")
+
+def _is_instance_failure(exc: requests.RequestException) -> bool:
+    """インスタンスの異常による失敗か（ファイル自体が変換できない4xxは含めない）"""
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code >= 500
+    return False
+
+def _record_failure(endpoint: str, settings: UnoserverSettings) -> None:
+    """
+    インスタンスの失敗を記録し、連続失敗数が閾値に達したら一定時間切り離す
+    切り離し期限の経過後（半開状態）に再び失敗した場合はすぐに切り離す
+    """
+    circuit_key = f"{UNOSERVER_CIRCUIT_KEY_PREFIX}:{endpoint}"
+    try:
+        redis_conn = get_redis_connection()
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.hincrby(circuit_key, 'failures', 1)
+        pipe.hget(circuit_key, 'opened_until')
+        failures, opened_until = pipe.execute()
+        if failures >= settings.unoserver_failure_threshold or opened_until is not None:
+            redis_conn.hset(circuit_key, mapping={
+                'opened_until': time.time() + settings.unoserver_recovery_timeout,
+                'failures': failures
+            })
+            logger.warning(
+                f"Unoserver {endpoint} failed {failures} times, "
+                f"stop sending requests for {settings.unoserver_recovery_timeout}s"
+            )
+        redis_conn.expire(circuit_key, settings.unoserver_recovery_timeout + 24 * 60 * 60)
+    except Exception as e:
+        logger.warning(f"Failed to record unoserver failure on {endpoint}: {str(e)}")
+
+def _record_success(endpoint: str) -> None:
+    """成功したインスタンスの失敗記録を消去（切り離しも解除）"""
+    try:
+        get_redis_connection().delete(f"{UNOSERVER_CIRCUIT_KEY_PREFIX}:{endpoint}")
+    except Exception as e:
+        logger.warning(f"Failed to record unoserver success on {endpoint}: {str(e)}")
@@ -0,0 +1,94 @@
+"""
+計測付きRQワーカークラス
+ジョブごとの処理時間とオーバーヘッドを記録し、常駐(warm)モードではプロセスを再利用する
+"""
+
+import os
+import resource
+import time
+from typing import Optional
+
+from rq import Worker, SimpleWorker
+from rq.exceptions import NoSuchJobError
+
+from ..logging_config import setup_logging
+from ..services.queue_service import get_redis_connection, record_job_timing
+
+logger = setup_logging()
+
+def get_rss_mb() -> float:
+    """現在のプロセスの常駐メモリサイズ(MB)を取得"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # /procが使えない環境ではピーク値で代用（Linuxの単位はKB）
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def warm_up() -> None:
+    """
+    ジョブ関数のモジュール・変換器・クライアントを事前に読み込む
+    常駐ワーカーでは1プロセスにつき1回だけ実行される
+    """
+    # ジョブ関数のモジュール（FileConverterのMarkItDown初期化を含む）
+    from ..services import svn_service, file_processor_service, file_upload_service  # noqa: F401
+    from ..services.elasticsearch_service import get_es_service
+
+    get_redis_connection().ping()
+    try:
+        get_es_service()
+    except Exception as e:
+        # Elasticsearchの起動待ちなどは初回ジョブで再接続する
+        logger.warning(f"Failed to warm up Elasticsearch client: {str(e)}")
+
+class TimedWorkerMixin:
+    """ジョブ実行全体の時間とジョブ関数の実行時間を計測して記録する"""
+    worker_mode = 'fork'
+
+    def execute_job(self, job, queue):
+        started = time.perf_counter()
+        super().execute_job(job, queue)
+        elapsed = time.perf_counter() - started
+
+        work_seconds = self._get_work_seconds(job)
+        if work_seconds is not None:
+            overhead_seconds = max(elapsed - work_seconds, 0.0)
+            record_job_timing(queue.name, self.worker_mode, work_seconds, overhead_seconds)
+            logger.debug(
+                f"Job {job.id} on {queue.name}: work {work_seconds * 1000:.1f}ms, "
+                f"overhead {overhead_seconds * 1000:.1f}ms"
+            )
+
+    def _get_work_seconds(self, job) -> Optional[float]:
+        if job.started_at is None or job.ended_at is None:
+            # forkモードでは子プロセスが記録した時刻を読み直す
+            try:
+                job.refresh()
+            except NoSuchJobError:
+                return None
+        if job.started_at is None or job.ended_at is None:
+            return None
+        return (job.ended_at - job.started_at).total_seconds()
+
+class TimedWorker(TimedWorkerMixin, Worker):
+    """ジョブごとに子プロセスをforkする標準ワーカー（計測付き）"""
+    worker_mode = 'fork'
+
+class WarmWorker(TimedWorkerMixin, SimpleWorker):
+    """
+    forkせずに同じプロセスでジョブを実行する常駐ワーカー
+    読み込み済みの変換器や接続プールを再利用し、
+    常駐メモリが上限を超えた場合はジョブ終了後に停止して再起動に任せる
+    """
+    worker_mode = 'warm'
+    max_rss_mb: Optional[int] = None
+
+    def execute_job(self, job, queue):
+        super().execute_job(job, queue)
+
+        if self.max_rss_mb:
+            rss_mb = get_rss_mb()
+            if rss_mb > self.max_rss_mb:
+                logger.info(f"Worker RSS {rss_mb:.0f}MB exceeds {self.max_rss_mb}MB, recycling process")
+                self._stop_requested = True
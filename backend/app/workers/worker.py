@@ -3,35 +3,151 @@
 RQワーカープロセス起動スクリプト
 """
 
+import multiprocessing
+import signal
 import sys
-from rq import Worker
+import time
+from pydantic_settings import BaseSettings
 
 from ..logging_config import setup_logging
 from ..services.queue_service import ALL_QUEUES, get_redis_connection
+from ..services.maintenance_service import MaintenanceSettings, run_job_maintenance, start_periodic_task
+from ..services.admission_service import AdmissionSettings, release_deferred_imports
+from ..services.sync_service import SyncSettings, sync_all_roots
+from .timed_worker import TimedWorker, WarmWorker, warm_up
 
 # ログ設定
 logger = setup_logging()
 
+class WorkerSettings(BaseSettings):
+    """ワーカー実行設定クラス"""
+    # 'fork': ジョブごとに子プロセスをfork（RQ標準）
+    # 'warm': 事前に初期化した常駐プロセスでジョブを実行（小さいファイルが多い場合に有効）
+    worker_mode: str = 'fork'
+    worker_processes: int = 1  # warmモードの常駐プロセス数
+    worker_max_jobs: int = 500  # warmモードでプロセスを再起動するまでのジョブ数（0で無制限）
+    worker_max_rss_mb: int = 1024  # warmモードでプロセスを再起動する常駐メモリの上限（MB、0で無制限）
+
 def start_worker():
     """RQワーカーを起動"""
+    settings = WorkerSettings()
     try:
+        if settings.worker_mode == 'warm':
+            run_warm_workers(settings)
+            return
+
         # Redis接続を取得
         redis_conn = get_redis_connection()
-        
+
         # ワーカーを作成して起動
-        worker = Worker(ALL_QUEUES, connection=redis_conn)
-        
+        worker = TimedWorker(ALL_QUEUES, connection=redis_conn)
+
+        # ジョブごとにforkするプロセスではスレッドを動かさず、定期タスクは専用のプロセスで実行する
+        start_periodic_process()
+
         logger.info(f"Starting RQ worker for queues: {ALL_QUEUES}")
         logger.info("Worker is ready to process jobs")
-        
+
         # ワーカーを起動（ブロッキング呼び出し）
-        worker.work()
-        
+        # 再試行の遅延実行のためスケジューラを有効にする
+        worker.work(with_scheduler=True)
+
     except KeyboardInterrupt:
         logger.info("Worker stopped by user")
     except Exception as e:
         logger.error(f"Worker failed to start: {str(e)}", exc_info=True)
         raise
 
+def start_periodic_process() -> multiprocessing.Process:
+    """
+    定期タスク専用のプロセスを起動
+    ジョブごとにforkするプロセスでスレッドを動かすと、スレッドが保持していたロック
+    （Redisの接続プール・ログハンドラなど）がfork先で解放されずにデッドロックする場合があるため、
+    ジョブを実行しない別プロセスで定期タスクのスレッドを動かす
+    """
+    # 親プロセスの状態（ロック・接続）を引き継がないよう、forkではなく新しいインタプリタで起動する
+    context = multiprocessing.get_context('spawn')
+    process = context.Process(target=_run_periodic_tasks, name="periodic-tasks", daemon=True)
+    process.start()
+    return process
+
+def _run_periodic_tasks():
+    """定期タスク専用プロセスの本体（親プロセスの終了時に停止される）"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    start_periodic_tasks()
+    while True:
+        time.sleep(60)
+
+def start_periodic_tasks():
+    """定期タスクを開始（複数ワーカー間ではRedisのロックにより1つだけが実行）"""
+    # 終了済みジョブの集計・削除
+    start_periodic_task('job_maintenance', MaintenanceSettings().compaction_interval, run_job_maintenance)
+    # 負荷が下がったら保留中のSVNインポートを投入
+    start_periodic_task('deferred_imports', AdmissionSettings().deferred_release_interval, release_deferred_imports)
+    # インポート済みのSVNフォルダを最新リビジョンまで差分同期
+    sync_interval = SyncSettings().svn_sync_interval
+    if sync_interval > 0:
+        start_periodic_task('svn_sync', sync_interval, sync_all_roots)
+
+def run_warm_workers(settings: WorkerSettings):
+    """
+    常駐ワーカープロセスを起動・監視
+    子プロセスが再起動条件（ジョブ数・メモリ）で終了した場合は新しいプロセスを起動する
+    """
+    # 変換器などのモジュールを先に読み込み、子プロセスとメモリを共有する
+    from ..services import svn_service, file_processor_service, file_upload_service  # noqa: F401
+
+    context = multiprocessing.get_context('fork')
+    processes = {}
+    periodic_process = None
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    logger.info(f"Starting {settings.worker_processes} warm workers for queues: {ALL_QUEUES}")
+    while not stopping:
+        if periodic_process is None or not periodic_process.is_alive():
+            if periodic_process is not None:
+                logger.info(f"Periodic task process exited with code {periodic_process.exitcode}, restarting")
+            periodic_process = start_periodic_process()
+        for slot in range(settings.worker_processes):
+            process = processes.get(slot)
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                process.join()
+                logger.info(f"Warm worker {slot} exited with code {process.exitcode}, restarting")
+            process = context.Process(target=_run_warm_worker, args=(settings,), name=f"warm-worker-{slot}")
+            process.start()
+            processes[slot] = process
+        time.sleep(1)
+
+    if periodic_process is not None and periodic_process.is_alive():
+        periodic_process.terminate()
+    # 子プロセスには実行中のジョブを終えてから停止させる
+    for process in processes.values():
+        if process.is_alive():
+            process.terminate()
+    for process in processes.values():
+        process.join()
+    logger.info("Warm workers stopped")
+
+def _run_warm_worker(settings: WorkerSettings):
+    """常駐ワーカーの子プロセス本体"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    warm_up()
+
+    worker = WarmWorker(ALL_QUEUES, connection=get_redis_connection())
+    worker.max_rss_mb = settings.worker_max_rss_mb or None
+    logger.info(f"Warm worker {worker.name} is ready to process jobs")
+    worker.work(with_scheduler=True, max_jobs=settings.worker_max_jobs or None)
+
 if __name__ == "__main__":
     start_worker()
@@ -0,0 +1,248 @@
+"""
+SVNのWebDAVクライアントのテスト
+mod_dav_svnの代わりにPROPFIND/OPTIONS/GETに応答するローカルのWebDAVサーバーを起動して確認する
+実行: backendディレクトリで python -m unittest discover -s tests
+"""
+
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+import requests
+
+from app.services.svn_dav_client import (
+    DavProtocolError,
+    ServerHostnameAdapter,
+    SvnDavClient,
+    SvnDavError,
+    get_http_session,
+)
+
+REPOSITORY_PATH = '/svn/repo'
+YOUNGEST_REVISION = 42
+
+# リポジトリ内のパス -> (最終変更リビジョン, ファイルの内容。フォルダはNone)
+REPOSITORY_TREE = {
+    '/trunk': (40, None),
+    '/trunk/a.txt': (12, b'hello'),
+    '/trunk/sub': (40, None),
+    '/trunk/sub/b c.txt': (40, 'あいう'.encode('utf-8')),
+}
+
+class StandInDavHandler(BaseHTTPRequestHandler):
+    """mod_dav_svnの応答を模したWebDAVハンドラ（PROPFIND Depth 0/1, OPTIONS, GET）"""
+
+    protocol_version = 'HTTP/1.1'
+    received_hosts = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _repository_path(self):
+        path = unquote(self.path)
+        if not path.startswith(REPOSITORY_PATH):
+            return None
+        return path[len(REPOSITORY_PATH):].rstrip('/')
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length)
+
+    def do_PROPFIND(self):
+        self.received_hosts.append(self.headers.get('Host'))
+        self._read_body()
+        path = self._repository_path()
+        if path not in REPOSITORY_TREE:
+            self._send(404)
+            return
+
+        paths = [path]
+        if self.headers.get('Depth') == '1' and REPOSITORY_TREE[path][1] is None:
+            paths += [
+                child for child in REPOSITORY_TREE
+                if child.rsplit('/', 1)[0] == path
+            ]
+        responses = ''.join(self._propfind_response(child) for child in paths)
+        body = (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<D:multistatus xmlns:D="DAV:" xmlns:S="http://subversion.tigris.org/xmlns/dav/">'
+            f'{responses}</D:multistatus>'
+        ).encode('utf-8')
+        self._send(207, body, {'Content-Type': 'text/xml; charset="utf-8"'})
+
+    def _propfind_response(self, path):
+        revision, content = REPOSITORY_TREE[path]
+        is_folder = content is None
+        href = quote(REPOSITORY_PATH + path) + ('/' if is_folder else '')
+        resource_type = '<D:collection/>' if is_folder else ''
+        size = '' if is_folder else f'<D:getcontentlength>{len(content)}</D:getcontentlength>'
+        return (
+            f'<D:response><D:href>{href}</D:href><D:propstat><D:prop>'
+            f'<D:resourcetype>{resource_type}</D:resourcetype>{size}'
+            f'<D:version-name>{revision}</D:version-name>'
+            f'<S:baseline-relative-path>{path.lstrip("/")}</S:baseline-relative-path>'
+            '</D:prop><D:status>HTTP/1.1 200 OK</D:status></D:propstat></D:response>'
+        )
+
+    def do_OPTIONS(self):
+        self._read_body()
+        self._send(200, headers={'SVN-Youngest-Rev': str(YOUNGEST_REVISION), 'DAV': '1,2'})
+
+    def do_GET(self):
+        path = self._repository_path()
+        entry = REPOSITORY_TREE.get(path)
+        if entry is None or entry[1] is None:
+            self._send(404)
+            return
+        self._send(200, entry[1], {'Content-Type': 'application/octet-stream'})
+
+    def do_REPORT(self):
+        # svnコマンドでのみ扱う操作（WebDAVバックエンドはsvnコマンドに切り替える）
+        self._send(501)
+
+def start_server(ssl_context=None):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInDavHandler)
+    if ssl_context is not None:
+        server.socket = ssl_context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class SvnDavClientTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}{REPOSITORY_PATH}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.session = requests.Session()
+        self.client = SvnDavClient(self.session, host='svn.example.com', timeout=5)
+        StandInDavHandler.received_hosts = []
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_get_file_info_of_folder(self):
+        info = self.client.get_file_info(f"{self.base_url}/trunk")
+        self.assertEqual(info, {
+            "is_folder": True,
+            "file_name": "trunk",
+            "revision": 40,
+            "head_revision": YOUNGEST_REVISION,
+            "relative_url": "^/trunk"
+        })
+        # IPアドレスで接続する場合も、元のホスト名をHostヘッダーで渡す
+        self.assertEqual(StandInDavHandler.received_hosts, ['svn.example.com'])
+
+    def test_get_file_info_of_file(self):
+        info = self.client.get_file_info(f"{self.base_url}/trunk/sub/b c.txt")
+        self.assertFalse(info["is_folder"])
+        self.assertEqual(info["file_name"], "b c.txt")
+        self.assertEqual(info["revision"], 40)
+        self.assertEqual(info["relative_url"], "^/trunk/sub/b%20c.txt")
+
+    def test_list_entries(self):
+        entries = self.client.list_entries(f"{self.base_url}/trunk")
+        self.assertEqual(sorted(entries, key=lambda entry: entry["name"]), [
+            {"kind": "file", "name": "a.txt", "size": 5, "revision": 12},
+            {"kind": "dir", "name": "sub", "size": None, "revision": 40},
+        ])
+
+    def test_iter_tree(self):
+        entries = list(self.client.iter_tree(f"{self.base_url}/trunk"))
+        self.assertEqual(
+            sorted((entry["kind"], entry["name"], entry["size"]) for entry in entries),
+            [("dir", "sub", None), ("file", "a.txt", 5), ("file", "sub/b c.txt", 9)]
+        )
+
+    def test_download(self):
+        content = b''.join(self.client.download(f"{self.base_url}/trunk/sub/b c.txt"))
+        self.assertEqual(content, 'あいう'.encode('utf-8'))
+
+    def test_missing_path_raises_http_status(self):
+        with self.assertRaises(SvnDavError) as context:
+            self.client.get_file_info(f"{self.base_url}/trunk/missing.txt")
+        self.assertEqual(context.exception.status, 404)
+
+    def test_unsupported_method_falls_back(self):
+        with self.assertRaises(DavProtocolError):
+            self.client._request('REPORT', f"{self.base_url}/trunk")
+
+    def test_connection_error(self):
+        client = SvnDavClient(self.session, timeout=1)
+        with self.assertRaises(SvnDavError) as context:
+            client.get_file_info(f"http://127.0.0.1:1{REPOSITORY_PATH}/trunk")
+        self.assertIsNone(context.exception.status)
+
+@unittest.skipUnless(shutil.which('openssl'), 'openssl is required to create a test certificate')
+class SvnDavClientHttpsTest(unittest.TestCase):
+    """HTTPSのリポジトリにIPアドレスで接続する場合、証明書は元のホスト名で検証する"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.cert_path = os.path.join(cls.temp_dir, 'cert.pem')
+        key_path = os.path.join(cls.temp_dir, 'key.pem')
+        subprocess.run(
+            [
+                'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                '-keyout', key_path, '-out', cls.cert_path,
+                '-subj', '/CN=svn.example.com', '-addext', 'subjectAltName=DNS:svn.example.com'
+            ],
+            check=True,
+            capture_output=True
+        )
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(cls.cert_path, key_path)
+        cls.server = start_server(ssl_context)
+        cls.ip_url = f"https://127.0.0.1:{cls.server.server_port}{REPOSITORY_PATH}/trunk"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def _client(self, adapter):
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.verify = self.cert_path
+        session.trust_env = False  # REQUESTS_CA_BUNDLEなどの環境変数でverifyを上書きさせない
+        self.addCleanup(session.close)
+        return SvnDavClient(session, host=f"svn.example.com:{self.server.server_port}", timeout=5)
+
+    def test_http_session_per_server_hostname(self):
+        session = get_http_session(2, 'svn.example.com')
+        self.assertIs(get_http_session(2, 'svn.example.com'), session)
+        self.assertIsInstance(session.get_adapter(self.ip_url), ServerHostnameAdapter)
+        self.assertNotIsInstance(get_http_session(2).get_adapter(self.ip_url), ServerHostnameAdapter)
+
+    def test_verifies_certificate_with_original_hostname(self):
+        client = self._client(ServerHostnameAdapter('svn.example.com'))
+        self.assertTrue(client.get_file_info(self.ip_url)["is_folder"])
+
+    def test_host_header_alone_fails_verification(self):
+        client = self._client(requests.adapters.HTTPAdapter())
+        with self.assertRaises(SvnDavError):
+            client.get_file_info(self.ip_url)
+
+if __name__ == '__main__':
+    unittest.main()
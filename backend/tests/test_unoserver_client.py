@@ -0,0 +1,267 @@
+"""
+変換サーバー(unoserver)クライアントのテスト
+unoserverの代わりにPOSTされたファイルを返すローカルのHTTPサーバーを起動して、
+振り分け・タイムアウト・サーキットブレーカー（切り離しと半開状態の試行）を確認する
+実行: backendディレクトリで python -m unittest discover -s tests
+（fakeredisがない場合はREDIS_HOSTのRedisを使う）
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import redis
+import requests
+
+from app.services import unoserver_client
+from app.services.failure_service import TransientError
+from app.services.unoserver_client import (
+    UNOSERVER_CIRCUIT_KEY_PREFIX,
+    convert_file,
+    get_unoserver_status,
+)
+
+CONVERTED = b'%PDF-1.4 converted'
+
+def create_redis_connection():
+    try:
+        import fakeredis
+        return fakeredis.FakeRedis()
+    except ImportError:
+        pass
+    connection = redis.Redis(
+        host=os.getenv('REDIS_HOST', 'redis'),
+        port=int(os.getenv('REDIS_PORT', 6379)),
+        db=int(os.getenv('REDIS_DB', 0))
+    )
+    try:
+        connection.ping()
+    except redis.RedisError:
+        return None
+    return connection
+
+class StandInUnoserverHandler(BaseHTTPRequestHandler):
+    """unoserverのREST APIを模したハンドラ（サーバーごとの mode で応答を切り替える）"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        server = self.server
+        with server.counter_lock:
+            server.requests += 1
+        if server.mode == 'hold':
+            server.holding.set()
+            server.release.wait(10)
+        elif server.mode == 'slow':
+            time.sleep(2)
+        if server.mode == 'error':
+            status, body = 500, b'conversion failed'
+        elif server.mode == 'reject':
+            status, body = 400, b'unsupported file'
+        else:
+            status, body = 200, CONVERTED
+        try:
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass  # タイムアウトでクライアントが切断した場合
+
+def start_server(mode='ok'):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInUnoserverHandler)
+    server.daemon_threads = True
+    server.mode = mode
+    server.requests = 0
+    server.counter_lock = threading.Lock()
+    server.holding = threading.Event()
+    server.release = threading.Event()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def server_url(server):
+    return f"http://127.0.0.1:{server.server_port}/request"
+
+class UnoserverClientTest(unittest.TestCase):
+    def setUp(self):
+        self.redis_conn = create_redis_connection()
+        if self.redis_conn is None:
+            self.skipTest('Redis is not available')
+        patcher = mock.patch.object(unoserver_client, 'get_redis_connection', return_value=self.redis_conn)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
+        self.source_path = os.path.join(self.temp_dir, 'source.docx')
+        with open(self.source_path, 'wb') as f:
+            f.write(b'document')
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.release.set()
+            server.shutdown()
+            server.server_close()
+        if self.redis_conn is not None:
+            keys = list(self.redis_conn.scan_iter('unoserver:*'))
+            if keys:
+                self.redis_conn.delete(*keys)
+
+    def _start(self, *modes, failure_threshold=2):
+        servers = [start_server(mode) for mode in modes]
+        self.servers.extend(servers)
+        env = {
+            'UNOSERVER_URLS': json.dumps([server_url(server) for server in servers]),
+            'UNOSERVER_BASE_TIMEOUT': '0.5',
+            'UNOSERVER_TIMEOUT_PER_MB': '0',
+            'UNOSERVER_CONNECT_TIMEOUT': '1',
+            'UNOSERVER_FAILURE_THRESHOLD': str(failure_threshold),
+            'UNOSERVER_RECOVERY_TIMEOUT': '30',
+        }
+        patcher = mock.patch.dict(os.environ, env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return servers
+
+    def _convert(self, name='output.pdf'):
+        return convert_file(self.source_path, 'pdf', os.path.join(self.temp_dir, name))
+
+    def _status(self, server):
+        return next(status for status in get_unoserver_status() if status['url'] == server_url(server))
+
+    def _end_recovery_timeout(self, server):
+        self.redis_conn.hset(f"{UNOSERVER_CIRCUIT_KEY_PREFIX}:{server_url(server)}", 'opened_until', time.time() - 1)
+
+    def test_convert_file(self):
+        self._start('ok')
+        output_path = self._convert()
+        with open(output_path, 'rb') as f:
+            self.assertEqual(f.read(), CONVERTED)
+        # 一時ファイルは残さない
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ['output.pdf', 'source.docx'])
+
+    def test_sends_to_least_outstanding_instance(self):
+        busy, idle = self._start('hold', 'ok')
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # 1件目が処理中の間は、もう一方のインスタンスに送る
+            with mock.patch.dict(os.environ, {'UNOSERVER_URLS': json.dumps([server_url(busy)])}):
+                future = executor.submit(self._convert, 'first.pdf')
+                self.assertTrue(busy.holding.wait(5))
+            self.assertEqual(self._status(busy)['outstanding'], 1)
+            for index in range(3):
+                self._convert(f"next-{index}.pdf")
+            busy.release.set()
+            future.result()
+
+        self.assertEqual((busy.requests, idle.requests), (1, 3))
+        self.assertEqual(self._status(busy)['outstanding'], 0)
+
+    def test_balances_idle_instances(self):
+        first, second = self._start('ok', 'ok')
+        for index in range(20):
+            self._convert(f"{index}.pdf")
+        self.assertEqual(first.requests + second.requests, 20)
+        self.assertGreater(first.requests, 0)
+        self.assertGreater(second.requests, 0)
+
+    def test_timeout_counts_as_instance_failure(self):
+        server, = self._start('slow')
+        started = time.monotonic()
+        with self.assertRaises(requests.Timeout):
+            self._convert()
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(self._status(server)['failures'], 1)
+        self.assertEqual(self._status(server)['outstanding'], 0)
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, 'output.pdf')))
+
+    def test_breaker_opens_after_consecutive_failures(self):
+        server, = self._start('error')
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                self._convert()
+        self.assertEqual(self._status(server)['state'], 'open')
+
+        # 切り離し中は送らずに再試行させる
+        with self.assertRaises(TransientError) as context:
+            self._convert()
+        self.assertEqual(context.exception.cause, 'conversion_server_unavailable')
+        self.assertEqual(server.requests, 2)
+
+    def test_open_instance_is_skipped(self):
+        broken, healthy = self._start('error', 'ok', failure_threshold=1)
+        with mock.patch.dict(os.environ, {'UNOSERVER_URLS': json.dumps([server_url(broken)])}):
+            with self.assertRaises(requests.HTTPError):
+                self._convert()
+        for index in range(3):
+            self._convert(f"{index}.pdf")
+        self.assertEqual((broken.requests, healthy.requests), (1, 3))
+
+    def test_half_open_sends_single_probe(self):
+        server, = self._start('error')
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                self._convert()
+        self._end_recovery_timeout(server)
+        self.assertEqual(self._status(server)['state'], 'half_open')
+
+        server.mode = 'hold'
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            probe = executor.submit(self._convert, 'probe.pdf')
+            self.assertTrue(server.holding.wait(5))
+            # 試行の結果が出るまでは他のリクエストを送らない
+            with self.assertRaises(TransientError):
+                self._convert()
+            server.release.set()
+            probe.result()
+
+        self.assertEqual(server.requests, 3)
+        self.assertEqual(self._status(server)['state'], 'closed')
+        self.assertEqual(self._status(server)['failures'], 0)
+        self._convert()
+        self.assertEqual(server.requests, 4)
+
+    def test_failed_probe_reopens_immediately(self):
+        server, = self._start('error')
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                self._convert()
+        self._end_recovery_timeout(server)
+
+        with self.assertRaises(requests.HTTPError):
+            self._convert()
+        self.assertEqual(self._status(server)['state'], 'open')
+        with self.assertRaises(TransientError):
+            self._convert()
+        self.assertEqual(server.requests, 3)
+
+    def test_probe_is_released_on_client_error(self):
+        server, = self._start('error')
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                self._convert()
+        self._end_recovery_timeout(server)
+
+        # 変換できないファイル(4xx)はインスタンスの異常ではないため、半開状態のまま次のリクエストで試行する
+        server.mode = 'reject'
+        with self.assertRaises(requests.HTTPError):
+            self._convert()
+        self.assertEqual(self._status(server)['state'], 'half_open')
+
+        server.mode = 'ok'
+        self._convert()
+        self.assertEqual(self._status(server)['state'], 'closed')
+
+if __name__ == '__main__':
+    unittest.main()
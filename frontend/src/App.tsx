@@ -33,8 +33,12 @@ const App: React.FC = () => {
       .validateFields()
       .then(async (values: { svnUrl: string; username?: string; password?: string; ipAddress?: string }) => {
         try {
-          await importSVNResource(values.svnUrl, values.username, values.password, values.ipAddress)
-          messageApi.success('SVNリソースのインポートを開始しました')
+          const result = await importSVNResource(values.svnUrl, values.username, values.password, values.ipAddress)
+          if (result.status === 'deferred') {
+            messageApi.info('キューが混雑しているため、インポートを保留しました。空き次第開始されます')
+          } else {
+            messageApi.success('SVNリソースのインポートを開始しました')
+          }
           setIsSVNModalOpen(false)
           form.resetFields()
         } catch (error) {
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { Table, Card, Statistic, Row, Col, Tag, Button, Space, Select, message } from 'antd';
 import { ReloadOutlined } from '@ant-design/icons';
-import type { RQJob, QueueStats } from '../types';
+import type { RQJob, QueueStats, QueuePressure } from '../types';
 import { getJobList, getQueueStats } from '../services/api';
 
 const { Option } = Select;
@@ -9,6 +9,7 @@ const { Option } = Select;
 const JobsPage: React.FC = () => {
   const [jobs, setJobs] = useState<RQJob[]>([]);
   const [stats, setStats] = useState<QueueStats>({});
+  const [pressure, setPressure] = useState<QueuePressure | null>(null);
   const [loading, setLoading] = useState(false);
   const [selectedQueue, setSelectedQueue] = useState<string>('');
   const [selectedStatus, setSelectedStatus] = useState<string>('');
@@ -31,7 +32,8 @@ const JobsPage: React.FC = () => {
         getQueueStats()
       ]);
       setJobs(jobsData);
-      setStats(statsData);
+      setStats(statsData.queues);
+      setPressure(statsData.pressure);
     } catch (error) {
       console.error('Error fetching job data:', error);
       message.error('ジョブデータの取得に失敗しました');
@@ -90,7 +92,7 @@ const JobsPage: React.FC = () => {
       width: 120,
       render: (first_arg: unknown) => (
         <span style={{ fontFamily: 'monospace', fontSize: '11px' }}>
-          {first_arg ? String(first_arg) : '-'}
+          {Array.isArray(first_arg) ? `${first_arg.length} files` : first_arg ? String(first_arg) : '-'}
         </span>
       )
     },
@@ -159,7 +161,21 @@ const JobsPage: React.FC = () => {
             />
           </Card>
         </Col>
-        <Col span={3}></Col>
+        <Col span={3}>
+          <Card>
+            <Statistic
+              title="取り込み負荷"
+              value={pressure?.overloaded ? '過負荷' : '正常'}
+              valueStyle={{ color: pressure?.overloaded ? '#cf1322' : '#3f8600' }}
+            />
+            {pressure && (
+              <div style={{ fontSize: 12, color: '#8c8c8c' }}>
+                待ち {pressure.queue_depth}/{pressure.max_queue_depth || '∞'}・
+                Redis {pressure.redis_memory_mb}MB・保留 {pressure.deferred_imports}
+              </div>
+            )}
+          </Card>
+        </Col>
         <Col span={4}>
           <Card>
             <Statistic
@@ -213,6 +229,7 @@ const JobsPage: React.FC = () => {
               <Option value="default">default</Option>
               <Option value="explore_folder">explore_folder</Option>
               <Option value="import_file">import_file</Option>
+              <Option value="import_batch">import_batch</Option>
               <Option value="convert_pdf">convert_pdf</Option>
               <Option value="upload_local">upload_local</Option>
             </Select>
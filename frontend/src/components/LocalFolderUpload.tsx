@@ -1,10 +1,21 @@
 import React, { useState, useRef } from 'react';
+import axios from 'axios';
 import { Button, Progress, message, Typography, Input, Form } from 'antd';
 import { UploadOutlined, FolderOpenOutlined } from '@ant-design/icons';
-import { uploadLocalFolder } from '../services/api';
+import { uploadLocalFolder, subscribeImportProgress } from '../services/api';
+import type { ImportProgress } from '../types';
 
 const { Text } = Typography;
 
+// サーバーが混雑している(429)場合の再送までの待ち時間（ミリ秒）。それ以外のエラーはnull
+const getRetryAfterMs = (error: unknown): number | null => {
+  if (axios.isAxiosError(error) && error.response?.status === 429) {
+    const retryAfter = Number(error.response.headers['retry-after']);
+    return (Number.isFinite(retryAfter) && retryAfter > 0 ? retryAfter : 30) * 1000;
+  }
+  return null;
+};
+
 interface UploadProgress {
   totalFiles: number;
   uploadedFiles: number;
@@ -25,6 +36,7 @@ const LocalFolderUpload: React.FC<LocalFolderUploadProps> = ({
   const [selectedFolderInfo, setSelectedFolderInfo] = useState<{name: string, fileCount: number} | null>(null);
   const [isUploading, setIsUploading] = useState(false);
   const [uploadProgress, setUploadProgress] = useState<UploadProgress | null>(null);
+  const [importProgress, setImportProgress] = useState<ImportProgress | null>(null);
   const isCancelledRef = useRef(false);
   const fileInputRef = useRef<HTMLInputElement>(null);
   const [form] = Form.useForm();
@@ -60,6 +72,7 @@ const LocalFolderUpload: React.FC<LocalFolderUploadProps> = ({
 
     setIsUploading(true);
     isCancelledRef.current = false; // キャンセルフラグをリセット
+    let unsubscribeProgress: (() => void) | null = null;
     setUploadProgress({
       totalFiles: files.length,
       uploadedFiles: 0,
@@ -93,6 +106,9 @@ const LocalFolderUpload: React.FC<LocalFolderUploadProps> = ({
       // 親ジョブIDを生成
       const parentJobId = `local_upload_${Date.now()}`;
       
+      // サーバー側の処理進捗を購読
+      unsubscribeProgress = subscribeImportProgress(parentJobId, setImportProgress);
+      
       // 10ファイルずつのバッチに分割してアップロード
       const BATCH_SIZE = 10;
       let uploadedCount = 0;
@@ -122,7 +138,25 @@ const LocalFolderUpload: React.FC<LocalFolderUploadProps> = ({
         });
 
         try {
-          await uploadLocalFolder(batchFiles, batchPaths, parentJobId);
+          // サーバーのキューが混雑している間は、指定された時間待って同じバッチを再送する
+          for (;;) {
+            try {
+              await uploadLocalFolder(batchFiles, batchPaths, parentJobId);
+              break;
+            } catch (uploadError) {
+              const retryAfterMs = getRetryAfterMs(uploadError);
+              if (retryAfterMs === null || isCancelledRef.current) {
+                throw uploadError;
+              }
+              setUploadProgress({
+                totalFiles: files.length,
+                uploadedFiles: uploadedCount,
+                currentFile: `サーバーが混雑しているため待機中 (バッチ ${batchIndex}/${totalBatches})`,
+                percentage: Math.round((uploadedCount / files.length) * 100)
+              });
+              await new Promise(resolve => setTimeout(resolve, retryAfterMs));
+            }
+          }
           uploadedCount += batchFiles.length;
           
           setUploadProgress({
@@ -159,8 +193,10 @@ const LocalFolderUpload: React.FC<LocalFolderUploadProps> = ({
       console.error('アップロードエラー:', error);
       message.error('アップロード中にエラーが発生しました');
     } finally {
+      unsubscribeProgress?.();
       setIsUploading(false);
       setUploadProgress(null);
+      setImportProgress(null);
       setAbsolutePath('');
       setSelectedFolderInfo(null);
       form.resetFields();
@@ -287,6 +323,11 @@ const LocalFolderUpload: React.FC<LocalFolderUploadProps> = ({
                   現在: {uploadProgress.currentFile}
                 </Text>
               )}
+              {importProgress && (
+                <Text type="secondary" style={{ display: 'block', fontSize: '12px' }}>
+                  処理済み: {importProgress.succeeded + importProgress.failed + importProgress.skipped} / {importProgress.total} (失敗: {importProgress.failed}, 本文なし: {importProgress.binary ?? 0})
+                </Text>
+              )}
             </>
           )}
           <Button 
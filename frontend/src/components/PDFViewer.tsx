@@ -2,7 +2,8 @@ import { useState, useEffect, useCallback } from 'react';
 import { useResizeObserver } from '@wojtekmaj/react-hooks';
 import { pdfjs, Document, Page } from 'react-pdf';
 import type { PDFDocumentProxy } from 'pdfjs-dist';
-import { getPDF, getDocument } from '../services/api';
+import { getPDFUrl, getPDFConversionStatus, getDocument } from '../services/api';
+import type { PDFConversionStatus } from '../types';
 import ErrorBoundary from './ErrorBoundary';
 import { Card, Button } from 'antd';
 import { EyeOutlined, DownloadOutlined } from '@ant-design/icons';
@@ -33,10 +34,10 @@ const PDFViewer = ({ documentId }: { documentId: string }) => {
   const [numPages, setNumPages] = useState<number>();
   const [containerRef, setContainerRef] = useState<HTMLElement | null>(null);
   const [containerWidth, setContainerWidth] = useState<number>();
-  const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
   const [metadata, setMetadata] = useState<DocumentMetadata | null>(null);
   const [metadataLoading, setMetadataLoading] = useState<boolean>(true);
+  const [conversion, setConversion] = useState<PDFConversionStatus | null>(null);
 
   const onResize = useCallback<ResizeObserverCallback>((entries) => {
     const [entry] = entries;
@@ -61,29 +62,38 @@ const PDFViewer = ({ documentId }: { documentId: string }) => {
       }
     };
 
-    const fetchPDF = async () => {
+    fetchMetadata();
+
+    // 遅延変換モードでは初回表示時に変換されるため、変換が終わるまで状態を確認してから表示する
+    let cancelled = false;
+    let timer: ReturnType<typeof setTimeout> | undefined;
+    const waitForPDF = async () => {
       try {
-        setLoading(true);
-        setError(null);
-        const pdfBlob = await getPDF(documentId);
-        const url = URL.createObjectURL(pdfBlob);
-        setPdfUrl(url);
+        const status = await getPDFConversionStatus(documentId);
+        if (cancelled) return;
+        setConversion(status);
+        if (status) {
+          timer = setTimeout(waitForPDF, status.retryAfter * 1000);
+          return;
+        }
+        // PDFは一括で取得せずURLを渡し、pdf.jsにRangeリクエストで表示に必要な部分から読み込ませる
+        // （ブラウザのキャッシュはETagで再検証される）
+        setPdfUrl(getPDFUrl(documentId));
       } catch (err) {
-        console.error('PDF読み込みエラー:', err);
-        setError('PDFの読み込みに失敗しました');
-      } finally {
-        setLoading(false);
+        if (cancelled) return;
+        console.error('PDF取得エラー:', err);
+        setConversion(null);
+        setError('PDFの取得に失敗しました');
       }
     };
 
-    fetchMetadata();
-    fetchPDF();
+    setError(null);
+    setPdfUrl(null);
+    waitForPDF();
 
-    // コンポーネントアンマウント時にBlob URLを解放
     return () => {
-      if (pdfUrl) {
-        URL.revokeObjectURL(pdfUrl);
-      }
+      cancelled = true;
+      clearTimeout(timer);
     };
   }, [documentId]);
 
@@ -134,17 +144,6 @@ const PDFViewer = ({ documentId }: { documentId: string }) => {
         </Card>
       )}
       
-      {loading && (
-        <div style={{ 
-          display: 'flex', 
-          justifyContent: 'center', 
-          alignItems: 'center', 
-          height: '100%' 
-        }}>
-          <div>PDFを読み込み中...</div>
-        </div>
-      )}
-      
       {error && (
         <div style={{ 
           display: 'flex', 
@@ -157,7 +156,15 @@ const PDFViewer = ({ documentId }: { documentId: string }) => {
         </div>
       )}
 
-      {pdfUrl && !loading && !error && (
+      {conversion && !error && (
+        <div style={{ display: 'flex', justifyContent: 'center', margin: '2em 0', color: '#666' }}>
+          {conversion.job_status === 'started'
+            ? 'PDFに変換しています...'
+            : `PDFへの変換を待っています...${conversion.queue_position ? `（待ち: ${conversion.queue_position}件）` : ''}`}
+        </div>
+      )}
+
+      {pdfUrl && !error && (
         <div style={{ 
           display: 'flex',
           flexDirection: 'column',
@@ -176,6 +183,7 @@ const PDFViewer = ({ documentId }: { documentId: string }) => {
           }} ref={setContainerRef}>
             <Document 
               file={pdfUrl} 
+              loading="PDFを読み込み中..."
               onLoadSuccess={onDocumentLoadSuccess}
               onLoadError={(error) => {
                 console.error('PDF表示エラー:', error);
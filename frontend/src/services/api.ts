@@ -1,4 +1,5 @@
 import axios from 'axios';
+import type { ImportProgress, PDFConversionStatus, QueuePressure, QueueStats } from '../types';
 
 const API_BASE_URL = 'http://localhost:8000';
 
@@ -27,16 +28,22 @@ export const getFileList = async () => {
   }
 };
 
-export const getPDF = async (filename: string) => {
-  try {
-    const response = await axios.get(`${API_BASE_URL}/pdf/${filename}`, {
-      responseType: 'blob'
-    });
-    return response.data;
-  } catch (error) {
-    console.error('Error getting PDF:', error);
-    throw error;
+// PDFビューアに渡すURL（Rangeリクエストで必要な部分から読み込む）
+export const getPDFUrl = (filename: string) => `${API_BASE_URL}/pdf/${filename}`;
+
+// PDFを表示できるか確認（先頭1バイトのみ取得）。遅延変換モードで変換中の場合は変換の状態を返す
+export const getPDFConversionStatus = async (filename: string): Promise<PDFConversionStatus | null> => {
+  const response = await axios.get(getPDFUrl(filename), {
+    headers: { Range: 'bytes=0-0' },
+    responseType: 'arraybuffer',
+    validateStatus: (status) => status === 200 || status === 202 || status === 206,
+  });
+  if (response.status !== 202) {
+    return null;
   }
+  const data = JSON.parse(new TextDecoder().decode(response.data));
+  const retryAfter = Number(response.headers['retry-after']);
+  return { ...data, retryAfter: Number.isFinite(retryAfter) && retryAfter > 0 ? retryAfter : 2 };
 };
 
 export const importSVNResource = async (repoUrl: string, username?: string, password?: string, ipAddress?: string) => {
@@ -104,16 +111,48 @@ export const getJobList = async (queueName?: string, status?: string) => {
   }
 };
 
-export const getQueueStats = async () => {
+export const getQueueStats = async (): Promise<{ queues: QueueStats; pressure: QueuePressure }> => {
   try {
     const response = await axios.get(`${API_BASE_URL}/jobs/queue/stats`);
-    return response.data;
+    // キューごとの件数と取り込み負荷(pressure)を分けて返す
+    const { pressure, ...queues } = response.data;
+    return { queues, pressure };
   } catch (error) {
     console.error('Error getting queue stats:', error);
     throw error;
   }
 };
 
+export const subscribeImportProgress = (
+  parentJobId: string,
+  onProgress: (progress: ImportProgress) => void
+) => {
+  // スナップショットを受け取った後は差分を積み上げて進捗を更新する
+  const eventSource = new EventSource(`${API_BASE_URL}/jobs/${parentJobId}/events`);
+  let progress: ImportProgress | null = null;
+
+  eventSource.addEventListener('snapshot', (event) => {
+    progress = JSON.parse((event as MessageEvent).data);
+    onProgress({ ...progress! });
+  });
+
+  eventSource.addEventListener('progress', (event) => {
+    if (!progress) return;
+    const delta: Partial<ImportProgress> = JSON.parse((event as MessageEvent).data);
+    for (const [field, value] of Object.entries(delta)) {
+      progress[field as keyof ImportProgress] += value ?? 0;
+    }
+    onProgress({ ...progress });
+  });
+
+  eventSource.onerror = (error) => {
+    console.error('Error receiving import progress:', error);
+  };
+
+  // 購読解除用の関数を返す
+  return () => eventSource.close();
+};
+
 export const uploadLocalFolder = async (files: File[], absolutePaths: string[], parentJobId: string) => {
   try {
     const formData = new FormData();
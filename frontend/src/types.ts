@@ -43,6 +43,34 @@ export interface QueueStats {
   };
 }
 
+export interface QueuePressure {
+  queue_depth: number;
+  max_queue_depth: number;
+  redis_memory_mb: number;
+  max_redis_memory_mb: number;
+  deferred_imports: number;
+  overloaded: boolean;
+  retry_after: number;
+}
+
+// 遅延変換モードでPDFが変換中の場合の状態（/pdf/{id} の202応答）
+export interface PDFConversionStatus {
+  status: 'converting';
+  job_status: string | null;
+  queue_position: number | null;
+  retryAfter: number;
+}
+
+export interface ImportProgress {
+  total: number;
+  queued: number;
+  succeeded: number;
+  failed: number;
+  skipped: number;
+  exploring: number;
+  binary: number;
+}
+
 export interface FileItem {
   id: string;
   url: string;